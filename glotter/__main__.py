@@ -4,9 +4,12 @@ import sys
 from glotter.batch import batch
 from glotter.check import check
 from glotter.download import download
+from glotter.gc import gc
+from glotter.lock import lock
 from glotter.report import report
 from glotter.run import run
 from glotter.test import test
+from glotter.utils import parse_size
 
 
 def main():
@@ -21,13 +24,15 @@ Commands:
   report      Output a report of discovered sources for configured projects and languages
   batch       Download docker images, run tests, and optionally remove images for each batch
   check       Check for invalid sample program filenames
+  lock        Pin the docker images required to run the tests to their digests in glotter.lock
+  gc          Remove the containers and temporary files left behind by glotter processes that crashed
 """,
     )
     parser.add_argument(
         "command",
         type=str,
         help="Subcommand to run",
-        choices=["run", "test", "download", "report", "batch", "check"],
+        choices=["run", "test", "download", "report", "batch", "check", "lock", "gc"],
     )
     args = parser.parse_args(sys.argv[1:2])
     commands = {
@@ -37,6 +42,8 @@ Commands:
         "report": parse_report,
         "batch": parse_batch,
         "check": parse_check,
+        "lock": parse_lock,
+        "gc": parse_gc,
     }
     commands[args.command]()
 
@@ -48,6 +55,21 @@ def parse_download():
         "project, or a single source. Only one option may be specified.",
     )
     _add_parallel_arg(parser, "Download images in parallel")
+    _add_changed_since_arg(parser)
+    _add_disk_budget_arg(parser)
+    _add_download_args(parser)
+    parser.add_argument(
+        "--to-cache",
+        action="store_true",
+        help="save the images to the image cache after downloading them",
+    )
+    parser.add_argument(
+        "--history",
+        metavar="PATH",
+        type=str,
+        help="read and record the size of each downloaded image in the history file PATH. "
+        "Default is history.json in the glotter cache",
+    )
     args = _parse_args_for_verb(parser)
     download(args)
 
@@ -69,6 +91,20 @@ def parse_test():
         "or a single source. Only one option may be specified.",
     )
     _add_parallel_arg(parser, "Run tests in parallel")
+    _add_changed_since_arg(parser)
+    _add_test_option_args(parser)
+    parser.add_argument(
+        "--junit-xml",
+        metavar="PATH",
+        type=str,
+        help="write test results as JUnit XML to PATH",
+    )
+    parser.add_argument(
+        "--json-report",
+        metavar="PATH",
+        type=str,
+        help="write test results as JSON to PATH (native engine only)",
+    )
     args = _parse_args_for_verb(parser)
     test(args)
 
@@ -77,6 +113,85 @@ def _add_parallel_arg(parser, help_msg):
     parser.add_argument("--parallel", action="store_true", help=help_msg)
 
 
+def _add_changed_since_arg(parser):
+    parser.add_argument(
+        "--changed-since",
+        metavar="REV",
+        type=str,
+        help="only use sources affected by changes since the git revision REV",
+    )
+
+
+def _add_test_option_args(parser):
+    parser.add_argument(
+        "--pool-size",
+        metavar="POOL_SIZE",
+        type=int,
+        default=0,
+        help="reuse containers for sources with the same image, keeping up to POOL_SIZE idle "
+        "containers for each image. Default is 0 (do not reuse containers)",
+    )
+    parser.add_argument(
+        "--shared-containers",
+        action="store_true",
+        help="run the sources that use the same image in a single container that is kept until "
+        "the tests are finished. Takes precedence over --pool-size",
+    )
+    parser.add_argument(
+        "--build-cache",
+        action="store_true",
+        help="restore build outputs from a persistent cache instead of rebuilding unchanged sources",
+    )
+    parser.add_argument(
+        "--batch-build",
+        action="store_true",
+        help="build the sources of each language together in a single container before testing "
+        "them, and restore the build outputs for the tests. Implies --build-cache",
+    )
+    parser.add_argument(
+        "--single-exec",
+        action="store_true",
+        help="run all inputs of a parametrized project for a source in a single exec",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skip generated tests that passed before for the same source, container info, "
+        "image, and test definition",
+    )
+    _add_disk_budget_arg(parser)
+    parser.add_argument(
+        "--exec-timeout",
+        metavar="SECONDS",
+        type=float,
+        help="maximum number of seconds that a command may run in a container unless the test, "
+        "project, or testinfo file specifies a timeout. Build commands may run for at least 1800 "
+        "seconds. 0 means no timeout. Default is 300",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["pytest", "native"],
+        default="pytest",
+        help="test engine to use. The native engine runs the tests directly without pytest. "
+        "Default is pytest",
+    )
+    parser.add_argument(
+        "--concurrency",
+        metavar="CONCURRENCY",
+        type=int,
+        help="maximum number of sources to test at the same time with the native engine. "
+        "Default is the number of CPUs if --parallel is specified, 1 otherwise",
+    )
+    parser.add_argument(
+        "--history",
+        metavar="PATH",
+        type=str,
+        help="record the test duration of each language in the history file PATH. For batch, "
+        "the history is also used to split the languages into batches, and the default is "
+        "history.json in the glotter cache",
+    )
+
+
 def _parse_args_for_verb(parser):
     parser.add_argument(
         "-s",
@@ -119,6 +234,46 @@ def parse_report():
     report(args)
 
 
+def _add_disk_budget_arg(parser):
+    parser.add_argument(
+        "--disk-budget",
+        metavar="SIZE",
+        type=parse_size,
+        help="keep the total size of the images used by all glotter processes on this host "
+        "within SIZE (e.g., 20G) by removing the least recently used images that are no longer "
+        "needed",
+    )
+
+
+def _add_download_args(parser):
+    parser.add_argument(
+        "--pull-concurrency",
+        metavar="N",
+        type=int,
+        help="with --parallel, download up to N images at the same time. Default is 4",
+    )
+    parser.add_argument(
+        "--registry-concurrency",
+        metavar="N",
+        type=int,
+        help="download up to N images from the same registry at the same time. Default is no "
+        "limit other than --pull-concurrency",
+    )
+    parser.add_argument(
+        "--pull-rate",
+        metavar="N",
+        type=float,
+        help="start at most N image downloads per minute. Default is no limit",
+    )
+    parser.add_argument(
+        "--pull-retries",
+        metavar="N",
+        type=int,
+        help="retry an image download that fails with a transient error up to N times. "
+        "Default is 5",
+    )
+
+
 def parse_batch():
     parser = argparse.ArgumentParser(
         prog="glotter",
@@ -138,6 +293,27 @@ def parse_batch():
         action="store_true",
         help="remove docker images are each batch is finished",
     )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="download images for the following batches while testing each batch, and remove "
+        "images in the background",
+    )
+    parser.add_argument(
+        "--prefetch-limit",
+        metavar="SIZE",
+        type=parse_size,
+        help="with --pipeline, keep prefetching following batches while the estimated size of "
+        "their images is at most SIZE (e.g., 20G). Default is to prefetch only the next batch",
+    )
+    parser.add_argument(
+        "--manifest",
+        metavar="PATH",
+        type=str,
+        help="write the languages of each batch as JSON to PATH instead of running the batches",
+    )
+    _add_download_args(parser)
+    _add_test_option_args(parser)
     args = parser.parse_args(sys.argv[2:])
     batch(args)
 
@@ -151,5 +327,38 @@ def parse_check():
     check(args)
 
 
+def parse_lock():
+    parser = argparse.ArgumentParser(
+        prog="glotter",
+        description="Pin the docker images required to run the tests to their digests in "
+        "glotter.lock. Locked images are pulled by digest.",
+    )
+    _add_parallel_arg(parser, "Resolve image digests in parallel")
+    _add_download_args(parser)
+    args = parser.parse_args(sys.argv[2:])
+    lock(args)
+
+
+def parse_gc():
+    parser = argparse.ArgumentParser(
+        prog="glotter",
+        description="Remove the containers and temporary files left behind by glotter processes "
+        "that are no longer running.",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="also remove the containers and temporary files of glotter processes that are "
+        "still running or that ran on other hosts",
+    )
+    parser.add_argument(
+        "--volumes",
+        action="store_true",
+        help="also remove the docker volumes that back the cache directories of the languages",
+    )
+    args = parser.parse_args(sys.argv[2:])
+    gc(args)
+
+
 if __name__ == "__main__":
     main()
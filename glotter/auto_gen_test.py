@@ -21,6 +21,8 @@ from glotter.utils import indent, quote
 
 TransformationScalarFuncT = Callable[[str, str], Tuple[str, str]]
 TransformationDictFuncT = Callable[[List[str], str, str], Tuple[str, str]]
+TransformationScalarValueFuncT = Callable[[Any, Any], Tuple[Any, Any]]
+TransformationDictValueFuncT = Callable[[List[str], Any, Any], Tuple[Any, Any]]
 
 
 class AutoGenParam(BaseModel):
@@ -128,6 +130,32 @@ def _unique_sort(actual_var, expected_var):
     return f"sorted(set({actual_var}))", f"sorted(set({expected_var}))"
 
 
+def _call_method_on_actual(method: str, actual: Any, expected: Any) -> Tuple[Any, Any]:
+    return getattr(actual, method)(), expected
+
+
+def _call_method_on_expected(method: str, actual: Any, expected: Any) -> Tuple[Any, Any]:
+    return actual, getattr(expected, method)()
+
+
+def _remove_chars_from_actual(values: List[str], actual: Any, expected: Any) -> Tuple[Any, Any]:
+    for value in values:
+        actual = actual.replace(value, "")
+
+    return actual, expected
+
+
+def _strip_chars_from_actual(values: List[str], actual: Any, expected: Any) -> Tuple[Any, Any]:
+    for value in values:
+        actual = actual.strip(value)
+
+    return actual, expected
+
+
+def _unique_sort_values(actual: Any, expected: Any) -> Tuple[Any, Any]:
+    return sorted(set(actual)), sorted(set(expected))
+
+
 class AutoGenTest(BaseModel):
     """Object used to auto-generated a test"""
 
@@ -144,6 +172,7 @@ class AutoGenTest(BaseModel):
     strings: Dict[str, str] = {}
     transformations: List[Any] = []
     repeat: int = 1
+    timeout: Optional[Annotated[float, Field(gt=0)]] = None
 
     SCALAR_TRANSFORMATION_FUNCS: ClassVar[Dict[str, TransformationScalarFuncT]] = {
         "strip": partial(_append_method_to_actual, "strip"),
@@ -157,6 +186,18 @@ class AutoGenTest(BaseModel):
         "remove": _remove_chars,
         "strip": _strip_chars,
     }
+    SCALAR_TRANSFORMATION_VALUE_FUNCS: ClassVar[Dict[str, TransformationScalarValueFuncT]] = {
+        "strip": partial(_call_method_on_actual, "strip"),
+        "splitlines": partial(_call_method_on_actual, "splitlines"),
+        "lower": partial(_call_method_on_actual, "lower"),
+        "any_order": _unique_sort_values,
+        "strip_expected": partial(_call_method_on_expected, "strip"),
+        "splitlines_expected": partial(_call_method_on_expected, "splitlines"),
+    }
+    DICT_TRANSFORMATION_VALUE_FUNCS: ClassVar[Dict[str, TransformationDictValueFuncT]] = {
+        "remove": _remove_chars_from_actual,
+        "strip": _strip_chars_from_actual,
+    }
 
     @field_validator("inputs", mode="before")
     @classmethod
@@ -339,6 +380,49 @@ class AutoGenTest(BaseModel):
 
         return actual_var, expected_var
 
+    def transform_values(self, actual: Any, expected: Any) -> Tuple[Any, Any]:
+        """
+        Transform actual and expected values using the specified transformations. This is
+        equivalent to the code generated by :meth:`transform_vars`
+
+        :param actual: Actual value
+        :param expected: Expected value
+        :return: Transformed actual and expected values
+        """
+
+        for transfomation in self.transformations:
+            if isinstance(transfomation, str):
+                actual, expected = self.SCALAR_TRANSFORMATION_VALUE_FUNCS[transfomation](
+                    actual, expected
+                )
+            else:
+                key, item = tuple(*transfomation.items())
+                actual, expected = self.DICT_TRANSFORMATION_VALUE_FUNCS[key](item, actual, expected)
+
+        return actual, expected
+
+    def get_pytest_ids(self) -> List[Tuple[str, AutoGenParam]]:
+        """
+        Get the pytest parameter IDs of this test and the parameter for each ID in the order
+        that pytest generates them. The ID does not include the source
+
+        :return: pytest parameter IDs and parameters. The ID is empty if this test is not
+            parametrized
+        """
+
+        repeat_ids = [f"repeat{repeat}" for repeat in range(1, self.repeat + 1)]
+        if self.repeat <= 1:
+            repeat_ids = [""]
+
+        if not self.requires_parameters:
+            return [(repeat_id, self.params[0]) for repeat_id in repeat_ids]
+
+        return [
+            ("-".join(filter(None, [repeat_id, param.name])), param)
+            for repeat_id in repeat_ids
+            for param in self.params
+        ]
+
     def get_constant_variables(self) -> str:
         """
         Get contant variables
@@ -355,6 +439,18 @@ class AutoGenTest(BaseModel):
 
         return "".join(f"{name} = {quote(value)}\n" for name, value in constant_variables.items())
 
+    def get_run_params(self) -> List[Optional[str]]:
+        """
+        Get the inputs passed to the source when this test is run, including repeats
+
+        :return: inputs passed to the source if project requires parameters, empty list otherwise
+        """
+
+        if not self.requires_parameters:
+            return []
+
+        return [param.input for param in self.params for _ in range(self.repeat)]
+
     def get_pytest_params(self) -> str:
         """
         Get pytest parameters
@@ -392,17 +488,20 @@ class AutoGenTest(BaseModel):
         """
 
         func_params = ""
-        run_param = ""
+        run_params = []
         if self.repeat > 1:
             func_params += "repeat, "
 
         if self.requires_parameters:
             func_params += "in_params, expected, "
-            run_param += "params=in_params"
+            run_params.append("params=in_params")
+
+        if self.timeout is not None:
+            run_params.append(f"timeout={self.timeout!r}")
 
         return f"""\
 def test_{self.name}({func_params}{project_name_underscores}):
-    actual = {project_name_underscores}.run({run_param})
+    actual = {project_name_underscores}.run({", ".join(run_params)})
 """
 
     def get_expected_output(self, project_name_underscores: str) -> str:
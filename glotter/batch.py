@@ -1,12 +1,35 @@
 import argparse
+import json
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-from glotter.download import download, remove_images
+from glotter.containerfactory import get_container_factory
+from glotter.download import download_images, get_download_error_message, remove_images
+from glotter.history import History, get_default_history_path
 from glotter.settings import get_settings
 from glotter.source import get_sources
 from glotter.test import test
 from glotter.utils import error_and_exit
 
+TEST_OPTIONS = (
+    "pool_size",
+    "shared_containers",
+    "build_cache",
+    "batch_build",
+    "single_exec",
+    "incremental",
+    "disk_budget",
+    "exec_timeout",
+    "engine",
+    "concurrency",
+)
+
+# Estimated image download speed used to turn image sizes into durations
+PULL_BYTES_PER_SECOND = 50 * 1024 * 1024
+
+# Estimated test duration of a source if there is no history
+DEFAULT_SOURCE_DURATION = 1.0
+
 
 def batch(args):
     # Validate arguments
@@ -18,12 +41,23 @@ def batch(args):
 
     # Get all of the languages
     all_sources = get_sources(get_settings().source_root)
-    languages = sorted(
-        {source.language.lower() for sources in all_sources.values() for source in sources}
-    )
-    num_languages = len(languages)
+    sources_by_language = {}
+    for sources in all_sources.values():
+        for source in sources:
+            sources_by_language.setdefault(source.language.lower(), []).append(source)
+
+    num_languages = len(sources_by_language)
     num_batches = min(num_languages, args.num_batches)
 
+    # Split languages into batches. The manifest and the runners that test a batch use the same
+    # default history file so that they get the same batches
+    history = History(args.history or get_default_history_path())
+    batches = get_batches(sources_by_language, history, num_batches)
+    num_batches = len(batches)
+    if args.manifest:
+        _write_manifest(args.manifest, batches)
+        sys.exit(0)
+
     # Determine starting and ending batch
     if args.batch is None:
         first_batch = 0
@@ -34,38 +68,353 @@ def batch(args):
     else:
         sys.exit(0)
 
-    # For each batch
-    exit_code = 0
-    for n in range(first_batch, last_batch):
-        # Get languages for this batch
-        batch_args = argparse.Namespace(
-            source=None,
-            project=None,
-            language=set(
-                languages[
-                    (n * num_languages // num_batches) : ((n + 1) * num_languages // num_batches)
-                ]
-            ),
-            parallel=args.parallel,
+    # Keep the images of the batches that have not been tested within the disk budget
+    batch_numbers = list(range(first_batch, last_batch))
+    factory = get_container_factory()
+    factory.disk_budget = args.disk_budget or 0
+    for n in batch_numbers:
+        factory.add_pending_images(
+            _get_container_infos(batches[n][0], sources_by_language).values()
         )
 
+    if args.pipeline:
+        exit_code = _run_batches_pipelined(
+            args, batch_numbers, batches, history, sources_by_language
+        )
+    else:
+        exit_code = _run_batches(args, batch_numbers, batches, history, sources_by_language)
+
+    sys.exit(exit_code)
+
+
+def _run_batches(args, batch_numbers, batches, history, sources_by_language):
+    num_batches = len(batches)
+    last_batches = _get_last_batches(batch_numbers, batches, sources_by_language)
+    exit_code = 0
+    for n in batch_numbers:
+        languages = batches[n][0]
+        batch_args = _get_batch_args(args, languages, history)
+
         # Download images for this batch
         _display_batch("Downloading images", n, num_batches)
-        containers = download(batch_args)
+        containers, errors = download_images(batch_args, history)
+        exit_code = exit_code or _report_download_errors(errors)
+        _record_image_sizes(history, languages, sources_by_language)
 
         # Run tests for this batch
-        try:
-            _display_batch("Testing", n, num_batches)
-            test(batch_args)
-        except SystemExit as e:
-            exit_code = exit_code or int(e.code)
+        code = _test_batch(batch_args, n, num_batches, sources_by_language)
+        exit_code = exit_code or code
 
-        # If removing images, remove images for this batch
+        # If removing images, remove images for this batch that later batches do not need
         if args.remove:
             _display_batch("Removing images", n, num_batches)
-            remove_images(containers, args.parallel)
+            remove_images(_get_unneeded_containers(containers, n, last_batches), args.parallel)
 
-    sys.exit(exit_code)
+    return exit_code
+
+
+def _run_batches_pipelined(args, batch_numbers, batches, history, sources_by_language):
+    """
+    Run batches so that images for the following batches are downloaded while the current
+    batch is tested, and images that later batches do not need are removed in the background
+    after each batch is tested. The following batches are prefetched as long as the estimated
+    size of the images of all the prefetched batches is within the prefetch limit. If there is
+    no prefetch limit, only the next batch is prefetched
+    """
+
+    num_batches = len(batches)
+    last_batches = _get_last_batches(batch_numbers, batches, sources_by_language)
+    batch_args = {n: _get_batch_args(args, batches[n][0], history) for n in batch_numbers}
+    downloads = {}
+    removals = []
+    exit_code = 0
+    with (
+        ThreadPoolExecutor(max_workers=1) as download_executor,
+        ThreadPoolExecutor(max_workers=1) as remove_executor,
+    ):
+
+        def start_download(n):
+            _display_batch("Downloading images", n, num_batches)
+            downloads[n] = download_executor.submit(download_images, batch_args[n], history)
+
+        for index, n in enumerate(batch_numbers):
+            if n not in downloads:
+                start_download(n)
+
+            # Prefetch the following batches
+            prefetched_size = 0
+            for next_n in batch_numbers[index + 1 :]:
+                next_size = _get_estimated_image_size(history, batches[next_n][0])
+                if next_n not in downloads:
+                    if prefetched_size and (
+                        args.prefetch_limit is None
+                        or next_size is None
+                        or prefetched_size + next_size > args.prefetch_limit
+                    ):
+                        break
+
+                    start_download(next_n)
+
+                prefetched_size += next_size or 1
+
+            containers, errors = downloads[n].result()
+            exit_code = exit_code or _report_download_errors(errors)
+            _record_image_sizes(history, batches[n][0], sources_by_language)
+            code = _test_batch(batch_args[n], n, num_batches, sources_by_language)
+            exit_code = exit_code or code
+
+            if args.remove:
+                containers = _get_unneeded_containers(containers, n, last_batches)
+                _display_batch("Removing images in the background", n, num_batches)
+                removals.append(remove_executor.submit(remove_images, containers, args.parallel))
+
+        for removal in removals:
+            removal.result()
+
+    return exit_code
+
+
+def _get_batch_args(args, languages, history):
+    return argparse.Namespace(
+        source=None,
+        project=None,
+        language=set(languages),
+        parallel=args.parallel,
+        changed_since=None,
+        to_cache=False,
+        pull_concurrency=args.pull_concurrency,
+        registry_concurrency=args.registry_concurrency,
+        pull_rate=args.pull_rate,
+        pull_retries=args.pull_retries,
+        junit_xml=None,
+        json_report=None,
+        history=history.path,
+        **{option: getattr(args, option) for option in TEST_OPTIONS},
+    )
+
+
+def _report_download_errors(errors):
+    # The batch is still tested so that the sources whose images were downloaded are tested
+    if not errors:
+        return 0
+
+    print(get_download_error_message(errors), flush=True)
+    return 1
+
+
+def _test_batch(batch_args, n, num_batches, sources_by_language):
+    try:
+        _display_batch("Testing", n, num_batches)
+        test(batch_args)
+    except SystemExit as e:
+        return int(e.code)
+    finally:
+        # Remove the containers of this batch so that its images can be removed
+        container_factory = get_container_factory()
+        container_factory.close()
+        container_factory.release_pending_images(
+            _get_container_infos(batch_args.language, sources_by_language).values()
+        )
+
+    return 0
+
+
+def get_batches(sources_by_language, history, num_batches):
+    """
+    Split languages into batches. Languages that share images are kept in the same batch unless
+    that would make the batch too large, so that each image is only downloaded once. If there
+    is history for any of the languages, the languages are split so that the estimated duration
+    of each batch is about the same using the longest processing time first heuristic.
+    Otherwise, the sorted languages are split into batches with about the same number of
+    languages. Batches that end up empty are dropped
+
+    :param sources_by_language: a dict where the key is the language in lowercase and the value
+        is a list of all the Source objects of that language
+    :param history: History of test durations and image sizes
+    :param num_batches: number of batches
+    :return: list of the sorted languages and the estimated duration in seconds of each batch
+    """
+
+    languages = sorted(sources_by_language)
+    num_languages = len(languages)
+    if not num_languages or num_batches < 1:
+        return []
+
+    costs = get_language_costs(sources_by_language, history)
+    groups = get_language_groups(sources_by_language, costs, num_batches)
+    if not any(
+        history.get_duration(language) is not None or history.get_image_size(language) is not None
+        for language in languages
+    ):
+        language_batches = [[] for _ in range(num_batches)]
+        index = 0
+        for group in groups:
+            n = max(n for n in range(num_batches) if n * num_languages // num_batches <= index)
+            language_batches[n] += group
+            index += len(group)
+    else:
+        language_batches = [[] for _ in range(num_batches)]
+        batch_costs = [0.0] * num_batches
+        for group in sorted(groups, key=lambda group: (-_get_cost(group, costs), group)):
+            n = min(range(num_batches), key=lambda n: batch_costs[n])
+            language_batches[n] += group
+            batch_costs[n] += _get_cost(group, costs)
+
+    return [
+        (sorted(batch_languages), _get_cost(batch_languages, costs))
+        for batch_languages in language_batches
+        if batch_languages
+    ]
+
+
+def get_language_groups(sources_by_language, costs, num_batches):
+    """
+    Group languages that share images. A group whose estimated duration is more than the
+    average duration of a batch is split into individual languages
+
+    :param sources_by_language: a dict where the key is the language in lowercase and the value
+        is a list of all the Source objects of that language
+    :param costs: a dict where the key is the language and the value is the estimated duration
+        in seconds
+    :param num_batches: number of batches
+    :return: list of the sorted languages of each group, sorted by the first language
+    """
+
+    groups = []
+    for language in sorted(sources_by_language):
+        keys = _get_image_keys([language], sources_by_language)
+        sharing = [group for group in groups if group[1] & keys]
+        groups = [group for group in groups if group not in sharing]
+        groups.append(
+            (
+                sorted([language] + [lang for group in sharing for lang in group[0]]),
+                keys.union(*(group[1] for group in sharing)),
+            )
+        )
+
+    batch_cost = sum(costs.values()) / num_batches
+    language_groups = []
+    for group_languages, _ in groups:
+        if len(group_languages) > 1 and _get_cost(group_languages, costs) > batch_cost:
+            language_groups += [[language] for language in group_languages]
+        else:
+            language_groups.append(group_languages)
+
+    return sorted(language_groups)
+
+
+def _get_cost(languages, costs):
+    return sum(costs[language] for language in languages)
+
+
+def get_language_costs(sources_by_language, history):
+    """
+    Estimate the duration of downloading images for and testing each language. If there is no
+    recorded test duration for a language, the average recorded duration per source is used
+    for each of its sources
+
+    :param sources_by_language: a dict where the key is the language in lowercase and the value
+        is a list of all the Source objects of that language
+    :param history: History of test durations and image sizes
+    :return: a dict where the key is the language and the value is the estimated duration in
+        seconds
+    """
+
+    recorded = {
+        language: history.get_duration(language)
+        for language in sources_by_language
+        if history.get_duration(language) is not None
+    }
+    num_recorded_sources = sum(len(sources_by_language[language]) for language in recorded)
+    source_duration = DEFAULT_SOURCE_DURATION
+    if num_recorded_sources:
+        source_duration = sum(recorded.values()) / num_recorded_sources
+
+    costs = {}
+    for language, sources in sources_by_language.items():
+        cost = recorded.get(language, len(sources) * source_duration)
+        image_size = history.get_image_size(language)
+        if image_size is not None:
+            cost += image_size / PULL_BYTES_PER_SECOND
+
+        costs[language] = cost
+
+    return costs
+
+
+def _get_estimated_image_size(history, languages):
+    sizes = [history.get_image_size(language) for language in languages]
+    if any(size is None for size in sizes):
+        return None
+
+    return sum(sizes)
+
+
+def _get_last_batches(batch_numbers, batches, sources_by_language):
+    last_batches = {}
+    for n in batch_numbers:
+        for key in _get_image_keys(batches[n][0], sources_by_language):
+            last_batches[key] = n
+
+    return last_batches
+
+
+def _get_unneeded_containers(containers, n, last_batches):
+    # Keep images that are used by a later batch
+    return {
+        key: container_info
+        for key, container_info in containers.items()
+        if last_batches.get(key, n) <= n
+    }
+
+
+def _get_image_keys(languages, sources_by_language):
+    return set(_get_container_infos(languages, sources_by_language))
+
+
+def _get_container_infos(languages, sources_by_language):
+    container_infos = {}
+    for language in sorted(languages):
+        for source in sources_by_language[language]:
+            container_info = source.test_info.container_info
+            container_infos[f"{container_info.image}:{container_info.tag}"] = container_info
+
+    return container_infos
+
+
+def _record_image_sizes(history, languages, sources_by_language):
+    factory = get_container_factory()
+    image_sizes = {}
+    for language in languages:
+        container_infos = {
+            (source.test_info.container_info.image, str(source.test_info.container_info.tag)): (
+                source.test_info.container_info
+            )
+            for source in sources_by_language[language]
+        }
+        sizes = [
+            factory.get_image_size(container_info) for container_info in container_infos.values()
+        ]
+        if sizes and all(size is not None for size in sizes):
+            image_sizes[language] = sum(sizes)
+
+    if image_sizes:
+        history.update(image_sizes=image_sizes)
+
+
+def _write_manifest(path, batches):
+    manifest = {
+        "include": [
+            {
+                "batch": n + 1,
+                "languages": batch_languages,
+                "estimated_duration": round(batch_cost, 3),
+            }
+            for n, (batch_languages, batch_cost) in enumerate(batches)
+        ]
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
 
 
 def _display_batch(prefix, n, num_batches):
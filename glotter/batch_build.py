@@ -0,0 +1,137 @@
+import math
+import os
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from glotter.build_cache import get_build_cache
+from glotter.containerfactory import get_cache_volumes, get_container_factory
+from glotter.exec_driver import get_parallel_driver_command, parse_parallel_driver_output
+from glotter.source import get_default_build_timeout
+from glotter.stragglers import ExecRecord, record_exec
+from glotter.utils import call_in_thread
+
+BUILD_ROOT = "/glotter-build"
+
+
+def build_sources(sources_by_language, jobs=None):
+    """
+    Build the sources of each language together before they are tested. The sources of a
+    language that use the same image and cache volumes are staged into a single container, and
+    their build commands are run there at the same time. The build outputs of each source that
+    is built are saved in the build cache, so that building the source for its tests restores
+    them instead of building it again. Sources that cannot be built this way are built for
+    their tests as usual
+
+    :param sources_by_language: a dict where the key is the language and the value is a list
+        of the Source objects of that language
+    :param jobs: maximum number of build commands to run at the same time in each container.
+        If not specified, the number of CPUs is used
+    """
+
+    jobs = jobs or os.cpu_count() or 1
+    for language in sorted(sources_by_language):
+        for builds in _get_build_groups(sources_by_language[language]):
+            _build_group(language, builds, jobs)
+
+
+def _get_build_groups(sources):
+    """
+    Group the sources that need to be built by image and cache volumes. Sources whose build
+    outputs are already cached are skipped. So are sources whose build command refers to the
+    ``/src`` directory since they can only be built there. Groups with only one source are
+    dropped since building them together does not save anything
+
+    :param sources: list of Source objects
+    :return: list of the Source objects and build cache keys of each group
+    """
+
+    build_cache = get_build_cache()
+    groups = {}
+    keys = set()
+    for source in sources:
+        command = source.get_build_command()
+        if command is None or "/src" in command:
+            continue
+
+        key = build_cache.get_key(source, command)
+        if key is None or key in keys or build_cache.contains(key):
+            continue
+
+        keys.add(key)
+        container_info = source.test_info.container_info
+        group_key = (
+            container_info.image,
+            str(container_info.tag),
+            tuple(sorted(get_cache_volumes(source))),
+        )
+        groups.setdefault(group_key, []).append((source, key))
+
+    return [builds for builds in groups.values() if len(builds) > 1]
+
+
+def _build_group(language, builds, jobs):
+    factory = get_container_factory()
+    build_cache = get_build_cache()
+    print(f"Building {len(builds)} {language} sources together", flush=True)
+    container = factory.run_build_container(builds[0][0])
+    try:
+        directories = [f"{BUILD_ROOT}/{n}" for n in range(len(builds))]
+        container.exec_run(cmd=["mkdir", "-p", *directories])
+        for (source, _), directory in zip(builds, directories):
+            factory.stage_source(container, source, directory)
+
+        command, marker = get_parallel_driver_command(
+            [source.get_build_command() for source, _ in builds],
+            [f"{directory}/src" for directory in directories],
+            jobs,
+        )
+        timeout = _get_group_timeout([source for source, _ in builds], jobs)
+        description = f"batch build of {len(builds)} {language} sources"
+        start_time = time.monotonic()
+        future = call_in_thread(container.exec_run, cmd=command, workdir="/")
+        try:
+            exit_code, output = future.result(timeout)
+        except FutureTimeoutError:
+            # Removing the container below kills the builds
+            record_exec(ExecRecord(language, description, time.monotonic() - start_time, True))
+            print(
+                f"Timed out building {language} sources together after {timeout:g} seconds",
+                flush=True,
+            )
+            return
+
+        record_exec(ExecRecord(language, description, time.monotonic() - start_time))
+        exit_codes = None
+        if exit_code == 0:
+            exit_codes = parse_parallel_driver_output(output, marker, len(builds))
+
+        if exit_codes is None:
+            print(f"Unable to build {language} sources together", flush=True)
+            return
+
+        for (_, key), directory, code in zip(builds, directories, exit_codes):
+            if code == 0:
+                stream, _ = container.get_archive(f"{directory}/src")
+                build_cache.save_archive(key, stream)
+
+        num_built = exit_codes.count(0)
+        print(f"Built {num_built} of {len(builds)} {language} sources", flush=True)
+    finally:
+        factory.reap(container)
+
+
+def _get_group_timeout(sources, jobs):
+    """
+    Get the maximum number of seconds that building a group of sources together may take. Up
+    to ``jobs`` sources are built at the same time, and each of them may take as long as its
+    build timeout
+
+    :param sources: the sources that are built together
+    :param jobs: maximum number of build commands that run at the same time
+    :return: the timeout in seconds, or None if there is no timeout
+    """
+    timeouts = [source.timeout or get_default_build_timeout() for source in sources]
+    if None in timeouts:
+        return None
+
+    return max(timeouts) * math.ceil(len(sources) / jobs)
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import posixpath
+from functools import cache
+
+from glotter.containerfactory import get_container_factory
+from glotter.utils import atomic_write, get_cache_dir
+
+BUILD_CACHE_ENV_VAR = "GLOTTER_BUILD_CACHE"
+
+
+@cache
+def get_build_cache():
+    """
+    Get BuildCache as a singleton
+    """
+    return BuildCache(enabled=os.environ.get(BUILD_CACHE_ENV_VAR) == "1")
+
+
+class BuildCache:
+    """
+    Persistent on-disk cache of build outputs. Each entry is a tar archive of the source
+    directory of a container after the source is built. The key is made up of the source
+    contents, the rendered build command, and the image ID
+    """
+
+    def __init__(self, enabled=False, cache_dir=None):
+        """
+        Initialize a BuildCache
+
+        :param enabled: whether the cache is used
+        :param cache_dir: directory in which to store the cache. If not specified, the
+            ``builds`` directory in the glotter cache is used
+        """
+        self.enabled = enabled
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self):
+        if self._cache_dir is None:
+            self._cache_dir = get_cache_dir("builds")
+
+        return self._cache_dir
+
+    def get_key(self, source, command):
+        """
+        Get the cache key for a build
+
+        :param source: the source being built
+        :param command: the rendered build command
+        :return: the cache key if the image is found, None otherwise
+        """
+        factory = get_container_factory()
+        image_digest = factory.get_image_digest(source.test_info.container_info)
+        if image_digest is None:
+            return None
+
+        key_data = "\0".join([factory.get_source_digest(source), command, image_digest])
+        return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+    def contains(self, key):
+        """
+        Determine if there are build outputs for a cache key
+
+        :param key: the cache key
+        :return: True if there are build outputs, False otherwise
+        """
+        return os.path.exists(self._get_path(key))
+
+    def restore(self, key, container, source_dir="/src"):
+        """
+        Restore the build outputs for a cache key into a container
+
+        :param key: the cache key
+        :param container: the container to restore the build outputs into
+        :param source_dir: the source directory in the container
+        :return: True if the build outputs were restored, False otherwise
+        """
+        try:
+            with open(self._get_path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+
+        return container.put_archive(posixpath.dirname(source_dir), data)
+
+    def save(self, key, container, source_dir="/src"):
+        """
+        Save the build outputs of a container for a cache key
+
+        :param key: the cache key
+        :param container: the container to save the build outputs from
+        :param source_dir: the source directory in the container
+        """
+        stream, _ = container.get_archive(source_dir)
+        self.save_archive(key, stream)
+
+    def save_archive(self, key, stream):
+        """
+        Save the build outputs for a cache key from a tar archive of the source directory
+
+        :param key: the cache key
+        :param stream: iterable of the chunks of the tar archive
+        """
+        with atomic_write(self._get_path(key), "wb") as f:
+            for chunk in stream:
+                f.write(chunk)
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.tar")
@@ -0,0 +1,132 @@
+import os
+import subprocess
+
+import yaml
+
+from glotter.settings import get_settings
+from glotter.utils import error_and_exit
+
+TESTINFO_FILENAME = "testinfo.yml"
+
+
+def get_changed_sources(rev, sources_by_type):
+    """
+    Get the sources that are affected by the changes since a git revision. A source is
+    affected if:
+
+    - the source itself changed
+    - the ``testinfo.yml`` in the directory of the source changed
+    - the definition of the project of the source in ``.glotter.yml`` changed
+
+    If anything other than the projects in ``.glotter.yml`` changed, all sources are affected.
+    Uncommitted and untracked files are treated as changed
+
+    :param rev: git revision to compare against
+    :param sources_by_type: a dict where the key is the ProjectType and the value is a list of
+        all the Source objects of that project
+    :return: a dict where the key is the ProjectType and the value is a list of all the Source
+        objects of that project that are affected by the changes
+    """
+
+    settings = get_settings()
+    git_root = _run_git(settings.project_root, "rev-parse", "--show-toplevel").strip()
+    changed_paths = {
+        os.path.normpath(os.path.join(git_root, path))
+        for path in _get_changed_git_paths(settings.project_root, rev)
+    }
+
+    yml_path = os.path.normpath(settings.yml_path)
+    changed_projects = set()
+    if yml_path in changed_paths:
+        old_yml = _get_old_yml(settings.project_root, rev, os.path.relpath(yml_path, git_root))
+        with open(yml_path, "r", encoding="utf-8") as f:
+            new_yml = _load_yml(f.read())
+
+        changed_projects = _get_changed_projects(old_yml, new_yml)
+        if changed_projects is None:
+            return sources_by_type
+
+    changed_sources_by_type = {}
+    for project_type, sources in sources_by_type.items():
+        changed_sources = [
+            source
+            for source in sources
+            if project_type in changed_projects
+            or os.path.abspath(source.full_path) in changed_paths
+            or os.path.join(os.path.abspath(source.path), TESTINFO_FILENAME) in changed_paths
+        ]
+        if changed_sources:
+            changed_sources_by_type[project_type] = changed_sources
+
+    return changed_sources_by_type
+
+
+def _get_changed_git_paths(cwd, rev):
+    changed = _run_git(cwd, "diff", "--name-only", "-z", rev, "--")
+    untracked = _run_git(cwd, "ls-files", "--others", "--exclude-standard", "--full-name", "-z")
+    return [path for path in (changed + untracked).split("\0") if path]
+
+
+def _get_old_yml(cwd, rev, yml_path):
+    # .glotter.yml may not exist at the revision
+    contents = _run_git(cwd, "show", f"{rev}:{yml_path.replace(os.sep, '/')}", required=False)
+    return _load_yml(contents or "")
+
+
+def _load_yml(contents):
+    yml = yaml.safe_load(contents)
+    return yml if isinstance(yml, dict) else {}
+
+
+def _get_changed_projects(old_yml, new_yml):
+    """
+    Get the projects whose definition changed. Projects that use the tests of a changed
+    project are also changed
+
+    :param old_yml: contents of ``.glotter.yml`` at the git revision
+    :param new_yml: current contents of ``.glotter.yml``
+    :return: set of changed project types, or None if something other than the projects changed
+    """
+
+    if {key: value for key, value in old_yml.items() if key != "projects"} != {
+        key: value for key, value in new_yml.items() if key != "projects"
+    }:
+        return None
+
+    old_projects = old_yml.get("projects") or {}
+    new_projects = new_yml.get("projects") or {}
+    changed_projects = {
+        project_type
+        for project_type in set(old_projects) | set(new_projects)
+        if old_projects.get(project_type) != new_projects.get(project_type)
+    }
+    while True:
+        using_changed_projects = {
+            project_type
+            for project_type, project in new_projects.items()
+            if isinstance(project, dict)
+            and isinstance(project.get("use_tests"), dict)
+            and project["use_tests"].get("name") in changed_projects
+        }
+        if using_changed_projects <= changed_projects:
+            return changed_projects
+
+        changed_projects |= using_changed_projects
+
+
+def _run_git(cwd, *args, required=True):
+    result = subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        check=False,
+    )
+    if result.returncode != 0:
+        if not required:
+            return None
+
+        error_and_exit(f"git {args[0]} failed: {result.stderr.strip()}")
+
+    return result.stdout
@@ -0,0 +1,17 @@
+from glotter.containerfactory import get_container_factory
+
+
+class ContainerCleanupPlugin:
+    """
+    pytest plugin that removes the pooled and shared containers of this process, and waits for
+    the containers that are being removed in the background, when the session finishes. This
+    cannot be left until exit since pytest-xdist may kill a worker before its exit handlers
+    finish, which would leave its containers running
+    """
+
+    def pytest_sessionfinish(self, session):
+        get_container_factory().close()
+
+
+def pytest_configure(config):
+    config.pluginmanager.register(ContainerCleanupPlugin(), "glotter_container_cleanup")
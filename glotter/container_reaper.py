@@ -0,0 +1,72 @@
+import atexit
+import queue
+import threading
+
+import docker
+
+DEFAULT_CONCURRENCY = 4
+
+
+class ContainerReaper:
+    """
+    Removes containers in the background so that the callers do not wait for docker to stop
+    and remove them. Up to ``concurrency`` containers are removed at the same time. Containers
+    that are still queued when the interpreter exits are removed before it exits
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY):
+        """
+        Initialize a ContainerReaper
+
+        :param concurrency: maximum number of containers to remove at the same time. If 0,
+            containers are removed right away by the caller
+        """
+        self._concurrency = concurrency
+        self._queue = queue.Queue()
+        self._num_threads = 0
+        self._lock = threading.Lock()
+
+    def remove(self, container):
+        """
+        Queue a container for removal. Its volumes are removed with it
+
+        :param container: the container to remove
+        """
+        if self._concurrency <= 0:
+            _remove_container(container)
+            return
+
+        with self._lock:
+            # Threads are only started when they are needed
+            if self._num_threads < min(self._concurrency, self._queue.unfinished_tasks + 1):
+                if not self._num_threads:
+                    atexit.register(self.drain)
+
+                self._num_threads += 1
+                threading.Thread(target=self._reap, daemon=True).start()
+
+            self._queue.put(container)
+
+    def drain(self):
+        """
+        Wait until all of the queued containers are removed
+        """
+        self._queue.join()
+
+    def _reap(self):
+        while True:
+            container = self._queue.get()
+            try:
+                _remove_container(container)
+            finally:
+                self._queue.task_done()
+
+
+def _remove_container(container):
+    try:
+        container.remove(v=True, force=True)
+    except docker.errors.NotFound:
+        # The container was already removed
+        pass
+    except docker.errors.APIError as e:
+        print(f"Unable to remove container {container.name}: {e}", flush=True)
@@ -1,30 +1,185 @@
+import atexit
+import hashlib
+import io
+import itertools
 import os
-import shutil
-import tempfile
+import posixpath
+import re
+import socket
+import tarfile
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from functools import cache
 from uuid import uuid4 as uuid
 
 import docker
 
+from glotter.container_reaper import ContainerReaper
+from glotter.image_cache import get_image_cache
+from glotter.image_lock import get_image_lock
+from glotter.image_usage import get_image_usage
+from glotter.pull_limiter import get_pull_limiter, get_pull_stream_error
+from glotter.utils import file_lock, get_cache_dir
+
+POOL_SIZE_ENV_VAR = "GLOTTER_CONTAINER_POOL_SIZE"
+DISK_BUDGET_ENV_VAR = "GLOTTER_DISK_BUDGET"
+SHARED_CONTAINERS_ENV_VAR = "GLOTTER_SHARED_CONTAINERS"
+CACHE_VOLUME_PREFIX = "glotter-cache-"
+CACHE_VOLUME_INVALID_CHARS_REGEX = re.compile(r"[^a-z0-9_.-]")
+SCRUB_COMMAND = ["sh", "-c", "rm -rf /src/* /src/.[!.]* /src/..?*"]
+SHARED_SOURCE_ROOT = "/glotter-src"
+
+# Keep containers running until they are removed, since pooled and shared containers may be
+# reused for the whole test session
+CONTAINER_COMMAND = "tail -f /dev/null"
+
+# Labels of the containers run by glotter so that orphaned containers can be found
+PID_LABEL = "glotter.pid"
+HOST_LABEL = "glotter.host"
+
+# Kill the processes whose working directory is in the directory given as the first argument,
+# except for the main process of the container
+KILL_EXECS_SCRIPT = """\
+for proc in /proc/[0-9]*; do
+    pid="${proc#/proc/}"
+    [ "$pid" = 1 ] && continue
+    case "$(readlink "$proc/cwd")" in
+        "$1" | "$1"/*) kill -9 "$pid" 2>/dev/null ;;
+    esac
+done
+true
+"""
+
+
+@dataclass
+class PooledContainer:
+    """A container that is part of the container pool
+
+    :ivar pool_key: the image, tag, and cache volumes of the container
+    :ivar container: the running container
+    """
+
+    pool_key: tuple
+    container: object
+
 
 @cache
 def get_container_factory():
     """
     Get ContainerFactory as a singleton
     """
-    return ContainerFactory()
+    return ContainerFactory(
+        pool_size=int(os.environ.get(POOL_SIZE_ENV_VAR) or 0),
+        disk_budget=int(os.environ.get(DISK_BUDGET_ENV_VAR) or 0),
+        shared=os.environ.get(SHARED_CONTAINERS_ENV_VAR) == "1",
+    )
 
 
 class ContainerFactory:
-    def __init__(self):
+    def __init__(self, pool_size=0, disk_budget=0, shared=False):
         """
         Initialize a ContainerFactory
+
+        :param pool_size: maximum number of idle containers to keep for each image. If 0,
+            containers are not pooled, and each source gets its own container
+        :param disk_budget: maximum total size in bytes of the images used by the glotter
+            processes on this host. If a new image makes the total larger than this, the least
+            recently used images that are not pending in any process are removed. If 0, images
+            are not removed
+        :param shared: whether the sources that use the same image share a single container
+            until the factory is closed. Each source is staged into its own directory in the
+            container. Takes precedence over ``pool_size``
         """
         self._containers = {}
-        self._volume_dis = {}
+        self._source_digests = {}
+        self._source_archives = {}
+        self._pool_size = pool_size
+        self._pooled = {}
+        self._idle_containers = OrderedDict()
+        self._pool_lock = threading.Lock()
+        self._disk_budget = disk_budget
+        self._shared = shared
+        self._shared_containers = {}
+        self._shared_sources = {}
+        self._shared_locks = {}
+        self._shared_lock = threading.Lock()
+        self._shared_dir_numbers = itertools.count()
+        self._pending_images = Counter()
+        self._pending_owner = f"{os.getpid()}:{uuid().hex}"
+        self._image_lock = threading.RLock()
+        self._inventory = None
+        self._inventory_lock = threading.Lock()
+        self._reaper = ContainerReaper()
         self._client = docker.from_env()
         self._api_client = self._client.api
+        if self._pool_size > 0 or self._shared:
+            atexit.register(self.close)
+
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    @pool_size.setter
+    def pool_size(self, value):
+        if value > 0 and self._pool_size <= 0 and not self._shared:
+            atexit.register(self.close)
+
+        self._pool_size = value
+
+    @property
+    def shared(self):
+        return self._shared
+
+    @shared.setter
+    def shared(self, value):
+        if value and not self._shared and self._pool_size <= 0:
+            atexit.register(self.close)
+
+        self._shared = value
+
+    @property
+    def disk_budget(self):
+        return self._disk_budget
+
+    @disk_budget.setter
+    def disk_budget(self, value):
+        with self._image_lock:
+            self._disk_budget = value
+            self._save_pending_images()
+
+    def add_pending_images(self, container_infos):
+        """
+        Mark images as needed by pending tests so that they are not removed to stay within the
+        disk budget by any glotter process on this host. An image is pending until it is
+        released as many times as it was added
+
+        :param container_infos: metadata about the images
+        """
+        with self._image_lock:
+            self._pending_images.update(
+                _get_image_name(container_info) for container_info in container_infos
+            )
+            self._save_pending_images()
+
+    def release_pending_images(self, container_infos):
+        """
+        Mark images as no longer needed by a pending test
+
+        :param container_infos: metadata about the images
+        """
+        with self._image_lock:
+            self._pending_images.subtract(
+                _get_image_name(container_info) for container_info in container_infos
+            )
+            self._pending_images = +self._pending_images
+            self._save_pending_images()
+
+    def _save_pending_images(self):
+        # The other processes only need the pending images if there is a disk budget
+        if self._disk_budget > 0:
+            get_image_usage().set_pending(self._pending_owner, self._pending_images)
 
     def get_container(self, source):
         """
@@ -34,39 +189,440 @@ class ContainerFactory:
         :param source: the source to use inside the container
         :return: a running container specific to the source
         """
-        key = source.full_path
+        if self._shared and not _refers_to_source_dir(source):
+            return self._get_shared_container(source)
 
-        tmp_dir = tempfile.mkdtemp()
-        os.chmod(tmp_dir, 0o777)
-        shutil.copy(source.full_path, tmp_dir)
-        self._volume_dis[key] = tmp_dir
+        if self._pool_size > 0:
+            return self._checkout_container(source)
 
-        image = self.get_image(source.test_info.container_info)
-        volume_info = {tmp_dir: {"bind": "/src", "mode": "rw"}}
+        key = source.full_path
         if key not in self._containers:
-            self._containers[key] = self._client.containers.run(
-                image=image,
-                name=f"{source.name}_{uuid().hex}",
-                command="sleep 1h",
-                working_dir="/src",
-                volumes=volume_info,
-                detach=True,
-                entrypoint="",
-            )
+            container = self._run_container(source)
+            self.stage_source(container, source)
+            self._containers[key] = container
+
         return self._containers[key]
 
+    def get_source_dir(self, source):
+        """
+        Get the directory that contains a source in its container
+
+        :param source: the source
+        :return: the path of the source directory
+        """
+        with self._shared_lock:
+            shared = self._shared_sources.get(source.full_path)
+
+        return shared[1] if shared is not None else "/src"
+
+    def _get_shared_container(self, source):
+        """
+        Get the container shared by the sources with the same image and cache volumes as a
+        given source, running it if necessary. The first time that the source gets the
+        container, the source is staged into its own directory under ``/glotter-src``
+
+        :param source: the source to use inside the container
+        :return: the running shared container
+        """
+        key = source.full_path
+        shared_key = (
+            *_get_pool_key(source.test_info.container_info),
+            tuple(sorted(get_cache_volumes(source))),
+        )
+        with self._shared_lock:
+            if key in self._shared_sources:
+                return self._shared_sources[key][0]
+
+            shared_lock = self._shared_locks.setdefault(shared_key, threading.Lock())
+            directory = f"{SHARED_SOURCE_ROOT}/{next(self._shared_dir_numbers)}"
+
+        # Only hold the lock for this image while its container is started so that sources
+        # with other images are not held up
+        with shared_lock:
+            container = self._shared_containers.get(shared_key)
+            if container is not None and not _is_running(container):
+                # The sources staged into the stopped container are staged again when needed
+                self._forget_shared_container(container)
+                self.reap(container)
+                container = None
+
+            if container is None:
+                container = self._run_container(source)
+                self._shared_containers[shared_key] = container
+
+        container.exec_run(cmd=["mkdir", "-p", directory], detach=False, workdir="/")
+        self.stage_source(container, source, directory)
+        with self._shared_lock:
+            self._shared_sources[key] = (container, f"{directory}/src")
+
+        return container
+
+    def _checkout_container(self, source):
+        """
+        Check out a container from the pool for a given source. An idle container for the same
+        image is reused if there is one. Otherwise, a new container is created
+
+        :param source: the source to use inside the container
+        :return: a running container checked out by the source
+        """
+        key = source.full_path
+        if key in self._pooled:
+            return self._pooled[key].container
+
+        pool_key = (
+            *_get_pool_key(source.test_info.container_info),
+            tuple(sorted(get_cache_volumes(source))),
+        )
+        pooled = self._pop_idle_container(pool_key)
+        if pooled is None:
+            pooled = PooledContainer(pool_key=pool_key, container=self._run_container(source))
+
+        self.stage_source(pooled.container, source)
+        self._pooled[key] = pooled
+        return pooled.container
+
+    def run_build_container(self, source):
+        """
+        Run a new container with the image and cache volumes of a source. The container is not
+        managed by the factory, so the caller must remove it, for example with :meth:`reap`
+
+        :param source: the source whose image and cache volumes to use
+        :return: the running container
+        """
+        return self._run_container(source)
+
+    def _run_container(self, source):
+        container_info = source.test_info.container_info
+        try:
+            return self._run_container_from_image(source, self.get_image(container_info))
+        except docker.errors.ImageNotFound:
+            # The image was removed by another process after it was added to the inventory
+            self._forget_image(_get_image_name(container_info))
+            return self._run_container_from_image(source, self.get_image(container_info))
+
+    def _run_container_from_image(self, source, image):
+        kwargs = {}
+        cache_volumes = get_cache_volumes(source)
+        if cache_volumes:
+            kwargs["volumes"] = {
+                name: {"bind": path, "mode": "rw"} for name, path in cache_volumes.items()
+            }
+
+        return self._client.containers.run(
+            image=image,
+            name=f"{source.name}_{uuid().hex}",
+            command=CONTAINER_COMMAND,
+            working_dir="/src",
+            detach=True,
+            entrypoint="",
+            labels=get_container_labels(),
+            **kwargs,
+        )
+
+    def stage_source(self, container, source, path="/"):
+        """
+        Copy a source into the ``src`` directory under a directory of a container
+
+        :param container: the container to copy the source into
+        :param source: the source to copy
+        :param path: the directory in the container that contains the ``src`` directory. The
+            directory must exist
+        """
+        container.put_archive(path, self._get_source_archive(source))
+
+    def _get_source_archive(self, source):
+        """
+        Get a tar archive containing the source directory and the source. Archives are shared by
+        sources with the same filename and contents
+
+        :param source: the source to archive
+        :return: the tar archive as bytes
+        """
+        return self._source_archives[(self.get_source_digest(source), source.filename)]
+
+    def get_source_digest(self, source):
+        """
+        Get the SHA-256 digest of the contents of a source. The source is only read once
+
+        :param source: the source to get the digest for
+        :return: the digest as a hex string
+        """
+        key = source.full_path
+        if key not in self._source_digests:
+            contents, mode = _read_source(key)
+            digest = hashlib.sha256(contents).hexdigest()
+            archive_key = (digest, source.filename)
+            if archive_key not in self._source_archives:
+                self._source_archives[archive_key] = _create_source_archive(
+                    source.filename, contents, mode
+                )
+
+            self._source_digests[key] = digest
+
+        return self._source_digests[key]
+
+    def get_image_digest(self, container_info, pull=True):
+        """
+        Get the ID of an image, pulling the image if necessary
+
+        :param container_info: metadata about the image
+        :param pull: whether to pull the image if it is not found locally
+        :return: the image ID if the image is found, None otherwise
+        """
+        if pull:
+            image = self.get_image(container_info, quiet=True)
+        else:
+            image = self._find_image(container_info)
+
+        return image.id if image is not None else None
+
+    def get_image_size(self, container_info):
+        """
+        Get the size of an image without pulling it
+
+        :param container_info: metadata about the image
+        :return: the size of the image in bytes if the image is found locally, None otherwise
+        """
+        image = self._find_image(container_info)
+        return image.attrs.get("Size") if image is not None else None
+
+    def _pop_idle_container(self, pool_key):
+        """
+        Pop the most recently used idle container for a pool key. Idle containers that are no
+        longer running are removed instead of being returned
+
+        :param pool_key: the image, tag, and cache volumes of the container
+        :return: the idle container if there is one, None otherwise
+        """
+        while True:
+            pooled = None
+            with self._pool_lock:
+                for name in reversed(self._idle_containers):
+                    if self._idle_containers[name].pool_key == pool_key:
+                        pooled = self._idle_containers.pop(name)
+                        break
+
+            if pooled is None or _is_running(pooled.container):
+                return pooled
+
+            self.reap(pooled.container)
+
+    def _return_container(self, source):
+        """
+        Scrub the source directory of a checked out container and return it to the pool. If the
+        source directory cannot be scrubbed, the container is removed instead. If there are too
+        many idle containers for the image, the least recently used one is removed
+
+        :param source: source that checked out the container
+        """
+        pooled = self._pooled.pop(source.full_path, None)
+        if pooled is None:
+            return
+
+        try:
+            exit_code, _ = pooled.container.exec_run(cmd=SCRUB_COMMAND, detach=False, workdir="/")
+        except docker.errors.APIError:
+            # The container is no longer running
+            exit_code = None
+
+        if exit_code != 0:
+            self.reap(pooled.container)
+            return
+
+        with self._pool_lock:
+            self._idle_containers[pooled.container.name] = pooled
+            idle_names = [
+                name
+                for name, idle in self._idle_containers.items()
+                if idle.pool_key == pooled.pool_key
+            ]
+            evicted = [
+                self._idle_containers.pop(name)
+                for name in idle_names[: max(len(idle_names) - self._pool_size, 0)]
+            ]
+
+        for evicted_pooled in evicted:
+            self.reap(evicted_pooled.container)
+
+    def kill_execs(self, source):
+        """
+        Kill the processes that were started in the source directory of a source, such as a
+        command that timed out. This requires ``sh`` and ``readlink`` to be available in the
+        image
+
+        :param source: the source whose processes to kill
+        :return: True if the processes were killed, False otherwise
+        """
+        container = self.get_container(source)
+        try:
+            exit_code, _ = container.exec_run(
+                cmd=["sh", "-c", KILL_EXECS_SCRIPT, "sh", self.get_source_dir(source)],
+                detach=False,
+                workdir="/",
+            )
+        except docker.errors.APIError:
+            return False
+
+        return exit_code == 0
+
+    def remove_container(self, source):
+        """
+        Remove the container of a source, for example when a command in it cannot be killed.
+        The next time that the source gets a container, a new one is run. If the container is
+        shared, it is removed for all of the sources that use it
+
+        :param source: the source whose container to remove
+        """
+        with self._shared_lock:
+            shared = self._shared_sources.get(source.full_path)
+
+        container = shared[0] if shared is not None else None
+        if container is not None:
+            self._forget_shared_container(container)
+        else:
+            pooled = self._pooled.pop(source.full_path, None)
+            container = pooled.container if pooled is not None else None
+
+        if container is None:
+            container = self._containers.pop(source.full_path, None)
+
+        if container is not None:
+            self.reap(container)
+
+    def _forget_shared_container(self, container):
+        """
+        Stop using a shared container for all of the sources that use it
+
+        :param container: the shared container
+        """
+        with self._shared_lock:
+            for key, (shared_container, _) in list(self._shared_sources.items()):
+                if shared_container is container:
+                    del self._shared_sources[key]
+
+            for key, shared_container in list(self._shared_containers.items()):
+                if shared_container is container:
+                    del self._shared_containers[key]
+
+    def reap(self, container):
+        """
+        Remove a container in the background
+
+        :param container: the container to remove
+        """
+        self._reaper.remove(container)
+
+    def wait_for_removals(self):
+        """
+        Wait until the containers that are being removed in the background are removed
+        """
+        self._reaper.drain()
+
+    def close(self):
+        """
+        Remove all idle containers in the pool and all shared containers, and wait until all
+        of the containers that are being removed are removed
+        """
+        with self._pool_lock:
+            idle_containers = list(self._idle_containers.values())
+            self._idle_containers.clear()
+
+        for pooled in idle_containers:
+            self.reap(pooled.container)
+
+        with self._shared_lock:
+            shared_containers = list(self._shared_containers.values())
+            self._shared_containers.clear()
+            self._shared_sources.clear()
+
+        for container in shared_containers:
+            self.reap(container)
+
+        self.wait_for_removals()
+
     def get_image(self, container_info, quiet=False, parallel=False):
         """
-        Pull a docker image
+        Get a docker image. If the image is not found locally, it is loaded from the image
+        cache if it is cached there, or pulled otherwise. Only one process at a time loads or
+        pulls an image, and the others wait for it and then use the image. If there is a disk
+        budget, the least recently used images may be removed to make room for it
 
         :param container_info: metadata about the image to pull
         :param quiet: whether to print output while downloading
         :param parallel: whether image download is occurring in parallel
         :return: a docker image
         """
-        images = self._client.images.list(name=f"{container_info.image}:{container_info.tag!s}")
-        if len(images) == 1:
-            return images[0]
+        image = self._find_image(container_info)
+        if image is None:
+            with self._image_file_lock(container_info, quiet):
+                # Another process may have gotten the image while waiting for the lock
+                image = self._find_image(container_info)
+                if image is None:
+                    image = self._load_cached_image(container_info, quiet)
+
+                if image is None:
+                    self._pull_image(container_info, quiet, parallel)
+                    self._forget_image(_get_image_name(container_info))
+                    image = self._find_image(container_info)
+
+        if image is not None:
+            self._use_image(container_info, image)
+
+        return image
+
+    def _image_file_lock(self, container_info, quiet):
+        name = _get_image_name(container_info)
+
+        def on_wait():
+            if not quiet:
+                print(f"Waiting for another process to get {name}", flush=True)
+
+        path = os.path.join(
+            get_cache_dir("locks"), f"{hashlib.sha256(name.encode('utf-8')).hexdigest()}.lock"
+        )
+        return file_lock(path, on_wait)
+
+    def _load_cached_image(self, container_info, quiet):
+        """
+        Load an image from the image cache
+
+        :param container_info: metadata about the image
+        :param quiet: whether to print output while loading
+        :return: the docker image if it was loaded, None otherwise
+        """
+        path = get_image_cache().get_path(
+            container_info, get_image_lock().get_digest(container_info)
+        )
+        if path is None:
+            return None
+
+        if not quiet:
+            print(f"Loading {container_info.image}:{container_info.tag} from cache", flush=True)
+
+        try:
+            with open(path, "rb") as f:
+                self._client.images.load(f)
+        except docker.errors.APIError:
+            # Fall back to pulling the image if the tarball cannot be loaded
+            return None
+
+        self._forget_image(_get_image_name(container_info))
+        return self._find_image(container_info)
+
+    def save_image_to_cache(self, container_info):
+        """
+        Save an image to the image cache if it is found locally
+
+        :param container_info: metadata about the image
+        """
+        image = self._find_image(container_info)
+        if image is not None:
+            print(f"Saving {container_info.image}:{container_info.tag} to cache", flush=True)
+            get_image_cache().save(
+                image, container_info, get_image_lock().get_digest(container_info)
+            )
+
+    def _pull_image(self, container_info, quiet, parallel):
         if not quiet:
             end_char = "\n" if parallel else ""
             print(
@@ -74,16 +630,33 @@ class ContainerFactory:
                 end=end_char,
                 flush=True,
             )
-        last_update = datetime.now()
-        for _ in self._api_client.pull(
-            repository=container_info.image,
-            tag=str(container_info.tag),
-            stream=True,
-            decode=True,
-        ):
-            if not quiet and not parallel and datetime.now() - last_update > timedelta(seconds=5):
-                print("... ", end="", flush=True)
-                last_update = datetime.now()
+        # Pull the pinned digest if the image is locked
+        digest = get_image_lock().get_digest(container_info)
+
+        def pull():
+            last_update = datetime.now()
+            for chunk in self._api_client.pull(
+                repository=container_info.image,
+                tag=digest or str(container_info.tag),
+                stream=True,
+                decode=True,
+            ):
+                # Errors from the registry are reported in the stream instead of being raised
+                if isinstance(chunk, dict) and chunk.get("error"):
+                    raise get_pull_stream_error(chunk)
+
+                if (
+                    not quiet
+                    and not parallel
+                    and datetime.now() - last_update > timedelta(seconds=5)
+                ):
+                    print("... ", end="", flush=True)
+                    last_update = datetime.now()
+
+        get_pull_limiter().call(pull, f"pull of {container_info.image}:{container_info.tag}")
+        if digest is not None:
+            image = self._client.images.get(f"{container_info.image}@{digest}")
+            image.tag(container_info.image, str(container_info.tag))
         if not quiet:
             if parallel:
                 print(
@@ -93,36 +666,248 @@ class ContainerFactory:
             else:
                 print("done", flush=True)
 
-        images = self._client.images.list(name=f"{container_info.image}:{container_info.tag!s}")
-        if len(images) == 1:
-            return images[0]
+    def _use_image(self, container_info, image):
+        """
+        Mark an image as the most recently used one. If the image is new, the least recently
+        used images are removed until the total size of the images used by the glotter
+        processes on this host is within the disk budget. Images that are pending in any of
+        the processes or in use by a container are not removed
+
+        :param container_info: metadata about the image
+        :param image: the docker image
+        """
+        if self._disk_budget <= 0:
+            return
+
+        def remove_image(name):
+            try:
+                self._remove_image(name, force=False)
+            except docker.errors.APIError:
+                # The image is in use by a container
+                return False
+
+            return True
+
+        with self._image_lock:
+            get_image_usage().use_image(
+                _get_image_name(container_info),
+                image.attrs.get("Size") or 0,
+                self._disk_budget,
+                remove_image,
+            )
+
+    def _find_image(self, container_info):
+        image = self._get_inventory_image(_get_image_name(container_info))
+        if image is None:
+            return None
+
+        # A locked image must match its pinned digest. An image that was loaded from the image
+        # cache has no digest, so it matches if it is the image that was saved for the digest
+        digest = get_image_lock().get_digest(container_info)
+        if (
+            digest is not None
+            and not any(
+                repo_digest.split("@")[-1] == digest
+                for repo_digest in image.attrs.get("RepoDigests") or []
+            )
+            and image.id != get_image_cache().get_image_id(container_info, digest)
+        ):
+            return None
+
+        return image
+
+    def _get_inventory_image(self, name):
+        """
+        Look up an image by name in the image inventory. The inventory is loaded from a single
+        listing of all images the first time that it is used, and it is updated when images
+        are pulled, loaded, or removed. If an image is not in the inventory, docker is asked
+        for it in case another process added it
+
+        :param name: the image and tag
+        :return: the docker image if it is found, None otherwise
+        """
+        name = _normalize_image_name(name)
+        with self._inventory_lock:
+            if self._inventory is None:
+                self._inventory = {
+                    _normalize_image_name(tag): image
+                    for image in self._client.images.list()
+                    for tag in image.tags
+                }
+
+            image = self._inventory.get(name)
+
+        if image is not None:
+            return image
+
+        try:
+            image = self._client.images.get(name)
+        except docker.errors.ImageNotFound:
+            return None
+
+        with self._inventory_lock:
+            self._inventory[name] = image
 
-        return None
+        return image
 
-    def remove_image(self, container_info):
+    def _forget_image(self, name):
+        with self._inventory_lock:
+            if self._inventory is not None:
+                self._inventory.pop(_normalize_image_name(name), None)
+
+    def get_registry_digest(self, container_info):
+        """
+        Get the digest of an image in its registry without pulling it
+
+        :param container_info: metadata about the image
+        :return: the digest of the image
+        """
+        name = f"{container_info.image}:{container_info.tag!s}"
+        return (
+            get_pull_limiter()
+            .call(lambda: self._client.images.get_registry_data(name), f"lookup of {name}")
+            .id
+        )
+
+    def remove_image(self, container_info, force=True):
         """
         Remove a docker image
 
         :param container_info: metadata about the image to remove
+        :param force: whether to remove the image even if a container uses it
+        :raises: :exc:`docker.errors.APIError` if the image is not forced to be removed and a
+            container uses it
         """
 
-        image_name = f"{container_info.image}:{container_info.tag!s}"
-        images = self._client.images.list(name=f"{container_info.image}:{container_info.tag!s}")
-        if len(images) == 1:
+        image_name = _get_image_name(container_info)
+        self._remove_image(image_name, force)
+        get_image_usage().forget_image(image_name)
+
+    def _remove_image(self, image_name, force):
+        # Containers that use the image must be removed first
+        self.wait_for_removals()
+        if self._get_inventory_image(image_name) is not None:
             print(f"Removing {image_name}", flush=True)
-            self._client.images.remove(image=image_name, force=True)
+            self._client.images.remove(image=image_name, force=force)
+            self._forget_image(image_name)
 
     def cleanup(self, source):
         """
-        Cleanup docker container and temporary folder. Also remove both from their
-        respective dictionaries
+        Cleanup docker container. Also remove it from the dictionary of containers. The
+        container is removed in the background. If the container is shared, only the source
+        directory is removed, unless that fails, in which case the container is removed for all
+        of the sources that use it
 
         :param source: source for determining what to cleanup
         """
-        key = source.full_path
+        with self._shared_lock:
+            shared = self._shared_sources.pop(source.full_path, None)
+
+        if shared is not None:
+            container, source_dir = shared
+            try:
+                exit_code, _ = container.exec_run(
+                    cmd=["rm", "-rf", posixpath.dirname(source_dir)], detach=False, workdir="/"
+                )
+            except docker.errors.APIError:
+                # The container is no longer running
+                exit_code = None
+
+            if exit_code != 0:
+                self._forget_shared_container(container)
+                self.reap(container)
+
+            return
+
+        if self._pool_size > 0:
+            self._return_container(source)
+            return
+
+        container = self._containers.pop(source.full_path, None)
+        if container is not None:
+            self.reap(container)
+
+
+def get_container_labels():
+    """
+    Get the labels of the containers run by this process
+
+    :return: a dict where the key is the label and the value is its value
+    """
+    return {PID_LABEL: str(os.getpid()), HOST_LABEL: socket.gethostname()}
+
+
+def get_cache_volumes(source):
+    """
+    Get the names of the docker volumes that back the cache directories of a source. Each
+    cache directory of a language and image has its own volume, so it is shared by all the
+    sources of the language that use the image
+
+    :param source: the source
+    :return: a dict where the key is the volume name and the value is the cache directory
+    """
+    container_info = source.test_info.container_info
+    language = CACHE_VOLUME_INVALID_CHARS_REGEX.sub("-", source.language.lower())
+    volumes = {}
+    for cache_dir in source.cache_dirs:
+        key = f"{container_info.image}:{container_info.tag}:{cache_dir}"
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        volumes[f"{CACHE_VOLUME_PREFIX}{language}-{digest}"] = cache_dir
+
+    return volumes
+
+
+def _is_running(container):
+    try:
+        container.reload()
+    except docker.errors.NotFound:
+        return False
+
+    return container.status == "running"
+
+
+def _refers_to_source_dir(source):
+    # Commands that refer to /src directly can only be run in a container of their own
+    container_info = source.test_info.container_info
+    return any("/src" in (command or "") for command in (container_info.build, container_info.cmd))
+
+
+def _get_pool_key(container_info):
+    return container_info.image, str(container_info.tag)
+
+
+def _get_image_name(container_info):
+    return f"{container_info.image}:{container_info.tag!s}"
+
+
+def _normalize_image_name(name):
+    # Docker lists Docker Hub images without the registry and the library namespace
+    for prefix in ("docker.io/", "index.docker.io/", "library/"):
+        if name.startswith(prefix):
+            name = name[len(prefix) :]
+
+    return name
+
+
+def _read_source(path):
+    with open(path, "rb") as f:
+        contents = f.read()
+
+    return contents, os.stat(path).st_mode & 0o777
+
+
+def _create_source_archive(filename, contents, mode):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        # Make the source directory world writable since the container user may not be root
+        dir_info = tarfile.TarInfo("src")
+        dir_info.type = tarfile.DIRTYPE
+        dir_info.mode = 0o777
+        tar.addfile(dir_info)
 
-        self._containers[key].remove(v=True, force=True)
-        shutil.rmtree(self._volume_dis[key], ignore_errors=True)
+        file_info = tarfile.TarInfo(f"src/{filename}")
+        file_info.size = len(contents)
+        file_info.mode = mode
+        tar.addfile(file_info, io.BytesIO(contents))
 
-        del self._volume_dis[key]
-        del self._containers[key]
+    return archive.getvalue()
@@ -1,9 +1,12 @@
 import functools
+import sys
 
 import pytest
 
 from glotter.settings import get_settings
-from glotter.source import get_sources
+from glotter.source import get_project_sources
+
+_fixture_modules = set()
 
 
 def project_test(project_type):
@@ -20,9 +23,27 @@ def project_test(project_type):
 
 
 def project_fixture(project_type):
-    sources = get_sources(get_settings().source_root).get(project_type)
-    return pytest.fixture(
+    sources = get_project_sources(project_type)
+    fixture = pytest.fixture(
         scope="module",
         params=sources,
-        ids=[f"{source.language}/{source.name}{source.extension}" for source in sources],
+        ids=[source.test_id for source in sources],
     )
+
+    def decorator(func):
+        _fixture_modules.add(func.__module__)
+        return fixture(func)
+
+    return decorator
+
+
+def unload_fixture_modules():
+    """
+    Unload all modules that use :func:`project_fixture` so that the fixture sources are
+    determined again the next time pytest imports them
+    """
+
+    for module_name in _fixture_modules:
+        sys.modules.pop(module_name, None)
+
+    _fixture_modules.clear()
@@ -1,41 +1,227 @@
-from concurrent.futures import ThreadPoolExecutor
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
+from glotter.changes import get_changed_sources
 from glotter.containerfactory import get_container_factory
+from glotter.history import History, get_default_history_path
+from glotter.pull_limiter import get_pull_limiter
 from glotter.settings import get_settings
 from glotter.source import filter_sources, get_sources
+from glotter.utils import error_and_exit
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REGISTRY = "docker.io"
+MIB = 1024 * 1024
 
 
 def download(args):
+    _, errors = download_images(args)
+    if errors:
+        error_and_exit(get_download_error_message(errors))
+
+
+def download_images(args, history=None):
+    """
+    Download the images of the sources. An image that cannot be downloaded does not stop the
+    other images from being downloaded
+
+    :param args: the parsed arguments
+    :param history: History in which to record the size of each pulled image. If not
+        specified, the history file from the arguments is used
+    :return: a dict where the key is the image and tag, and the value is the container info,
+        and a dict where the key is the image and tag, and the value is the exception of each
+        image that could not be downloaded
+    """
+
     def get_key(source):
         return f"{source.test_info.container_info.image}:{source.test_info.container_info.tag}"
 
     sources_by_type = filter_sources(args, get_sources(get_settings().source_root))
+    if args.changed_since:
+        sources_by_type = get_changed_sources(args.changed_since, sources_by_type)
+
     containers = {
         get_key(source): source.test_info.container_info
         for sources in sources_by_type.values()
         for source in sources
     }
-    if args.parallel:
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            executor.map(
-                lambda source: _download_image_from_source(source, True),
-                containers.values(),
+    factory = get_container_factory()
+    factory.disk_budget = args.disk_budget or 0
+    set_pull_options(args)
+
+    # Start the largest images first so that they do not hold up the end of the download
+    if history is None:
+        history = History(args.history or get_default_history_path())
+
+    missing = {
+        name for name, container_info in containers.items() if not _is_present(container_info)
+    }
+    names = sorted(
+        containers,
+        key=lambda name: (
+            name not in missing,
+            history.get_pull_size(name) is not None,
+            -(history.get_pull_size(name) or 0),
+            name,
+        ),
+    )
+
+    start_time = time.monotonic()
+    images, errors = run_scheduled(
+        [
+            (
+                name,
+                get_registry(containers[name].image),
+                lambda name=name: _download_image_from_source(
+                    containers[name], args.parallel, args.to_cache
+                ),
             )
-    else:
-        for container_info in containers.values():
-            _download_image_from_source(container_info)
+            for name in names
+        ],
+        get_pull_concurrency(args),
+        args.registry_concurrency,
+    )
+    duration = time.monotonic() - start_time
+
+    pull_sizes = {
+        name: images[name].attrs.get("Size")
+        for name in missing
+        if images.get(name) is not None and images[name].attrs.get("Size") is not None
+    }
+    if pull_sizes:
+        history.update(pull_sizes=pull_sizes)
+        total_size = sum(pull_sizes.values()) / MIB
+        print(
+            f"Downloaded {len(pull_sizes)} images ({total_size:.1f} MiB) in {duration:.1f}s "
+            f"({total_size / max(duration, 1e-3):.1f} MiB/s)",
+            flush=True,
+        )
+
+    return containers, errors
+
+
+def set_pull_options(args):
+    """
+    Apply the pull rate and retries from the arguments to the pull limiter
+
+    :param args: the parsed arguments
+    """
+    pull_limiter = get_pull_limiter()
+    if args.pull_rate is not None:
+        pull_limiter.rate = args.pull_rate
+
+    if args.pull_retries is not None:
+        pull_limiter.retries = args.pull_retries
+
+
+def get_pull_concurrency(args):
+    """
+    Get the maximum number of images to download at the same time
+
+    :param args: the parsed arguments
+    :return: the pull concurrency if the images are downloaded in parallel, 1 otherwise
+    """
+    return (args.pull_concurrency or DEFAULT_CONCURRENCY) if args.parallel else 1
 
-    return containers
 
+def get_download_error_message(errors):
+    """
+    Get the message that reports the images that could not be downloaded
 
-def _download_image_from_source(container_info, parallel=False):
-    get_container_factory().get_image(container_info, parallel=parallel)
+    :param errors: a dict where the key is the image and tag, and the value is the exception
+    :return: the message
+    """
+    return "Unable to download the following images:\n" + "\n".join(
+        f"- {name}: {error}" for name, error in errors.items()
+    )
+
+
+def run_scheduled(tasks, concurrency, key_concurrency=None):
+    """
+    Run tasks in threads in the specified order. A task is only started when there are fewer
+    than the specified number of tasks running, and fewer than the specified number of tasks
+    with the same key running. If the next task cannot be started because of its key, the
+    following tasks are tried
+
+    :param tasks: list of the name, key, and function of each task
+    :param concurrency: maximum number of tasks to run at the same time
+    :param key_concurrency: maximum number of tasks with the same key to run at the same time.
+        If not specified, there is no maximum for each key
+    :return: a dict where the key is the name and the value is the return value of each task
+        that succeeded, and a dict where the key is the name and the value is the exception
+        of each task that failed
+    """
+
+    pending = list(tasks)
+    running = {}
+    running_keys = Counter()
+    results = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while pending or running:
+            for task in list(pending):
+                if len(running) >= concurrency:
+                    break
+
+                name, key, func = task
+                if key_concurrency and running_keys[key] >= key_concurrency:
+                    continue
+
+                pending.remove(task)
+                running_keys[key] += 1
+                running[executor.submit(func)] = (name, key)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key = running.pop(future)
+                running_keys[key] -= 1
+                if future.exception() is not None:
+                    errors[name] = future.exception()
+                else:
+                    results[name] = future.result()
+
+    return results, errors
+
+
+def get_registry(image):
+    """
+    Get the registry of an image
+
+    :param image: the image name without the tag
+    :return: the host of the registry
+    """
+    first, _, rest = image.partition("/")
+    if rest and ("." in first or ":" in first or first == "localhost"):
+        return first
+
+    return DEFAULT_REGISTRY
+
+
+def _is_present(container_info):
+    return get_container_factory().get_image_size(container_info) is not None
+
+
+def _download_image_from_source(container_info, parallel=False, to_cache=False):
+    image = get_container_factory().get_image(container_info, parallel=parallel)
+    if to_cache:
+        get_container_factory().save_image_to_cache(container_info)
+
+    return image
 
 
 def remove_images(containers, parallel):
-    if parallel:
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            executor.map(get_container_factory().remove_image, containers.values())
-    else:
-        for container_info in containers.values():
-            get_container_factory().remove_image(container_info)
+    concurrency = DEFAULT_CONCURRENCY if parallel else 1
+    _, errors = run_scheduled(
+        [
+            (name, None, lambda container_info=container_info: _remove_image(container_info))
+            for name, container_info in containers.items()
+        ],
+        concurrency,
+    )
+    for name, error in errors.items():
+        print(f"Unable to remove {name}: {error}", flush=True)
+
+
+def _remove_image(container_info):
+    get_container_factory().remove_image(container_info)
@@ -0,0 +1,161 @@
+import shlex
+from typing import List, Optional, Tuple
+from uuid import uuid4 as uuid
+
+DRIVER_FUNC_NAME = "__glotter_run"
+
+
+def get_driver_command(commands: List[str], marker: Optional[str] = None) -> Tuple[List[str], str]:
+    """
+    Get a command that runs each of the specified commands in a single exec. The output of
+    each command is preceded by a header line containing a marker, the exit code, the number
+    of bytes of output, and the system uptime when the command started and finished, or ``-``
+    if the uptime is not available. Standard output and standard error are combined, and
+    standard input is empty
+
+    :param commands: Commands to run. Each command is split the same way that docker splits
+        a command string
+    :param marker: Marker that starts each header line. If not specified, a unique marker
+        is used
+    :return: Command to run and the marker
+    """
+
+    marker = marker or f"@@glotter-{uuid().hex}@@"
+    lines = [
+        'out="/tmp/.glotter_exec_$$"',
+        f"{DRIVER_FUNC_NAME}() {{",
+        "    read -r start _ 2>/dev/null </proc/uptime || start=-",
+        '    "$@" >"$out" 2>&1 </dev/null',
+        "    code=$?",
+        "    read -r end _ 2>/dev/null </proc/uptime || end=-",
+        f"    printf '%s %d %d %s %s\\n' {shlex.quote(marker)} "
+        '"$code" $(wc -c <"$out") "$start" "$end"',
+        '    cat "$out"',
+        "}",
+    ]
+    lines += [
+        f"{DRIVER_FUNC_NAME} {' '.join(shlex.quote(arg) for arg in shlex.split(command))}"
+        for command in commands
+    ]
+    lines.append('rm -f "$out"')
+    return ["sh", "-c", "\n".join(lines)], marker
+
+
+def parse_driver_output(
+    output: bytes, marker: str, num_commands: int
+) -> Optional[List[Tuple[int, bytes, Optional[float]]]]:
+    """
+    Parse the output of a command from :func:`get_driver_command`
+
+    :param output: Output to parse
+    :param marker: Marker that starts each header line
+    :param num_commands: Number of commands that were run
+    :return: Exit code, output, and duration in seconds of each command if the output is
+        valid, None otherwise. The duration is None if it is not known
+    """
+
+    results = []
+    marker_bytes = marker.encode("utf-8")
+    pos = 0
+    while pos < len(output):
+        header_end = output.find(b"\n", pos)
+        if header_end < 0:
+            return None
+
+        header = output[pos:header_end].split()
+        if len(header) != 5 or header[0] != marker_bytes:
+            return None
+
+        try:
+            exit_code = int(header[1])
+            size = int(header[2])
+        except ValueError:
+            return None
+
+        try:
+            duration = float(header[4]) - float(header[3])
+        except ValueError:
+            duration = None
+
+        pos = header_end + 1 + size
+        if pos > len(output):
+            return None
+
+        results.append((exit_code, output[header_end + 1 : pos], duration))
+
+    if len(results) != num_commands:
+        return None
+
+    return results
+
+
+def get_parallel_driver_command(
+    commands: List[str], directories: List[str], jobs: int, marker: Optional[str] = None
+) -> Tuple[List[str], str]:
+    """
+    Get a command that runs each of the specified commands in its own directory in a single
+    exec, running up to the specified number of commands at the same time. Each command
+    prints a line containing a marker, the index of the command, and its exit code when it is
+    finished. The output of the commands is discarded, and standard input is empty
+
+    :param commands: Commands to run. Each command is split the same way that docker splits
+        a command string
+    :param directories: Directory in which to run each command
+    :param jobs: Maximum number of commands to run at the same time
+    :param marker: Marker that starts each line. If not specified, a unique marker is used
+    :return: Command to run and the marker
+    """
+
+    marker = marker or f"@@glotter-{uuid().hex}@@"
+    lines = [
+        f"{DRIVER_FUNC_NAME}() {{",
+        '    n="$1"',
+        '    dir="$2"',
+        "    shift 2",
+        '    (cd "$dir" && "$@") >/dev/null 2>&1 </dev/null',
+        f'    printf \'%s %d %d\\n\' {shlex.quote(marker)} "$n" "$?"',
+        "}",
+    ]
+
+    # Commands are split into lanes that run at the same time, and each lane runs its commands
+    # one after another
+    num_lanes = max(min(jobs, len(commands)), 1)
+    for lane in range(num_lanes):
+        calls = [
+            f"{DRIVER_FUNC_NAME} {index} {shlex.quote(directories[index])} "
+            + " ".join(shlex.quote(arg) for arg in shlex.split(commands[index]))
+            for index in range(lane, len(commands), num_lanes)
+        ]
+        lines.append("(\n" + "\n".join(calls) + "\n) &")
+
+    lines.append("wait")
+    return ["sh", "-c", "\n".join(lines)], marker
+
+
+def parse_parallel_driver_output(
+    output: bytes, marker: str, num_commands: int
+) -> Optional[List[int]]:
+    """
+    Parse the output of a command from :func:`get_parallel_driver_command`
+
+    :param output: Output to parse
+    :param marker: Marker that starts each line
+    :param num_commands: Number of commands that were run
+    :return: Exit code of each command if the output is valid, None otherwise
+    """
+
+    exit_codes = {}
+    for line in output.decode("utf-8", errors="replace").splitlines():
+        fields = line.split()
+        if len(fields) != 3 or fields[0] != marker:
+            return None
+
+        try:
+            exit_codes[int(fields[1])] = int(fields[2])
+        except ValueError:
+            return None
+
+    if sorted(exit_codes) != list(range(num_commands)):
+        return None
+
+    return [exit_codes[index] for index in range(num_commands)]
@@ -0,0 +1,104 @@
+import os
+import socket
+
+import docker
+
+from glotter.container_reaper import ContainerReaper
+from glotter.containerfactory import CACHE_VOLUME_PREFIX, HOST_LABEL, PID_LABEL
+from glotter.utils import get_cache_dir, get_temp_file_pid, is_process_running
+
+
+def gc(args):
+    client = docker.from_env()
+    containers = get_orphaned_containers(client, args.all)
+    reaper = ContainerReaper()
+    for container in containers:
+        print(f"Removing container {container.name}", flush=True)
+        reaper.remove(container)
+
+    reaper.drain()
+    temp_files = get_orphaned_temp_files(get_cache_dir(), args.all)
+    for path in temp_files:
+        os.remove(path)
+
+    print(f"Removed {len(containers)} containers and {len(temp_files)} temporary files")
+    if args.volumes:
+        num_removed = remove_cache_volumes(client)
+        print(f"Removed {num_removed} cache volumes")
+
+
+def get_orphaned_containers(client, include_running=False):
+    """
+    Get the containers that were run by glotter processes that are no longer running. The
+    containers are found by their labels. If a container was run on another host, its process
+    cannot be checked, so it is assumed to be running
+
+    :param client: the docker client
+    :param include_running: whether to include the containers of glotter processes that are
+        still running
+    :return: list of containers
+    """
+    host = socket.gethostname()
+    return [
+        container
+        for container in client.containers.list(all=True, filters={"label": PID_LABEL})
+        if include_running or not _is_owner_running(container.labels, host)
+    ]
+
+
+def get_orphaned_temp_files(directory, include_running=False):
+    """
+    Get the temporary files in a directory and its subdirectories that were written by glotter
+    processes that are no longer running
+
+    :param directory: the directory to search
+    :param include_running: whether to include the temporary files of glotter processes that
+        are still running
+    :return: list of paths of the temporary files
+    """
+    paths = []
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            pid = get_temp_file_pid(filename)
+            if pid is not None and (include_running or not is_process_running(pid)):
+                paths.append(os.path.join(dirpath, filename))
+
+    return sorted(paths)
+
+
+def remove_cache_volumes(client):
+    """
+    Remove the docker volumes that back the cache directories of the languages. Volumes that
+    are in use by a container are not removed
+
+    :param client: the docker client
+    :return: number of volumes removed
+    """
+    num_removed = 0
+    for volume in client.volumes.list(filters={"name": CACHE_VOLUME_PREFIX}):
+        # The name filter matches anywhere in the name
+        if not volume.name.startswith(CACHE_VOLUME_PREFIX):
+            continue
+
+        try:
+            volume.remove()
+        except docker.errors.APIError as e:
+            print(f"Unable to remove volume {volume.name}: {e}", flush=True)
+            continue
+
+        print(f"Removed volume {volume.name}", flush=True)
+        num_removed += 1
+
+    return num_removed
+
+
+def _is_owner_running(labels, host):
+    if labels.get(HOST_LABEL) != host:
+        return True
+
+    try:
+        pid = int(labels.get(PID_LABEL))
+    except (TypeError, ValueError):
+        return False
+
+    return is_process_running(pid)
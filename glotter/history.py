@@ -0,0 +1,189 @@
+import json
+import os
+import re
+
+import pytest
+
+from glotter.utils import atomic_write, get_cache_dir
+
+HISTORY_ENV_VAR = "GLOTTER_HISTORY"
+NODE_ID_LANGUAGE_REGEX = re.compile(r"\[([^/\[\]]+)/")
+
+
+def get_default_history_path():
+    """
+    Get the default path of the history file in the glotter cache
+
+    :return: path of the history file
+    """
+    return os.path.join(get_cache_dir(), "history.json")
+
+
+def get_language_from_node_id(node_id):
+    """
+    Get the language of the source from the pytest node ID of a test
+
+    :param node_id: the pytest node ID
+    :return: the language in lowercase if the node ID contains a source, None otherwise
+    """
+    match = NODE_ID_LANGUAGE_REGEX.search(node_id)
+    return match.group(1).lower() if match else None
+
+
+class History:
+    """
+    Recorded test durations and image sizes for each language, and the size of each image that
+    was pulled. The history is stored as JSON in the following format::
+
+        {
+            "languages": {"<language>": {"duration": <seconds>, "image_size": <bytes>}},
+            "images": {"<image>:<tag>": <bytes>}
+        }
+    """
+
+    def __init__(self, path):
+        """
+        Initialize a History
+
+        :param path: path of the history file. If None, the history starts empty and is only
+            kept in memory
+        """
+        self.path = path
+        self._history = None
+
+    @property
+    def languages(self):
+        if self._history is None:
+            self._history = self._load()
+
+        return self._history["languages"]
+
+    @property
+    def images(self):
+        if self._history is None:
+            self._history = self._load()
+
+        return self._history["images"]
+
+    def get_duration(self, language):
+        """
+        Get the recorded test duration of a language
+
+        :param language: the language in lowercase
+        :return: the duration in seconds if recorded, None otherwise
+        """
+        return self.languages.get(language, {}).get("duration")
+
+    def get_image_size(self, language):
+        """
+        Get the recorded size of the images used by a language
+
+        :param language: the language in lowercase
+        :return: the size in bytes if recorded, None otherwise
+        """
+        return self.languages.get(language, {}).get("image_size")
+
+    def get_pull_size(self, name):
+        """
+        Get the recorded size of a pulled image
+
+        :param name: the image and tag
+        :return: the size in bytes if recorded, None otherwise
+        """
+        return self.images.get(name)
+
+    def update(self, durations=None, image_sizes=None, pull_sizes=None):
+        """
+        Record test durations, image sizes, and/or pulled image sizes, replacing the previously
+        recorded values for the same languages and images. The history file is read again before
+        it is written so that concurrent updates for other languages and images are kept
+
+        :param durations: a dict where the key is the language and the value is the duration
+            in seconds
+        :param image_sizes: a dict where the key is the language and the value is the size in
+            bytes
+        :param pull_sizes: a dict where the key is the image and tag, and the value is the size
+            in bytes
+        """
+        if self.path is None:
+            history = {"languages": self.languages, "images": self.images}
+        else:
+            history = self._load()
+
+        languages = history["languages"]
+        for key, values in (("duration", durations), ("image_size", image_sizes)):
+            for language, value in (values or {}).items():
+                languages.setdefault(language, {})[key] = value
+
+        history["images"].update(pull_sizes or {})
+        if self.path is None:
+            return
+
+        if not history["images"]:
+            del history["images"]
+
+        with atomic_write(self.path) as f:
+            json.dump(history, f, indent=2, sort_keys=True)
+
+        self._history = {"images": {}, **history}
+
+    def _load(self):
+        if self.path is None:
+            return {"languages": {}, "images": {}}
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                history = json.load(f)
+        except (FileNotFoundError, ValueError):
+            history = {}
+
+        if not isinstance(history, dict):
+            history = {}
+
+        return {
+            key: history[key] if isinstance(history.get(key), dict) else {}
+            for key in ("languages", "images")
+        }
+
+
+def get_durations_by_language(durations):
+    """
+    Add up test durations by language
+
+    :param durations: iterable of pytest node IDs and durations in seconds
+    :return: a dict where the key is the language and the value is the total duration
+    """
+    durations_by_language = {}
+    for node_id, duration in durations:
+        language = get_language_from_node_id(node_id)
+        if language is not None:
+            durations_by_language[language] = durations_by_language.get(language, 0.0) + duration
+
+    return durations_by_language
+
+
+class HistoryPlugin:
+    """
+    pytest plugin that records the total test duration of each language, including the setup
+    and teardown of the project fixtures
+    """
+
+    def __init__(self, history):
+        self._history = history
+        self._durations = []
+
+    def pytest_runtest_logreport(self, report):
+        self._durations.append((report.nodeid, report.duration))
+
+    def pytest_sessionfinish(self, session):
+        durations = get_durations_by_language(self._durations)
+        if durations:
+            self._history.update(durations=durations)
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):
+    # Only record in the pytest-xdist controller since it receives the reports of all workers
+    path = os.environ.get(HISTORY_ENV_VAR)
+    if path and not hasattr(config, "workerinput"):
+        config.pluginmanager.register(HistoryPlugin(History(path)), "glotter_history")
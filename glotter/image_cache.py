@@ -0,0 +1,100 @@
+import gzip
+import hashlib
+import os
+from functools import cache
+
+from glotter.utils import atomic_write, get_cache_dir
+
+
+@cache
+def get_image_cache():
+    """
+    Get ImageCache as a singleton
+    """
+    return ImageCache()
+
+
+class ImageCache:
+    """
+    Persistent on-disk cache of docker images. Each image is stored as a gzip compressed
+    ``docker save`` tarball named after the image ID, and each image name refers to the image ID
+    that was saved for it. The image name of a locked image includes the digest that it is
+    pinned to, since an image that is loaded from a tarball has no digest
+    """
+
+    def __init__(self, cache_dir=None):
+        """
+        Initialize an ImageCache
+
+        :param cache_dir: directory in which to store the cache. If not specified, the
+            ``images`` directory in the glotter cache is used
+        """
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self):
+        if self._cache_dir is None:
+            self._cache_dir = get_cache_dir("images")
+
+        return self._cache_dir
+
+    def get_path(self, container_info, digest=None):
+        """
+        Get the path of the tarball of an image
+
+        :param container_info: metadata about the image
+        :param digest: the digest that the image is pinned to, if any
+        :return: the path of the tarball if the image is cached, None otherwise
+        """
+        image_id = self.get_image_id(container_info, digest)
+        if image_id is None:
+            return None
+
+        path = self._get_image_path(image_id)
+        return path if os.path.exists(path) else None
+
+    def get_image_id(self, container_info, digest=None):
+        """
+        Get the ID of the image that was saved for an image name
+
+        :param container_info: metadata about the image
+        :param digest: the digest that the image is pinned to, if any
+        :return: the image ID if the image was saved, None otherwise
+        """
+        try:
+            with open(self._get_ref_path(container_info, digest), "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def save(self, image, container_info, digest=None):
+        """
+        Save an image. The tarball is only written if there is no tarball for the same image ID
+
+        :param image: the docker image
+        :param container_info: metadata about the image
+        :param digest: the digest that the image is pinned to, if any
+        """
+        path = self._get_image_path(image.id)
+        if not os.path.exists(path):
+            with (
+                atomic_write(path, "wb") as raw,
+                gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=1) as f,
+            ):
+                for chunk in image.save(named=True):
+                    f.write(chunk)
+
+        with atomic_write(self._get_ref_path(container_info, digest)) as f:
+            f.write(image.id)
+
+    def _get_image_path(self, image_id):
+        return os.path.join(self.cache_dir, f"{image_id.split(':')[-1]}.tar.gz")
+
+    def _get_ref_path(self, container_info, digest):
+        name = f"{container_info.image}:{container_info.tag!s}"
+        if digest is not None:
+            name += f"@{digest}"
+
+        return os.path.join(
+            self.cache_dir, "refs", hashlib.sha256(name.encode("utf-8")).hexdigest()
+        )
@@ -0,0 +1,75 @@
+import json
+import os
+from functools import cache
+
+from glotter.utils import atomic_write, error_and_exit
+
+LOCK_FILENAME = "glotter.lock"
+
+
+@cache
+def get_image_lock():
+    """
+    Get ImageLock for the lock file in the project root as a singleton
+    """
+    return ImageLock(os.path.join(os.getcwd(), LOCK_FILENAME))
+
+
+class ImageLock:
+    """
+    Digests that images are pinned to. The lock is stored as JSON in the following format::
+
+        {"images": {"<image>:<tag>": "<digest>"}}
+    """
+
+    def __init__(self, path):
+        """
+        Initialize an ImageLock
+
+        :param path: path of the lock file
+        """
+        self.path = path
+        self._images = None
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = self._load()
+
+        return self._images
+
+    def get_digest(self, container_info):
+        """
+        Get the digest that an image is pinned to
+
+        :param container_info: metadata about the image
+        :return: the digest if the image is pinned, None otherwise
+        """
+        return self.images.get(f"{container_info.image}:{container_info.tag!s}")
+
+    def write(self, images):
+        """
+        Write the lock file, replacing all of the pinned images
+
+        :param images: a dict where the key is the image and tag, and the value is the digest
+        """
+        with atomic_write(self.path) as f:
+            json.dump({"images": images}, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+        self._images = dict(images)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lock = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            error_and_exit(f"Invalid lock file {self.path}: {e}")
+
+        images = lock.get("images") if isinstance(lock, dict) else None
+        if not isinstance(images, dict):
+            error_and_exit(f'Invalid lock file {self.path}: "images" must be a mapping')
+
+        return images
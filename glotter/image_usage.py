@@ -0,0 +1,148 @@
+import json
+import os
+import socket
+from contextlib import contextmanager
+from functools import cache
+
+from glotter.utils import atomic_write, file_lock, get_cache_dir, is_process_running
+
+
+@cache
+def get_image_usage():
+    """
+    Get ImageUsage as a singleton
+    """
+    return ImageUsage()
+
+
+class ImageUsage:
+    """
+    Sizes of the images that are kept within the disk budget, and the images that each process
+    still needs, shared by all of the glotter processes on this host, such as the pytest-xdist
+    workers, so that the disk budget applies to all of them together. The usage is stored as
+    JSON in the following format, where the images are ordered from least to most recently
+    used::
+
+        {
+            "images": {"<image>:<tag>": <bytes>},
+            "pending": {"<pid>:<owner>": {"<image>:<tag>": <count>}}
+        }
+
+    The pending images of processes that are no longer running are ignored
+    """
+
+    def __init__(self, path=None):
+        """
+        Initialize an ImageUsage
+
+        :param path: path of the usage file. If not specified, a file named after this host in
+            the ``disk-budget`` directory in the glotter cache is used
+        """
+        self._path = path
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = os.path.join(get_cache_dir("disk-budget"), f"{socket.gethostname()}.json")
+
+        return self._path
+
+    def set_pending(self, owner, pending):
+        """
+        Replace the images that an owner still needs
+
+        :param owner: the owner, which must start with the process ID followed by ``:``
+        :param pending: a dict where the key is the image and tag, and the value is the number
+            of times it is needed
+        """
+        with self._update() as usage:
+            if pending:
+                usage["pending"][owner] = dict(pending)
+            else:
+                usage["pending"].pop(owner, None)
+
+    def use_image(self, name, size, disk_budget, remove_image):
+        """
+        Mark an image as the most recently used one. If the image is new, the least recently
+        used images that no process needs are removed until the total size of the images is
+        within the disk budget
+
+        :param name: the image and tag
+        :param size: the size of the image in bytes
+        :param disk_budget: maximum total size of the images in bytes
+        :param remove_image: function that is called with the image and tag of an image to
+            remove, and returns whether the image was removed
+        """
+        with self._update() as usage:
+            images = usage["images"]
+            is_new = name not in images
+            images.pop(name, None)
+            images[name] = size
+            if not is_new:
+                return
+
+            pending = {
+                pending_name
+                for counts in usage["pending"].values()
+                for pending_name, count in counts.items()
+                if count > 0
+            }
+            total_size = sum(images.values())
+            for evict_name, evict_size in list(images.items()):
+                if total_size <= disk_budget:
+                    break
+
+                if evict_name == name or evict_name in pending or not remove_image(evict_name):
+                    continue
+
+                del images[evict_name]
+                total_size -= evict_size
+
+    def forget_image(self, name):
+        """
+        Stop tracking an image that was removed
+
+        :param name: the image and tag
+        """
+        with self._update() as usage:
+            usage["images"].pop(name, None)
+
+    @contextmanager
+    def _update(self):
+        # Write the usage back only if the context does not raise an exception
+        with file_lock(f"{self.path}.lock"):
+            usage = _load(self.path)
+            yield usage
+            with atomic_write(self.path) as f:
+                json.dump(usage, f, indent=2)
+
+
+def _load(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            usage = json.load(f)
+    except (FileNotFoundError, ValueError):
+        usage = {}
+
+    if not isinstance(usage, dict):
+        usage = {}
+
+    images = usage.get("images") if isinstance(usage.get("images"), dict) else {}
+    pending = usage.get("pending") if isinstance(usage.get("pending"), dict) else {}
+    return {
+        "images": images,
+        "pending": {
+            owner: counts
+            for owner, counts in pending.items()
+            if isinstance(counts, dict) and _is_owner_running(owner)
+        },
+    }
+
+
+def _is_owner_running(owner):
+    try:
+        pid = int(owner.split(":", 1)[0])
+    except ValueError:
+        return False
+
+    return is_process_running(pid)
@@ -0,0 +1,42 @@
+from glotter.containerfactory import get_container_factory
+from glotter.download import get_pull_concurrency, get_registry, run_scheduled, set_pull_options
+from glotter.image_lock import get_image_lock
+from glotter.settings import get_settings
+from glotter.source import get_sources
+from glotter.utils import error_and_exit
+
+
+def lock(args):
+    sources_by_type = get_sources(get_settings().source_root)
+    containers = {
+        f"{source.test_info.container_info.image}:{source.test_info.container_info.tag}": (
+            source.test_info.container_info
+        )
+        for sources in sources_by_type.values()
+        for source in sources
+    }
+    set_pull_options(args)
+
+    def resolve(name):
+        print(f"Resolving {name}", flush=True)
+        return get_container_factory().get_registry_digest(containers[name])
+
+    # Every image is tried so that all of the images that cannot be resolved are reported
+    names = sorted(containers)
+    digests, errors = run_scheduled(
+        [
+            (name, get_registry(containers[name].image), lambda name=name: resolve(name))
+            for name in names
+        ],
+        get_pull_concurrency(args),
+        args.registry_concurrency,
+    )
+    if errors:
+        error_and_exit(
+            "Unable to resolve the following images:\n"
+            + "\n".join(f"- {name}: {errors[name]}" for name in names if name in errors)
+        )
+
+    image_lock = get_image_lock()
+    image_lock.write({name: digests[name] for name in names})
+    print(f"Pinned {len(names)} images in {image_lock.path}")
@@ -0,0 +1,318 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+
+from glotter.containerfactory import get_container_factory
+from glotter.history import History, get_durations_by_language
+from glotter.result_cache import get_result_cache
+from glotter.settings import get_settings
+from glotter.stragglers import get_straggler_report, pop_records
+from glotter.test_generator import TestGenerator
+
+OUTCOME_PASSED = "passed"
+OUTCOME_FAILED = "failed"
+OUTCOME_ERROR = "error"
+OUTCOME_CACHED = "cached"
+
+NO_GENERATED_TESTS_MESSAGE = (
+    "The native engine does not run tests that are written with project_test. "
+    "Use --engine pytest to run them"
+)
+
+
+@dataclass
+class NativeTestResult:
+    """Result of a test run by the native engine
+
+    :ivar nodeid: pytest node ID of the test
+    :ivar outcome: "passed", "failed", "error", or "cached"
+    :ivar duration: duration of the test in seconds
+    :ivar message: failure or error message
+    """
+
+    nodeid: str
+    outcome: str
+    duration: float
+    message: str = ""
+
+
+def run_native_tests(
+    sources_by_type, concurrency=1, junit_xml=None, json_report=None, history_path=None
+):
+    """
+    Run the tests for the specified sources without pytest. Each source is built, tested,
+    and cleaned up in its own worker, and up to the specified number of sources are tested
+    at the same time
+
+    :param sources_by_type: a dict where the key is the ProjectType and the value is a list of
+        all the Source objects of that project to test
+    :param concurrency: maximum number of sources to test at the same time
+    :param junit_xml: path to write the test results as JUnit XML. If not specified, no JUnit
+        XML is written
+    :param json_report: path to write the test results as JSON. If not specified, no JSON is
+        written
+    :param history_path: path of the history file in which to record the test duration of each
+        language. If not specified, no durations are recorded
+    :return: exit code using the same values as pytest
+    """
+
+    start_time = time.monotonic()
+    results = asyncio.run(_run_all(sources_by_type, concurrency))
+    duration = time.monotonic() - start_time
+
+    for result in results:
+        print(f"{result.nodeid} {result.outcome.upper()}", flush=True)
+
+    num_unsupported = sum(result.message == NO_GENERATED_TESTS_MESSAGE for result in results)
+    if num_unsupported:
+        print(
+            f"Warning: {num_unsupported} sources were not tested. {NO_GENERATED_TESTS_MESSAGE}",
+            flush=True,
+        )
+
+    summary = _get_summary(results)
+    summary_text = ", ".join(f"{count} {outcome}" for outcome, count in summary.items() if count)
+    print(f"{summary_text or 'no tests ran'} in {duration:.2f}s", flush=True)
+    for line in get_straggler_report(pop_records()):
+        print(line, flush=True)
+
+    exit_code = 0
+    if not results:
+        exit_code = 5
+    elif summary[OUTCOME_FAILED] or summary[OUTCOME_ERROR]:
+        exit_code = 1
+
+    if junit_xml:
+        _write_junit_xml(junit_xml, results, duration)
+
+    if json_report:
+        _write_json_report(json_report, results, duration, exit_code)
+
+    if history_path:
+        durations = get_durations_by_language(
+            (result.nodeid, result.duration) for result in results
+        )
+        if durations:
+            History(history_path).update(durations=durations)
+
+    return exit_code
+
+
+async def _run_all(sources_by_type, concurrency):
+    # Test the sources of each image together so that the image is no longer needed as soon as
+    # possible, and keep the images of the sources that are not tested yet within the disk budget
+    sources = [
+        (project_type, source)
+        for project_type, sources in sources_by_type.items()
+        for source in sources
+    ]
+    order = sorted(
+        range(len(sources)),
+        key=lambda index: _get_image_name(sources[index][1]),
+    )
+    get_container_factory().add_pending_images(
+        source.test_info.container_info for _, source in sources
+    )
+
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        tasks = [_run_source_tests(loop, executor, semaphore, *sources[index]) for index in order]
+        results = dict(zip(order, await asyncio.gather(*tasks)))
+
+    return [result for index in range(len(sources)) for result in results[index]]
+
+
+async def _run_source_tests(loop, executor, semaphore, project_type, source):
+    async with semaphore:
+        try:
+            return await loop.run_in_executor(executor, run_source_tests, project_type, source)
+        finally:
+            get_container_factory().release_pending_images([source.test_info.container_info])
+
+
+def _get_image_name(source):
+    container_info = source.test_info.container_info
+    return f"{container_info.image}:{container_info.tag}"
+
+
+def run_source_tests(project_type, source):
+    """
+    Build a source, run all of the tests for it, and clean it up. If the result cache is
+    enabled, tests that passed before are not run, and the source is not built if all of its
+    tests passed before. If the project of the source has no generated tests, a single error
+    is returned for the source since its tests can only be run by pytest
+
+    :param project_type: the project type of the source
+    :param source: the source to test
+    :return: list of NativeTestResult objects
+    """
+
+    project = get_settings().projects.get(project_type)
+    if project is None or not project.tests:
+        nodeid = f"{project_type}::project_test[{source.test_id}]"
+        return [NativeTestResult(nodeid, OUTCOME_ERROR, 0.0, NO_GENERATED_TESTS_MESSAGE)]
+
+    test_generator = TestGenerator(project_type, project)
+    result_cache = get_result_cache()
+    items = []
+    for test_obj in project.tests.values():
+        for pytest_id, param in test_obj.get_pytest_ids():
+            nodeid = test_generator.get_node_id(test_obj, source, pytest_id)
+            key = (
+                result_cache.get_key(source, test_obj, pytest_id) if result_cache.enabled else None
+            )
+            cached = key is not None and result_cache.is_passed(key)
+            items.append((test_obj, param, nodeid, key, cached))
+
+    if all(cached for *_, cached in items):
+        return [NativeTestResult(nodeid, OUTCOME_CACHED, 0.0) for _, _, nodeid, _, _ in items]
+
+    results = []
+    try:
+        start_time = time.monotonic()
+        try:
+            source.build()
+            prefetched = [
+                (param.input, test_obj.timeout)
+                for test_obj, param, *_, cached in items
+                if test_obj.requires_parameters and not cached
+            ]
+            source.prefetch(
+                [params for params, _ in prefetched], [timeout for _, timeout in prefetched]
+            )
+        except Exception as exc:
+            duration = time.monotonic() - start_time
+            message = f"{exc.__class__.__name__}: {exc}"
+            return [
+                NativeTestResult(nodeid, OUTCOME_CACHED, 0.0)
+                if cached
+                else NativeTestResult(nodeid, OUTCOME_ERROR, duration, message)
+                for _, _, nodeid, _, cached in items
+            ]
+
+        for test_obj, param, nodeid, key, cached in items:
+            if cached:
+                results.append(NativeTestResult(nodeid, OUTCOME_CACHED, 0.0))
+                continue
+
+            start_time = time.monotonic()
+            outcome = OUTCOME_PASSED
+            message = ""
+            try:
+                check_test(test_obj, param, source)
+            except AssertionError as exc:
+                outcome = OUTCOME_FAILED
+                message = str(exc)
+            except Exception as exc:
+                outcome = OUTCOME_ERROR
+                message = f"{exc.__class__.__name__}: {exc}"
+
+            if outcome == OUTCOME_PASSED and key is not None:
+                result_cache.record_pass(key)
+
+            results.append(
+                NativeTestResult(nodeid, outcome, time.monotonic() - start_time, message)
+            )
+    finally:
+        source.cleanup()
+
+    return results
+
+
+def check_test(test_obj, param, source):
+    """
+    Run a source for a test parameter and check the output. This is equivalent to the
+    test function generated by :meth:`AutoGenTest.generate_test`
+
+    :param test_obj: the test to check
+    :param param: the test parameter to check
+    :param source: the source to test
+    :raises: :exc:`AssertionError` if the output is not the expected output
+    """
+
+    run_params = param.input if test_obj.requires_parameters else None
+    actual = source.run(params=run_params, timeout=test_obj.timeout)
+    expected = param.expected
+    if isinstance(expected, dict):
+        if "string" in expected:
+            expected = test_obj.strings[expected["string"]]
+        elif "exec" in expected:
+            expected = source.exec(expected["exec"])
+        else:
+            with open(source.full_path, "r", encoding="utf-8") as file:
+                expected = file.read()
+
+            if "self" in param.expected:
+                diff_len = len(actual) - len(expected)
+                if diff_len > 0:
+                    expected += "\n"
+                elif diff_len < 0:
+                    actual += "\n"
+
+    actual, expected = test_obj.transform_values(actual, expected)
+    if isinstance(param.expected, list):
+        assert len(actual) == len(expected), "Length not equal"
+        for index in range(len(expected)):
+            assert actual[index] == expected[index], f"Item {index + 1} is not equal"
+    else:
+        assert actual == expected, f"assert {actual!r} == {expected!r}"
+
+
+def _get_summary(results):
+    summary = {OUTCOME_PASSED: 0, OUTCOME_FAILED: 0, OUTCOME_ERROR: 0, OUTCOME_CACHED: 0}
+    for result in results:
+        summary[result.outcome] += 1
+
+    return summary
+
+
+def _write_junit_xml(path, results, duration):
+    summary = _get_summary(results)
+    testsuites = ET.Element("testsuites")
+    testsuite = ET.SubElement(
+        testsuites,
+        "testsuite",
+        name="pytest",
+        errors=str(summary[OUTCOME_ERROR]),
+        failures=str(summary[OUTCOME_FAILED]),
+        skipped="0",
+        tests=str(len(results)),
+        time=f"{duration:.3f}",
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        hostname=socket.gethostname(),
+    )
+    for result in results:
+        module_path, name = result.nodeid.split("::", 1)
+        testcase = ET.SubElement(
+            testsuite,
+            "testcase",
+            classname=os.path.splitext(module_path)[0].replace("/", "."),
+            name=name,
+            time=f"{result.duration:.3f}",
+        )
+        if result.outcome in (OUTCOME_FAILED, OUTCOME_ERROR):
+            tag = "failure" if result.outcome == OUTCOME_FAILED else "error"
+            element = ET.SubElement(testcase, tag, message=result.message)
+            element.text = result.message
+
+    ET.ElementTree(testsuites).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def _write_json_report(path, results, duration, exit_code):
+    summary = {outcome: count for outcome, count in _get_summary(results).items() if count}
+    report = {
+        "created": time.time(),
+        "duration": duration,
+        "exitcode": exit_code,
+        "summary": {**summary, "total": len(results)},
+        "tests": [asdict(result) for result in results],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,63 @@
+import pytest
+
+from glotter.containerfactory import get_container_factory
+from glotter.source import Source
+
+
+class PendingImagesPlugin:
+    """
+    pytest plugin that marks the images of the tests that have not finished as pending so that
+    they are not removed to stay within the disk budget. A pytest-xdist worker does not know
+    which tests it will run ahead of time, so only the images of its current and next tests
+    are pending
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def pytest_collection_finish(self, session):
+        if not hasattr(session.config, "workerinput"):
+            self._add(session.items)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        self._add([item] if nextitem is None else [item, nextitem])
+        try:
+            yield
+        finally:
+            self._release(item)
+
+    def _add(self, items):
+        # Add the images together since the pending images are shared with other processes
+        added = {}
+        for item in items:
+            if item.nodeid not in self._pending and item.nodeid not in added:
+                container_info = get_item_container_info(item)
+                if container_info is not None:
+                    added[item.nodeid] = container_info
+
+        if added:
+            get_container_factory().add_pending_images(added.values())
+            self._pending.update(added)
+
+    def _release(self, item):
+        container_info = self._pending.pop(item.nodeid, None)
+        if container_info is not None:
+            get_container_factory().release_pending_images([container_info])
+
+
+def get_item_container_info(item):
+    """
+    Get the metadata about the image of the source that a test uses
+
+    :param item: the pytest test item
+    :return: the container info if the test uses a source, None otherwise
+    """
+    callspec = getattr(item, "callspec", None)
+    params = callspec.params.values() if callspec is not None else []
+    source = next((param for param in params if isinstance(param, Source)), None)
+    return source.test_info.container_info if source is not None else None
+
+
+def pytest_configure(config):
+    config.pluginmanager.register(PendingImagesPlugin(), "glotter_pending_images")
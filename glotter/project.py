@@ -27,6 +27,7 @@ class Project(BaseModel, CoreProjectMixin):
     acronym_scheme: AcronymScheme = AcronymScheme.two_letter_limit
     use_tests: Optional[AutoGenUseTests] = None
     repeat: Dict[str, int] = {}
+    timeout: Optional[Annotated[float, Field(gt=0)]] = None
     tests: Dict[str, AutoGenTest] = {}
 
     @field_validator("acronyms", mode="before")
@@ -87,6 +88,7 @@ class Project(BaseModel, CoreProjectMixin):
                 "strings": info.data.get("strings") or {},
                 "name": test_name,
                 "repeat": repeat.get(test_name, 1),
+                "timeout": test.get("timeout", info.data.get("timeout")),
             }
             for test_name, test in value.items()
         }
@@ -109,9 +111,10 @@ class Project(BaseModel, CoreProjectMixin):
             for test_name_, test in project.tests.items():
                 test_name = test_name_.replace(self.use_tests.search, self.use_tests.replace)
                 self.tests[test_name] = AutoGenTest(
-                    **test.model_dump(exclude={"name", "repeat"}),
+                    **test.model_dump(exclude={"name", "repeat", "timeout"}),
                     name=test_name,
                     repeat=self.repeat.get(test_name, 1),
+                    timeout=test.timeout if test.timeout is not None else self.timeout,
                 )
 
             self.requires_parameters = project.requires_parameters
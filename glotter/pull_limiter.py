@@ -0,0 +1,311 @@
+import os
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from functools import cache
+from http import HTTPStatus
+
+import docker
+import requests
+
+PULL_RATE_ENV_VAR = "GLOTTER_PULL_RATE"
+PULL_RETRIES_ENV_VAR = "GLOTTER_PULL_RETRIES"
+DEFAULT_RETRIES = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+# Longest wait that a rate limit response can cause. A longer wait is treated as a failure
+MAX_RETRY_AFTER = 15 * 60
+
+RATE_LIMIT_REGEX = re.compile(r"toomanyrequests|rate limit|too many requests", re.IGNORECASE)
+TRANSIENT_REGEX = re.compile(
+    r"timeout|timed out|connection reset|connection refused|temporarily unavailable|"
+    r"unexpected EOF|service unavailable|bad gateway|i/o timeout",
+    re.IGNORECASE,
+)
+TRANSIENT_STATUS_CODES = (408, 429, 502, 503, 504)
+
+# Errors in the stream of a pull have no response headers, but registries often include the wait
+# in the message, either in seconds or as a Go duration, such as "retry-after: 1m30s"
+RETRY_AFTER_MESSAGE_REGEX = re.compile(
+    r"retry[-_ ]after\W*((?:[0-9.]+(?:ns|us|µs|ms|s|m|h))+|[0-9.]+)", re.IGNORECASE
+)
+DURATION_PART_REGEX = re.compile(r"([0-9.]+)(ns|us|µs|ms|s|m|h)")
+DURATION_UNITS = {"ns": 1e-9, "us": 1e-6, "µs": 1e-6, "ms": 1e-3, "s": 1, "m": 60, "h": 3600}
+
+# URL of the docker daemon endpoint that streams the progress of a pull
+PULL_URL = "http+docker://localhost/images/create"
+
+
+@cache
+def get_pull_limiter():
+    """
+    Get PullLimiter as a singleton
+    """
+    return PullLimiter(
+        rate=float(os.environ.get(PULL_RATE_ENV_VAR) or 0),
+        retries=int(os.environ.get(PULL_RETRIES_ENV_VAR) or DEFAULT_RETRIES),
+    )
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens are added at a fixed rate up to the capacity, and each
+    call takes one token, waiting for it if there is none. The bucket can also be paused so
+    that no tokens are handed out until the pause is over
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        """
+        Initialize a TokenBucket
+
+        :param rate: number of tokens added per second. If 0, tokens are not limited
+        :param capacity: maximum number of tokens in the bucket
+        :param clock: function that returns the current time in seconds
+        :param sleep: function that waits for the specified number of seconds
+        """
+        self._rate = rate
+        self._capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._last_time = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, value):
+        with self._lock:
+            self._refill(self._clock())
+            self._rate = value
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available
+        """
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._rate <= 0:
+                        return
+
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+
+                    wait = (1 - self._tokens) / self._rate
+
+            self._sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for the specified number of seconds
+
+        :param seconds: number of seconds to pause for
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def _refill(self, now):
+        if self._rate > 0:
+            self._tokens = min(self._capacity, self._tokens + (now - self._last_time) * self._rate)
+
+        self._last_time = now
+
+
+class PullLimiter:
+    """
+    Limit the rate of registry requests, and retry requests that fail with transient errors
+    using exponential backoff with jitter. When the registry reports that the rate limit is
+    exceeded, all requests wait until the time the registry asks for, or the backoff delay if
+    it does not say
+    """
+
+    def __init__(
+        self,
+        rate=0,
+        retries=DEFAULT_RETRIES,
+        base_delay=BASE_DELAY,
+        max_delay=MAX_DELAY,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        """
+        Initialize a PullLimiter
+
+        :param rate: maximum number of requests per minute. If 0, requests are not limited
+        :param retries: maximum number of times to retry a request
+        :param base_delay: delay in seconds before the first retry
+        :param max_delay: maximum delay in seconds before a retry
+        :param clock: function that returns the current time in seconds
+        :param sleep: function that waits for the specified number of seconds
+        """
+        self.retries = retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._sleep = sleep
+        self._bucket = TokenBucket(rate / 60, clock=clock, sleep=sleep)
+
+    @property
+    def rate(self):
+        return self._bucket.rate * 60
+
+    @rate.setter
+    def rate(self, value):
+        self._bucket.rate = value / 60
+
+    def call(self, func, description):
+        """
+        Call a function that makes a registry request within the rate limit, retrying it if it
+        fails with a transient error
+
+        :param func: the function to call
+        :param description: description of the request to display when retrying
+        :return: the return value of the function
+        """
+        attempt = 0
+        while True:
+            self._bucket.acquire()
+            try:
+                return func()
+            except Exception as e:
+                if attempt >= self.retries or not is_transient_error(e):
+                    raise
+
+                delay = self._get_backoff_delay(attempt)
+                if is_rate_limit_error(e):
+                    retry_after = get_retry_after(e)
+                    if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+                        raise
+
+                    delay = max(delay, retry_after or 0)
+                    self._bucket.pause(delay)
+                else:
+                    self._sleep(delay)
+
+                attempt += 1
+                print(
+                    f"Retrying {description} in {delay:.1f}s "
+                    f"(attempt {attempt} of {self.retries}): {e}",
+                    flush=True,
+                )
+
+    def _get_backoff_delay(self, attempt):
+        delay = min(self._max_delay, self._base_delay * 2**attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_transient_error(error):
+    """
+    Determine if a registry request might succeed if it is retried
+
+    :param error: the exception raised by the request
+    :return: True if the error is transient, False otherwise
+    """
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+
+    if isinstance(error, docker.errors.NotFound) or not isinstance(error, docker.errors.APIError):
+        return False
+
+    return (
+        error.status_code in TRANSIENT_STATUS_CODES
+        or is_rate_limit_error(error)
+        or bool(TRANSIENT_REGEX.search(str(error)))
+    )
+
+
+def is_rate_limit_error(error):
+    """
+    Determine if a registry request failed because the rate limit was exceeded
+
+    :param error: the exception raised by the request
+    :return: True if the rate limit was exceeded, False otherwise
+    """
+    return isinstance(error, docker.errors.APIError) and (
+        error.status_code == 429 or bool(RATE_LIMIT_REGEX.search(str(error)))
+    )
+
+
+def get_retry_after(error):
+    """
+    Get how long the registry asked to wait before the next request from the headers of the
+    response. The ``Retry-After`` header is used if it is present. Otherwise, if the
+    ``RateLimit-Remaining`` header shows that there are no requests left, the length of the
+    rate limit window is used. If the headers do not say, such as for an error in the stream of
+    a pull, the wait is taken from a ``retry-after`` in the error message
+
+    :param error: the exception raised by the request
+    :return: the number of seconds to wait if the headers or message say, None otherwise
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+
+        try:
+            return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+
+    remaining = headers.get("RateLimit-Remaining")
+    if remaining:
+        count, _, window = remaining.partition(";w=")
+        try:
+            if int(count) <= 0 and window:
+                return float(window)
+        except ValueError:
+            pass
+
+    return _get_retry_after_from_message(str(error))
+
+
+def _get_retry_after_from_message(message):
+    match = RETRY_AFTER_MESSAGE_REGEX.search(message)
+    if match is None:
+        return None
+
+    try:
+        parts = DURATION_PART_REGEX.findall(match.group(1))
+        if not parts:
+            return float(match.group(1))
+
+        return sum(float(value) * DURATION_UNITS[unit] for value, unit in parts)
+    except ValueError:
+        return None
+
+
+def get_pull_stream_error(chunk):
+    """
+    Get the exception for an error reported in the stream of a pull. The stream has already
+    started, so the status code of the registry is only known if the daemon includes it in the
+    details of the error
+
+    :param chunk: the decoded chunk of the stream that has the error
+    :return: the exception
+    """
+    code = (chunk.get("errorDetail") or {}).get("code")
+    if not isinstance(code, int) or code < 400:
+        return docker.errors.APIError(chunk["error"])
+
+    response = requests.Response()
+    response.status_code = code
+    response.url = PULL_URL
+    try:
+        response.reason = HTTPStatus(code).phrase
+    except ValueError:
+        pass
+
+    return docker.errors.APIError(chunk["error"], response=response, explanation=chunk["error"])
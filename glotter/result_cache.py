@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict
+from functools import cache
+
+import pytest
+
+from glotter.containerfactory import get_container_factory
+from glotter.settings import get_settings
+from glotter.source import get_project_sources
+from glotter.test_generator import TestGenerator
+from glotter.utils import get_cache_dir
+
+INCREMENTAL_ENV_VAR = "GLOTTER_INCREMENTAL"
+
+
+@cache
+def get_result_cache():
+    """
+    Get ResultCache as a singleton
+    """
+    return ResultCache(enabled=os.environ.get(INCREMENTAL_ENV_VAR) == "1")
+
+
+class ResultCache:
+    """
+    Persistent on-disk store of passed tests. The key of each entry is made up of the source
+    contents, the container info of the source, the image ID, and the definition of the test
+    """
+
+    def __init__(self, enabled=False, cache_dir=None):
+        """
+        Initialize a ResultCache
+
+        :param enabled: whether the cache is used
+        :param cache_dir: directory in which to store the cache. If not specified, the
+            ``results`` directory in the glotter cache is used
+        """
+        self.enabled = enabled
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self):
+        if self._cache_dir is None:
+            self._cache_dir = get_cache_dir("results")
+
+        return self._cache_dir
+
+    def get_key(self, source, test_obj, pytest_id=""):
+        """
+        Get the cache key for a test of a source. The image is not pulled
+
+        :param source: the source being tested
+        :param test_obj: the test
+        :param pytest_id: the pytest parameter ID of the test from
+            :meth:`AutoGenTest.get_pytest_ids`
+        :return: the cache key if the image is found locally, None otherwise
+        """
+        factory = get_container_factory()
+        container_info = source.test_info.container_info
+        image_digest = factory.get_image_digest(container_info, pull=False)
+        if image_digest is None:
+            return None
+
+        key_data = "\0".join(
+            [
+                factory.get_source_digest(source),
+                json.dumps(asdict(container_info), sort_keys=True),
+                image_digest,
+                test_obj.model_dump_json(),
+                pytest_id,
+            ]
+        )
+        return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+    def get_node_keys(self):
+        """
+        Get the cache keys of all generated tests for the sources that match the source filter
+
+        :return: a dict where the key is the pytest node ID and the value is the cache key
+        """
+        node_keys = {}
+        for project_type, project in get_settings().projects.items():
+            if not project.tests:
+                continue
+
+            test_generator = TestGenerator(project_type, project)
+            for source in get_project_sources(project_type):
+                for test_obj in project.tests.values():
+                    for pytest_id, _ in test_obj.get_pytest_ids():
+                        key = self.get_key(source, test_obj, pytest_id)
+                        if key is not None:
+                            node_id = test_generator.get_node_id(test_obj, source, pytest_id)
+                            node_keys[node_id] = key
+
+        return node_keys
+
+    def is_passed(self, key):
+        """
+        Check if a test passed the last time it ran
+
+        :param key: the cache key
+        :return: True if the test passed, False otherwise
+        """
+        return os.path.exists(self._get_path(key))
+
+    def record_pass(self, key):
+        """
+        Record that a test passed
+
+        :param key: the cache key
+        """
+        with open(self._get_path(key), "w", encoding="utf-8"):
+            pass
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+
+class ResultCachePlugin:
+    """
+    pytest plugin that deselects generated tests that passed before and records the tests
+    that pass
+    """
+
+    def __init__(self, result_cache):
+        self._result_cache = result_cache
+        self._node_keys = {}
+        self._cached = []
+
+    def pytest_sessionstart(self, session):
+        self._node_keys = self._result_cache.get_node_keys()
+        self._cached = [
+            node_id for node_id, key in self._node_keys.items() if self._result_cache.is_passed(key)
+        ]
+
+    def pytest_collection_modifyitems(self, config, items):
+        cached = set(self._cached)
+        deselected = [item for item in items if item.nodeid in cached]
+        if deselected:
+            items[:] = [item for item in items if item.nodeid not in cached]
+            config.hook.pytest_deselected(items=deselected)
+
+    def pytest_runtest_logreport(self, report):
+        key = self._node_keys.get(report.nodeid)
+        if key is not None and report.when == "call" and report.passed:
+            self._result_cache.record_pass(key)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if not self._cached:
+            return
+
+        terminalreporter.section("cached passes")
+        if terminalreporter.verbosity > 0:
+            for node_id in self._cached:
+                terminalreporter.write_line(f"{node_id} CACHED PASS")
+
+        terminalreporter.write_line(f"{len(self._cached)} cached passed")
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_sessionfinish(self, session):
+        # All tests that were selected passed before
+        if self._cached and session.exitstatus == pytest.ExitCode.NO_TESTS_COLLECTED:
+            session.exitstatus = pytest.ExitCode.OK
+
+
+def pytest_configure(config):
+    result_cache = get_result_cache()
+    if result_cache.enabled:
+        config.pluginmanager.register(ResultCachePlugin(result_cache), "glotter_result_cache")
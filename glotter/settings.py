@@ -47,6 +47,10 @@ class Settings:
     def project_root(self):
         return self._project_root
 
+    @property
+    def yml_path(self):
+        return self._parser.yml_path
+
     @property
     def source_root(self):
         return self._source_root
@@ -71,6 +75,13 @@ class Settings:
 
         if project_type not in self._test_mappings:
             self._test_mappings[project_type] = []
+
+        # Replace the function if its module is imported again
+        self._test_mappings[project_type] = [
+            mapping
+            for mapping in self._test_mappings[project_type]
+            if (mapping.__module__, mapping.__qualname__) != (func.__module__, func.__qualname__)
+        ]
         self._test_mappings[project_type].append(func)
 
     def verify_project_type(self, name):
@@ -1,41 +1,182 @@
+import hashlib
+import json
+import os
+import time
+from argparse import Namespace
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import wait
 from functools import lru_cache
 
+import docker
+import yaml
 from glotter_core.source import CoreSource, categorize_sources
+from jinja2 import BaseLoader, Environment
 
+from glotter.build_cache import get_build_cache
 from glotter.containerfactory import get_container_factory
+from glotter.exec_driver import get_driver_command, parse_driver_output
 from glotter.settings import get_settings
-from glotter.utils import error_and_exit
+from glotter.stragglers import ExecRecord, record_exec
+from glotter.utils import atomic_write, call_in_thread, error_and_exit, get_cache_dir
 
 BAD_SOURCES = "__bad_sources__"
+SINGLE_EXEC_ENV_VAR = "GLOTTER_SINGLE_EXEC"
+SOURCE_FILTER_ENV_VAR = "GLOTTER_SOURCE_FILTER"
+EXEC_TIMEOUT_ENV_VAR = "GLOTTER_EXEC_TIMEOUT"
+DEFAULT_EXEC_TIMEOUT = 300
+DEFAULT_BUILD_TIMEOUT = 1800
+
+# Time to wait for a command to stop after its processes are killed
+EXEC_KILL_TIMEOUT = 10
+
+_prefetched_results = {}
+
+# Build parameters and container of each source that was built so that the source can be built
+# again if its container is replaced
+_built_containers = {}
 
 
 class Source(CoreSource):
-    """Metadata about a source file"""
+    """Metadata about a source file
+
+    :ivar cache_dirs: directories inside the container that are backed by persistent cache
+        volumes, from the ``cache`` item of the ``container`` section of ``testinfo.yml``
+    :ivar timeout: maximum number of seconds that a command may run in the container, from
+        the ``timeout`` item of the ``container`` section of ``testinfo.yml``. If None, the
+        default from :func:`get_default_exec_timeout` is used
+    """
+
+    def __post_init__(self):
+        test_info_string = render_test_info(self.test_info, self)
+        super().__post_init__()
+        object.__setattr__(self, "cache_dirs", get_cache_dirs(test_info_string))
+        object.__setattr__(self, "timeout", get_timeout(test_info_string))
 
     def __repr__(self):
         return f"Source(name: {self.name}, path: {self.path})"
 
+    @property
+    def test_id(self):
+        """Returns the ID of the source used in test IDs"""
+        return f"{self.language}/{self.name}{self.extension}"
+
     def build(self, params=""):
-        if self.test_info.container_info.build is not None:
-            command = f"{self.test_info.container_info.build} {params}"
-            result = self._container_exec(command)
-            if result[0] != 0:
-                raise RuntimeError(
-                    f'unable to build using cmd "{self.test_info.container_info.build} {params}":\n'
-                    f"{result[1].decode('utf-8')}"
-                )
+        """
+        Build the source. If the build cache is enabled, the build outputs are restored from
+        the cache instead if possible
+
+        :param params: parameters passed to the build command
+        """
+        _built_containers.pop(self.full_path, None)
+        if self.test_info.container_info.build is None:
+            return
+
+        command = self.get_build_command(params)
+        build_cache = get_build_cache()
+        cache_key = build_cache.get_key(self, command) if build_cache.enabled else None
+        if cache_key is not None:
+            factory = get_container_factory()
+            container = factory.get_container(self)
+            if build_cache.restore(cache_key, container, factory.get_source_dir(self)):
+                _built_containers[self.full_path] = (params, container)
+                return
+
+        result = self._container_exec(command, build=True)
+        if result[0] != 0:
+            raise RuntimeError(
+                f'unable to build using cmd "{self.test_info.container_info.build} {params}":\n'
+                f"{result[1].decode('utf-8')}"
+            )
+
+        factory = get_container_factory()
+        if cache_key is not None:
+            build_cache.save(cache_key, factory.get_container(self), factory.get_source_dir(self))
+
+        _built_containers[self.full_path] = (params, factory.get_container(self))
+
+    def get_build_command(self, params=""):
+        """
+        Get the command that builds the source
+
+        :param params: parameters passed to the build command
+        :return: the build command if the source has one, None otherwise
+        """
+        if self.test_info.container_info.build is None:
+            return None
 
-    def run(self, params=None):
+        return f"{self.test_info.container_info.build} {params}"
+
+    def run(self, params=None, timeout=None):
         """
         Run the source and return the output
 
         :param params: input passed to the source as it's run
+        :param timeout: maximum number of seconds that the source may run. If not specified,
+            the timeout of the source is used
         :return: the output of running the source
+        :raises: :exc:`TimeoutError` if the source runs for too long
         """
+        command = self._get_run_command(params)
+        results = _prefetched_results.get(self.full_path, {}).get(command)
+        if not results:
+            return self._container_exec(command, timeout)[1].decode("utf-8")
+
+        _, output, duration = results.popleft()
+        timeout = self._get_exec_timeout(timeout)
+        if timeout is not None and duration is not None and duration > timeout:
+            raise TimeoutError(f'"{command}" timed out after {timeout:g} seconds')
+
+        return output.decode("utf-8")
+
+    def prefetch(self, params_list, timeouts=None):
+        """
+        If single exec mode is enabled, run the source for each of the specified parameters
+        in a single exec. Subsequent calls to :meth:`run` use these results in order instead
+        of running the source again. If the results cannot be obtained, :meth:`run` runs the
+        source as usual. The single exec may run for as long as all of the inputs together,
+        and :meth:`run` raises :exc:`TimeoutError` for an input that ran for longer than its
+        own timeout
+
+        :param params_list: list of inputs passed to the source. Inputs that are run more than
+            once are repeated
+        :param timeouts: maximum number of seconds that the source may run for each input. If
+            not specified, or None for an input, the timeout of the source is used
+        """
+        _prefetched_results.pop(self.full_path, None)
+        if os.environ.get(SINGLE_EXEC_ENV_VAR) != "1" or not params_list:
+            return
+
+        commands = [self._get_run_command(params) for params in params_list]
+        timeouts = [
+            self._get_exec_timeout(timeout) for timeout in (timeouts or [None] * len(commands))
+        ]
+        driver_command, marker = get_driver_command(commands)
+        try:
+            exit_code, output = self._container_exec(
+                driver_command,
+                timeout=None if None in timeouts else sum(timeouts),
+                description=f"single exec of {len(commands)} inputs",
+            )
+        except (TimeoutError, docker.errors.APIError):
+            return
+
+        results = parse_driver_output(output, marker, len(commands)) if exit_code == 0 else None
+        if results is None:
+            return
+
+        prefetched_results = {}
+        for command, result in zip(commands, results):
+            prefetched_results.setdefault(command, deque()).append(result)
+
+        _prefetched_results[self.full_path] = prefetched_results
+
+    def _get_exec_timeout(self, timeout=None):
+        return timeout or self.timeout or get_default_exec_timeout()
+
+    def _get_run_command(self, params):
         params = params or ""
-        command = f"{self.test_info.container_info.cmd} {params}"
-        result = self._container_exec(command)
-        return result[1].decode("utf-8")
+        return f"{self.test_info.container_info.cmd} {params}"
 
     def exec(self, command):
         """
@@ -47,24 +188,146 @@ class Source(CoreSource):
         result = self._container_exec(command)
         return result[1].decode("utf-8")
 
-    def _container_exec(self, command):
+    def _container_exec(self, command, timeout=None, description=None, build=False):
         """
-        Run a command inside the container for a source
+        Run a command inside the container for a source. If the command runs for too long,
+        its processes are killed. If they cannot be killed, the container is removed instead.
+        If the source was built in a container that was removed, it is built again in its new
+        container first. The command is recorded for the straggler report
 
         :param command: command to run
+        :param timeout: maximum number of seconds that the command may run. If not specified,
+            the timeout of the source is used
+        :param description: description of the command for the straggler report. If not
+            specified, the command is used
+        :param build: whether the command builds the source. If so, and the source does not
+            specify a timeout, the default build timeout is used instead of the default exec
+            timeout
         :return:  the exit code and output of the command
+        :raises: :exc:`TimeoutError` if the command runs for too long
         """
-        container = get_container_factory().get_container(self)
-        return container.exec_run(
-            cmd=command,
-            detach=False,
-            workdir="/src",
-        )
+        factory = get_container_factory()
+        container = factory.get_container(self)
+        built = _built_containers.get(self.full_path)
+        if built is not None and built[1] is not container:
+            self.build(built[0])
+            container = factory.get_container(self)
+
+        default_timeout = get_default_build_timeout() if build else get_default_exec_timeout()
+        timeout = timeout or self.timeout or default_timeout
+        description = description or command
+        start_time = time.monotonic()
+        timed_out = False
+        try:
+            kwargs = {"cmd": command, "detach": False, "workdir": factory.get_source_dir(self)}
+            if not timeout:
+                return container.exec_run(**kwargs)
+
+            future = call_in_thread(container.exec_run, **kwargs)
+            try:
+                return future.result(timeout)
+            except FutureTimeoutError:
+                timed_out = True
+
+            if not factory.kill_execs(self) or future not in wait([future], EXEC_KILL_TIMEOUT)[0]:
+                factory.remove_container(self)
+
+            raise TimeoutError(f'"{description}" timed out after {timeout:g} seconds')
+        finally:
+            record_exec(
+                ExecRecord(self.test_id, str(description), time.monotonic() - start_time, timed_out)
+            )
 
     def cleanup(self):
+        _prefetched_results.pop(self.full_path, None)
+        _built_containers.pop(self.full_path, None)
         get_container_factory().cleanup(self)
 
 
+def get_default_exec_timeout():
+    """
+    Get the maximum number of seconds that a command may run in a container if the source and
+    the test do not specify a timeout
+
+    :return: the timeout in seconds, or None if there is no timeout
+    """
+    value = os.environ.get(EXEC_TIMEOUT_ENV_VAR)
+    timeout = float(value) if value else DEFAULT_EXEC_TIMEOUT
+    return timeout if timeout > 0 else None
+
+
+def get_default_build_timeout():
+    """
+    Get the maximum number of seconds that a build command may run in a container if the source
+    does not specify a timeout. Builds may take much longer than runs, so this is at least
+    :data:`DEFAULT_BUILD_TIMEOUT`
+
+    :return: the timeout in seconds, or None if there is no timeout
+    """
+    timeout = get_default_exec_timeout()
+    return max(timeout, DEFAULT_BUILD_TIMEOUT) if timeout is not None else None
+
+
+def render_test_info(test_info_string, source):
+    """
+    Render the Jinja2 template in a testinfo file the same way that
+    :meth:`glotter_core.testinfo.TestInfo.from_string` does
+
+    :param test_info_string: contents of a testinfo file
+    :param source: the source that the testinfo file is rendered for
+    :return: the rendered testinfo file
+    """
+    template = Environment(loader=BaseLoader).from_string(test_info_string)
+    return template.render(source=source)
+
+
+@lru_cache
+def _get_container_settings(test_info_string):
+    # Settings that are not part of ContainerInfo are read from the rendered testinfo file
+    # directly
+    return (yaml.safe_load(test_info_string) or {}).get("container") or {}
+
+
+@lru_cache
+def get_cache_dirs(test_info_string):
+    """
+    Get the cache directories from the ``cache`` item of the ``container`` section of a
+    testinfo file. The item is either a single directory or a list of directories
+
+    :param test_info_string: contents of a testinfo file rendered with :func:`render_test_info`
+    :return: tuple of the absolute paths of the cache directories in the container
+    :raises: :exc:`ValueError` if the cache directories are invalid
+    """
+    cache_dirs = _get_container_settings(test_info_string).get("cache") or []
+    if isinstance(cache_dirs, str):
+        cache_dirs = [cache_dirs]
+
+    if not isinstance(cache_dirs, list) or not all(
+        isinstance(cache_dir, str) and cache_dir.startswith("/") for cache_dir in cache_dirs
+    ):
+        raise ValueError(f"Cache directories must be absolute paths: {cache_dirs!r}")
+
+    return tuple(dict.fromkeys(cache_dir.rstrip("/") or "/" for cache_dir in cache_dirs))
+
+
+def get_timeout(test_info_string):
+    """
+    Get the timeout from the ``timeout`` item of the ``container`` section of a testinfo file
+
+    :param test_info_string: contents of a testinfo file rendered with :func:`render_test_info`
+    :return: the maximum number of seconds that a command may run, or None if not specified
+    :raises: :exc:`ValueError` if the timeout is invalid
+    """
+    timeout = _get_container_settings(test_info_string).get("timeout")
+    if timeout is None:
+        return None
+
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+        raise ValueError(f"Timeout must be a positive number: {timeout!r}")
+
+    return float(timeout)
+
+
 @lru_cache
 def get_sources(path, check_bad_sources=False):
     """
@@ -131,6 +394,104 @@ def filter_sources(args, sources):
     return filtered_sources_by_type
 
 
+def set_source_filter(args, sources_by_type=None):
+    """
+    Set the filter used by :func:`get_project_sources`. The filter is stored in an
+    environment variable so that pytest-xdist workers use the same filter. The paths of the
+    selected sources can be too long for an environment variable, so they are written to a
+    file in the glotter cache, and only the path of the file is stored
+
+    :param args: Arguments indicating what to filter on. If there is nothing to filter on,
+        the filter is cleared
+    :param sources_by_type: a dict where the key is the ProjectType and the value is a list of
+        Source objects. If specified, only these sources match the filter
+    """
+
+    source_filter = {}
+    if args.language or args.project or args.source or sources_by_type is not None:
+        language = args.language
+        if isinstance(language, set):
+            language = sorted(language)
+
+        source_filter = {
+            "language": language,
+            "project": args.project,
+            "source": args.source,
+            "paths_file": None,
+        }
+        if sources_by_type is not None:
+            source_filter["paths_file"] = _write_source_filter_paths(
+                sorted(
+                    source.full_path for sources in sources_by_type.values() for source in sources
+                )
+            )
+
+    os.environ[SOURCE_FILTER_ENV_VAR] = json.dumps(source_filter) if source_filter else ""
+
+
+def get_source_filter():
+    """
+    Get the filter set by :func:`set_source_filter`
+
+    :return: Arguments indicating what to filter on if there is a filter, None otherwise
+    """
+
+    value = os.environ.get(SOURCE_FILTER_ENV_VAR)
+    if not value:
+        return None
+
+    source_filter = json.loads(value)
+    if isinstance(source_filter["language"], list):
+        source_filter["language"] = set(source_filter["language"])
+
+    paths_file = source_filter.pop("paths_file")
+    source_filter["paths"] = (
+        _read_source_filter_paths(paths_file) if paths_file is not None else None
+    )
+    return Namespace(**source_filter)
+
+
+def _write_source_filter_paths(paths):
+    contents = json.dumps(paths).encode("utf-8")
+    path = os.path.join(
+        get_cache_dir("source-filters"), f"{hashlib.sha256(contents).hexdigest()}.json"
+    )
+    with atomic_write(path, "wb") as f:
+        f.write(contents)
+
+    return path
+
+
+@lru_cache
+def _read_source_filter_paths(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return frozenset(json.load(f))
+
+
+def get_project_sources(project_type):
+    """
+    Get the sources of a project that match the filter set by :func:`set_source_filter`
+
+    :param project_type: the project type
+    :return: list of matching Source objects
+    """
+
+    sources = get_sources(get_settings().source_root).get(project_type) or []
+    source_filter = get_source_filter()
+    if source_filter is None:
+        return sources
+
+    if source_filter.project and source_filter.project != project_type:
+        return []
+
+    paths = source_filter.paths
+    return [
+        source
+        for source in sources
+        if _matches_source(source_filter, source) and (paths is None or source.full_path in paths)
+    ]
+
+
 def _matches_source(args, source):
     if args.language:
         if isinstance(args.language, set):
@@ -0,0 +1,113 @@
+import threading
+from dataclasses import asdict, dataclass
+
+import pytest
+
+STRAGGLER_COUNT = 10
+REPORT_ATTRIBUTE = "glotter_execs"
+
+_records = []
+_records_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ExecRecord:
+    """An exec that was run for a source
+
+    :ivar source: test ID of the source
+    :ivar command: description of the command that was run
+    :ivar duration: duration of the exec in seconds
+    :ivar timed_out: whether the exec was killed because it timed out
+    """
+
+    source: str
+    command: str
+    duration: float
+    timed_out: bool = False
+
+
+def record_exec(record):
+    """
+    Record an exec for the straggler report
+
+    :param record: the ExecRecord to record
+    """
+    with _records_lock:
+        _records.append(record)
+
+
+def pop_records():
+    """
+    Get the execs recorded since the last call and forget them
+
+    :return: list of ExecRecord objects
+    """
+    with _records_lock:
+        records = list(_records)
+        _records.clear()
+
+    return records
+
+
+def get_straggler_report(records, count=STRAGGLER_COUNT):
+    """
+    Get a report of the slowest execs and the execs that were killed because they timed out
+
+    :param records: iterable of ExecRecord objects
+    :param count: number of slowest execs to report
+    :return: lines of the report, or an empty list if there are no records
+    """
+    records = list(records)
+    if not records:
+        return []
+
+    lines = [f"Slowest {min(count, len(records))} execs:"]
+    slowest = sorted(records, key=lambda record: record.duration, reverse=True)[:count]
+    lines += [_format_record(record) for record in slowest]
+    timed_out = [record for record in records if record.timed_out]
+    if timed_out:
+        lines.append(f"Killed {len(timed_out)} execs that timed out:")
+        lines += [_format_record(record) for record in timed_out]
+
+    return lines
+
+
+def _format_record(record):
+    return f"{record.duration:10.2f}s  {record.source}  {record.command}"
+
+
+class StragglerPlugin:
+    """
+    pytest plugin that reports the slowest execs and the execs that timed out at the end of
+    the test session. Workers attach the execs of each test phase to its report so that the
+    pytest-xdist controller can report the execs of all workers
+    """
+
+    def __init__(self):
+        self._records = []
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        records = pop_records()
+        if records:
+            # Extra report attributes are sent to the pytest-xdist controller with the report
+            setattr(
+                outcome.get_result(),
+                REPORT_ATTRIBUTE,
+                [asdict(record) for record in records],
+            )
+
+    def pytest_runtest_logreport(self, report):
+        self._records += [ExecRecord(**record) for record in getattr(report, REPORT_ATTRIBUTE, [])]
+
+    def pytest_terminal_summary(self, terminalreporter):
+        lines = get_straggler_report(self._records)
+        if lines:
+            terminalreporter.section("glotter stragglers")
+            for line in lines:
+                terminalreporter.write_line(line)
+
+
+def pytest_configure(config):
+    config.pluginmanager.register(StragglerPlugin(), "glotter_stragglers")
@@ -1,39 +1,188 @@
+import os
 import re
 import sys
 
 import pytest
 
+from glotter.batch_build import build_sources
+from glotter.build_cache import BUILD_CACHE_ENV_VAR, get_build_cache
+from glotter.changes import get_changed_sources
+from glotter.containerfactory import (
+    DISK_BUDGET_ENV_VAR,
+    POOL_SIZE_ENV_VAR,
+    SHARED_CONTAINERS_ENV_VAR,
+    get_container_factory,
+)
+from glotter.decorators import unload_fixture_modules
+from glotter.history import HISTORY_ENV_VAR
+from glotter.native_runner import run_native_tests
+from glotter.result_cache import INCREMENTAL_ENV_VAR, get_result_cache
 from glotter.settings import get_settings
-from glotter.source import filter_sources, get_sources
-from glotter.test_generator import generate_tests
+from glotter.source import (
+    EXEC_TIMEOUT_ENV_VAR,
+    SINGLE_EXEC_ENV_VAR,
+    filter_sources,
+    get_sources,
+    set_source_filter,
+)
+from glotter.test_generator import TestGenerator, generate_tests
 from glotter.utils import error_and_exit
 
 
 def test(args):
+    _validate_args(args)
+    _set_test_options(args)
+    sources_by_type = None
+    selected_sources_by_type = None
+    if args.changed_since:
+        all_sources_by_type = filter_sources(args, get_sources(get_settings().source_root))
+        sources_by_type = get_changed_sources(args.changed_since, all_sources_by_type)
+        if not sources_by_type:
+            print(f"No sources are affected by changes since {args.changed_since}")
+            sys.exit(0)
+
+        # There is no need to select sources if all of them are affected
+        if _count_sources(sources_by_type) < _count_sources(all_sources_by_type):
+            selected_sources_by_type = sources_by_type
+
+    set_source_filter(args, selected_sources_by_type)
+    if args.batch_build:
+        _batch_build(args, sources_by_type)
+
+    if args.engine == "native":
+        _run_native_tests_and_exit(args, sources_by_type)
+
     generate_tests()
-    test_args = ["-n", "auto"] if args.parallel else []
-    if not (args.language or args.project or args.source):
-        _run_pytest_and_exit(*test_args)
+    test_args = ["-n", "auto", "-p", "glotter.xdist_scheduling"] if args.parallel else []
+    test_args += ["-p", "glotter.stragglers", "-p", "glotter.container_cleanup"]
+    if args.junit_xml:
+        test_args.append(f"--junitxml={args.junit_xml}")
 
-    all_tests = _collect_tests()
-    sources_by_type = filter_sources(args, get_sources(get_settings().source_root))
-    for project_type, sources in sources_by_type.items():
-        for source in sources:
-            test_args += _get_tests(project_type, all_tests, source)
+    if args.incremental:
+        test_args += ["-p", "glotter.result_cache"]
+
+    if args.history:
+        test_args += ["-p", "glotter.history"]
+
+    if args.disk_budget:
+        test_args += ["-p", "glotter.pending_images"]
 
-    if not test_args:
+    if sources_by_type is None:
+        if not (args.language or args.project or args.source):
+            _run_pytest_and_exit(*test_args)
+
+        sources_by_type = filter_sources(args, get_sources(get_settings().source_root))
+
+    tests = _get_selected_tests(sources_by_type)
+    if not tests:
         error_and_exit("No tests were found")
 
+    test_args += tests
+
     _run_pytest_and_exit(*test_args)
 
 
+def _validate_args(args):
+    if args.pool_size < 0:
+        error_and_exit("Pool size must be at least 0")
+
+    if args.concurrency is not None and args.concurrency < 1:
+        error_and_exit("Concurrency must be at least 1")
+
+    if args.exec_timeout is not None and args.exec_timeout < 0:
+        error_and_exit("Exec timeout must be at least 0")
+
+    if args.json_report and args.engine != "native":
+        error_and_exit("--json-report requires --engine native")
+
+
+def _set_test_options(args):
+    # Environment variables are for pytest-xdist workers
+    os.environ[POOL_SIZE_ENV_VAR] = str(args.pool_size)
+    get_container_factory().pool_size = args.pool_size
+    os.environ[SHARED_CONTAINERS_ENV_VAR] = "1" if args.shared_containers else ""
+    get_container_factory().shared = args.shared_containers
+    os.environ[DISK_BUDGET_ENV_VAR] = str(args.disk_budget or 0)
+    get_container_factory().disk_budget = args.disk_budget or 0
+    # Batch builds hand the build outputs to the tests through the build cache
+    build_cache = args.build_cache or args.batch_build
+    os.environ[BUILD_CACHE_ENV_VAR] = "1" if build_cache else ""
+    get_build_cache().enabled = build_cache
+    os.environ[SINGLE_EXEC_ENV_VAR] = "1" if args.single_exec else ""
+    os.environ[EXEC_TIMEOUT_ENV_VAR] = "" if args.exec_timeout is None else str(args.exec_timeout)
+    os.environ[INCREMENTAL_ENV_VAR] = "1" if args.incremental else ""
+    get_result_cache().enabled = args.incremental
+    os.environ[HISTORY_ENV_VAR] = args.history or ""
+
+
+def _get_sources_to_test(args, sources_by_type=None):
+    if sources_by_type is None:
+        sources_by_type = get_sources(get_settings().source_root)
+        if args.language or args.project or args.source:
+            sources_by_type = filter_sources(args, sources_by_type)
+
+    return sources_by_type
+
+
+def _batch_build(args, sources_by_type=None):
+    sources_by_language = {}
+    for sources in _get_sources_to_test(args, sources_by_type).values():
+        for source in sources:
+            sources_by_language.setdefault(source.language, []).append(source)
+
+    build_sources(sources_by_language)
+
+
+def _run_native_tests_and_exit(args, sources_by_type=None):
+    sources_by_type = _get_sources_to_test(args, sources_by_type)
+    concurrency = args.concurrency or ((os.cpu_count() or 1) if args.parallel else 1)
+    code = run_native_tests(
+        sources_by_type,
+        concurrency=concurrency,
+        junit_xml=args.junit_xml,
+        json_report=args.json_report,
+        history_path=args.history,
+    )
+    sys.exit(code)
+
+
+def _get_selected_tests(sources_by_type):
+    """
+    Get the pytest arguments that select all the tests for the specified sources. Generated
+    tests are selected by module since project fixtures only use the sources that match the
+    source filter. Only projects without generated tests need a pytest collection pass to find
+    their tests
+
+    :param sources_by_type: a dict where the key is the ProjectType and the value is a list of
+        all the Source objects of that project to test
+    :return: list of pytest module paths and node IDs
+    """
+
+    settings = get_settings()
+    all_tests = None
+    tests = []
+    for project_type, sources in sources_by_type.items():
+        project = settings.projects.get(project_type)
+        if project is not None and project.tests:
+            test_generator = TestGenerator(project_type, project)
+            tests.append(test_generator.test_module_path.replace(os.sep, "/"))
+            continue
+
+        if all_tests is None:
+            all_tests = _collect_tests()
+
+        for source in sources:
+            tests += _get_tests(project_type, all_tests, source)
+
+    return tests
+
+
 def _get_tests(project_type, all_tests, src=None):
     test_functions = get_settings().get_test_mapping_name(project_type)
     tests = []
     for test_func in test_functions:
         if src is not None:
-            test_id = f"{src.language}/{src.name}{src.extension}"
-            pattern = rf"^(\w/?)*\.py::{test_func}\[{re.escape(test_id)}(-.*)?\]$"
+            pattern = rf"^(\w/?)*\.py::{test_func}\[{re.escape(src.test_id)}(-.*)?\]$"
         else:
             pattern = rf"^(\w/?)*\.py::{test_func}\[.+\]$"
         tests.extend([tst for tst in all_tests if re.fullmatch(pattern, tst) is not None])
@@ -42,6 +191,7 @@ def _get_tests(project_type, all_tests, src=None):
 
 def _run_pytest_and_exit(*args):
     args = ["-v"] + list(args)
+    unload_fixture_modules()
     code = pytest.main(args=args)
     sys.exit(code)
 
@@ -58,5 +208,10 @@ class TestCollectionPlugin:
 def _collect_tests():
     print("============================= collect test totals ==============================")
     plugin = TestCollectionPlugin()
+    unload_fixture_modules()
     pytest.main(["-qq", "--collect-only"], plugins=[plugin])
     return plugin.collected
+
+
+def _count_sources(sources_by_type):
+    return sum(len(sources) for sources in sources_by_type.values())
@@ -4,6 +4,7 @@ import subprocess
 import tempfile
 
 from glotter.settings import get_settings
+from glotter.utils import quote
 
 AUTO_GEN_TEST_PATH = os.path.join("test", "generated")
 
@@ -69,28 +70,68 @@ class TestGenerator:
             test_code += "".join(
                 constant_variable for constant_variable in sorted(constant_variables)
             )
+            test_code += self._get_run_params()
 
         return test_code
 
+    def _get_run_params(self):
+        run_params = [
+            "None" if run_param is None else quote(run_param)
+            for test_obj in self.project.tests.values()
+            for run_param in test_obj.get_run_params()
+        ]
+        test_code = f"RUN_PARAMS = [{', '.join(run_params)}]\n"
+        if self._has_timeouts():
+            run_timeouts = [
+                repr(test_obj.timeout)
+                for test_obj in self.project.tests.values()
+                for _ in test_obj.get_run_params()
+            ]
+            test_code += f"RUN_TIMEOUTS = [{', '.join(run_timeouts)}]\n"
+
+        return test_code
+
+    def _has_timeouts(self):
+        return any(test_obj.timeout is not None for test_obj in self.project.tests.values())
+
     def _get_project_fixture(self):
+        prefetch = ""
+        if self.project.requires_parameters:
+            prefetch_args = "RUN_PARAMS, RUN_TIMEOUTS" if self._has_timeouts() else "RUN_PARAMS"
+            prefetch = f"request.param.prefetch({prefetch_args})\n        "
+
         return f"""\
 PROJECT_NAME="{self.project_name}"
 @project_fixture(PROJECT_NAME)
 def {self.long_project_name}(request):
     try:
         request.param.build()
-        yield request.param
+        {prefetch}yield request.param
     finally:
         request.param.cleanup()
 """
 
+    @property
+    def test_module_path(self):
+        return os.path.join(AUTO_GEN_TEST_PATH, f"test_{self.long_project_name}.py")
+
+    def get_node_id(self, test_obj, source, pytest_id=""):
+        """
+        Get the pytest node ID of a generated test
+
+        :param test_obj: the test
+        :param source: the source being tested
+        :param pytest_id: the pytest parameter ID of the test from
+            :meth:`AutoGenTest.get_pytest_ids`
+        :return: the pytest node ID
+        """
+        module_path = self.test_module_path.replace(os.sep, "/")
+        test_id = "-".join(filter(None, [source.test_id, pytest_id]))
+        return f"{module_path}::test_{test_obj.name}[{test_id}]"
+
     def write_tests(self, test_code):
         os.makedirs(AUTO_GEN_TEST_PATH, exist_ok=True)
-        with open(
-            os.path.join(AUTO_GEN_TEST_PATH, f"test_{self.long_project_name}.py"),
-            "w",
-            encoding="utf-8",
-        ) as f:
+        with open(self.test_module_path, "w", encoding="utf-8") as f:
             f.write(test_code)
 
 
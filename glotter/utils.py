@@ -1,4 +1,24 @@
+import os
+import re
 import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CACHE_DIR_ENV_VAR = "GLOTTER_CACHE_DIR"
+TEMP_FILE_PREFIX = "glotter-tmp-"
+TEMP_FILE_REGEX = re.compile(rf"^{re.escape(TEMP_FILE_PREFIX)}(\d+)-")
+FILE_LOCK_POLL_INTERVAL = 0.1
+SIZE_REGEX = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*$", re.IGNORECASE)
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
 
 
 def quote(value: str) -> str:
@@ -39,6 +59,185 @@ def indent(value: str, num_spaces: int) -> str:
     return "".join(f"{spaces}{line}" for line in value.splitlines(keepends=True))
 
 
+def call_in_thread(func, *args, **kwargs):
+    """
+    Call a function in a new daemon thread so that the caller can stop waiting for it
+
+    :param func: function to call
+    :param args: positional arguments passed to the function
+    :param kwargs: keyword arguments passed to the function
+    :return: a Future for the result of the function
+    """
+
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
 def error_and_exit(msg):
     print(msg)
     sys.exit(1)
+
+
+def get_cache_dir(*subdirs: str) -> str:
+    """
+    Get a directory in the glotter cache, creating it if necessary. The cache is located
+    in the directory specified by the ``GLOTTER_CACHE_DIR`` environment variable if set.
+    Otherwise, it is located in ``glotter`` under ``$XDG_CACHE_HOME`` or ``~/.cache``
+
+    :param subdirs: Subdirectories within the cache
+    :return: Path to the cache directory
+    """
+
+    cache_root = os.environ.get(CACHE_DIR_ENV_VAR)
+    if not cache_root:
+        xdg_cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        cache_root = os.path.join(xdg_cache_home, "glotter")
+
+    path = os.path.join(cache_root, *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_temp_file_prefix() -> str:
+    """
+    Get the prefix of the temporary files written by this process. The prefix contains the
+    process ID so that the temporary files left behind by a process that crashed can be found
+
+    :return: Prefix for the names of temporary files
+    """
+
+    return f"{TEMP_FILE_PREFIX}{os.getpid()}-"
+
+
+def get_temp_file_pid(filename: str):
+    """
+    Get the ID of the process that wrote a temporary file
+
+    :param filename: Name of the file
+    :return: Process ID if the file is a temporary file written by glotter, None otherwise
+    """
+
+    match = TEMP_FILE_REGEX.match(filename)
+    return int(match.group(1)) if match else None
+
+
+def is_process_running(pid: int) -> bool:
+    """
+    Check if a process on this host is running
+
+    :param pid: Process ID
+    :return: True if the process is running or if it cannot be checked, False otherwise
+    """
+
+    if os.name == "nt":
+        # Signal 0 does not check the process on Windows
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process is owned by another user
+        return True
+
+    return True
+
+
+def parse_size(value: str) -> int:
+    """
+    Parse a size in bytes. The size may have a unit of ``K``, ``M``, ``G``, or ``T``
+    (powers of 1024) with an optional ``B`` or ``iB`` suffix (e.g., ``30G``, ``512MiB``)
+
+    :param value: Size to parse
+    :return: Size in bytes
+    :raises: :exc:`ValueError` if the size is invalid
+    """
+
+    match = SIZE_REGEX.match(value)
+    if match is None:
+        raise ValueError(f'Invalid size: "{value}"')
+
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+@contextmanager
+def atomic_write(path, mode="w"):
+    """
+    Write a file so that readers never see it partially written. The file is written to a
+    temporary file in the same directory, which replaces the file when the context exits. If
+    the context raises an exception, the temporary file is removed and the file is unchanged
+
+    :param path: path of the file to write
+    :param mode: ``"w"`` to write text encoded as UTF-8, or ``"wb"`` to write bytes
+    :return: the temporary file to write to
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=get_temp_file_prefix(), suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else "utf-8") as f:
+            yield f
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def file_lock(path, on_wait=None):
+    """
+    Hold an exclusive lock on a file so that only one process or thread at a time runs the
+    code in the context. The file is created if necessary
+
+    :param path: path of the lock file
+    :param on_wait: function to call if another process or thread holds the lock, before
+        waiting for it to be released
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a+b") as f:
+        if not _try_lock_file(f):
+            if on_wait is not None:
+                on_wait()
+
+            while not _try_lock_file(f):
+                time.sleep(FILE_LOCK_POLL_INTERVAL)
+
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+
+def _try_lock_file(f):
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+
+    return True
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
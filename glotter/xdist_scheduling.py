@@ -0,0 +1,140 @@
+import re
+
+import pytest
+from xdist.scheduler import LoadScopeScheduling
+
+from glotter.settings import get_settings
+from glotter.source import get_sources
+
+NODE_ID_PARAMS_REGEX = re.compile(r"^(?P<path>[^\[]*?)::[^\[]*\[(?P<params>.*)\]$")
+
+
+def get_source_images(sources_by_type):
+    """
+    Get the image used by each source
+
+    :param sources_by_type: a dict where the key is the project type and the value is a list
+        of Source objects
+    :return: a dict where the key is the test ID of the source and the value is the image and
+        tag
+    """
+    images = {}
+    for sources in sources_by_type.values():
+        for source in sources:
+            container_info = source.test_info.container_info
+            images[source.test_id] = f"{container_info.image}:{container_info.tag}"
+
+    return images
+
+
+class ImageAffinityScheduling(LoadScopeScheduling):
+    """
+    pytest-xdist scheduler that keeps the tests of each image on as few workers as possible.
+    The tests of a source in a test module are a single work unit so that the module-scoped
+    project fixture is only set up once. The work units are grouped by the image of the
+    source. A worker is given work units of the images it already started containers for,
+    and when there are none left, it is given the image with the most remaining tests that no
+    other worker is running. Tests that are not for a source are grouped by scope as usual
+    """
+
+    def __init__(self, config, log=None, images=None):
+        """
+        Initialize an ImageAffinityScheduling
+
+        :param config: the pytest config
+        :param log: the pytest-xdist log producer
+        :param images: a dict where the key is the test ID of a source and the value is its
+            image and tag. If not specified, the images of all sources are used
+        """
+        super().__init__(config, log)
+        if images is None:
+            images = get_source_images(get_sources(get_settings().source_root))
+
+        self._images = images
+        self._scopes = {}
+        self._scope_images = {}
+        self._node_images = {}
+        self._units_by_image = None
+        self._image_weights = None
+
+    def remove_node(self, node):
+        self._node_images.pop(node, None)
+
+        # Work units of a crashed node are put back in the work queue, so index it again
+        self._units_by_image = None
+        return super().remove_node(node)
+
+    def _split_scope(self, nodeid):
+        scope = self._scopes.get(nodeid)
+        if scope is None:
+            scope, image = self._get_scope_and_image(nodeid)
+            self._scopes[nodeid] = scope
+            self._scope_images[scope] = image
+
+        return scope
+
+    def _get_scope_and_image(self, nodeid):
+        match = NODE_ID_PARAMS_REGEX.match(nodeid)
+        if match:
+            # The parameter ID is the test ID of the source, optionally followed by "-" and the
+            # ID of the test parameters. Test IDs can contain "-", so try the longest one first
+            params = match.group("params")
+            ends = [len(params)] + [i for i in range(len(params) - 1, 0, -1) if params[i] == "-"]
+            for end in ends:
+                test_id = params[:end]
+                if test_id in self._images:
+                    return f"{match.group('path')}::[{test_id}]", self._images[test_id]
+
+        return super()._split_scope(nodeid), None
+
+    def _index_work_units(self):
+        self._units_by_image = {}
+        self._image_weights = {}
+        for scope, work_unit in self.workqueue.items():
+            image = self._scope_images[scope]
+            self._units_by_image.setdefault(image, []).append(scope)
+            self._image_weights[image] = self._image_weights.get(image, 0) + len(work_unit)
+
+        # Units are popped from the end, so the largest unit of each image is last
+        for scopes in self._units_by_image.values():
+            scopes.sort(key=lambda scope: len(self.workqueue[scope]))
+
+    def _get_next_image(self, node):
+        running = {images[-1] for other, images in self._node_images.items() if other is not node}
+        candidates = [image for image in self._units_by_image if image not in running]
+        return max(candidates or self._units_by_image, key=self._image_weights.__getitem__)
+
+    def _assign_work_unit(self, node):
+        assert self.workqueue
+
+        if self._units_by_image is None:
+            self._index_work_units()
+
+        images = self._node_images.setdefault(node, [])
+        image = next((image for image in images if image in self._units_by_image), None)
+        if image is None:
+            image = self._get_next_image(node)
+            images.append(image)
+
+        scopes = self._units_by_image[image]
+        scope = scopes.pop()
+        if not scopes:
+            del self._units_by_image[image]
+
+        work_unit = self.workqueue.pop(scope)
+        self._image_weights[image] -= len(work_unit)
+        self.assigned_work.setdefault(node, {})[scope] = work_unit
+
+        worker_collection = self.registered_collections[node]
+        node.send_runtest_some(
+            [
+                worker_collection.index(nodeid)
+                for nodeid, completed in work_unit.items()
+                if not completed
+            ]
+        )
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_xdist_make_scheduler(config, log):
+    return ImageAffinityScheduling(config, log)
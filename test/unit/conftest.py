@@ -6,7 +6,16 @@ from uuid import uuid4 as uuid
 import pytest
 from glotter_core.testinfo import ContainerInfo
 
-from glotter import containerfactory
+from glotter import (
+    build_cache,
+    containerfactory,
+    image_cache,
+    image_lock,
+    pull_limiter,
+    result_cache,
+    source,
+    stragglers,
+)
 from glotter.project import Project
 from glotter.settings import get_settings
 from glotter.source import Source
@@ -15,7 +24,7 @@ from .mockdocker import DockerMock
 
 
 @pytest.fixture
-def docker():
+def docker(cache_dir):
     docker_mock = DockerMock()
     docker_mock.clear()
     yield docker_mock
@@ -92,10 +101,9 @@ def source_with_build(test_info_string_with_build):
 
 @pytest.fixture
 def no_io(monkeypatch):
-    monkeypatch.setattr("tempfile.mkdtemp", lambda *args, **kwargs: "TEMP_DIR")
-    monkeypatch.setattr("os.chmod", lambda *args, **kwargs: "")
-    monkeypatch.setattr("shutil.copy", lambda *args, **kwargs: "")
-    monkeypatch.setattr("shutil.rmtree", lambda *args, **kwargs: "")
+    monkeypatch.setattr(
+        "glotter.containerfactory._read_source", lambda *args, **kwargs: (b"contents", 0o644)
+    )
 
 
 @pytest.fixture
@@ -170,6 +178,12 @@ def mock_sources(test_info_string_no_build):
     }
 
 
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("GLOTTER_CACHE_DIR", str(tmp_path / "cache"))
+    yield tmp_path / "cache"
+
+
 @pytest.fixture()
 def temp_dir_chdir():
     curr_cwd = os.getcwd()
@@ -182,6 +196,12 @@ def temp_dir_chdir():
             os.chdir(curr_cwd)
 
 
+@pytest.fixture(autouse=True)
+def restore_environment():
+    with patch.dict(os.environ):
+        yield
+
+
 @pytest.fixture(autouse=True)
 def clear_caches():
     _clear_caches()
@@ -193,4 +213,11 @@ def clear_caches():
 
 def _clear_caches():
     containerfactory.get_container_factory.cache_clear()
+    build_cache.get_build_cache.cache_clear()
+    result_cache.get_result_cache.cache_clear()
+    image_cache.get_image_cache.cache_clear()
+    image_lock.get_image_lock.cache_clear()
+    pull_limiter.get_pull_limiter.cache_clear()
     get_settings.cache_clear()
+    stragglers.pop_records()
+    source._built_containers.clear()
@@ -1,5 +1,12 @@
+import gzip
+import hashlib
+import io
+import posixpath
+import tarfile
 from uuid import uuid4 as uuid
 
+import docker
+
 
 class ContainerExec:
     def __init__(self, cmd, attributes):
@@ -16,17 +23,42 @@ class Container:
         self.name = name
         self._attributes = attributes
         self.removed = False
+        self.status = "running"
         self.execs = []
+        self.archives = []
+        self.exit_code = 0
 
     def __getitem__(self, key):
         return self._attributes[key]
 
+    @property
+    def labels(self):
+        return self._attributes.get("labels") or {}
+
+    def reload(self):
+        if self.removed:
+            raise docker.errors.NotFound(self.name)
+
     def remove(self, *args, **kwargs):
         self.removed = True
 
+    def put_archive(self, path, data):
+        self.archives.append((path, data))
+        return True
+
+    def get_archive(self, path, **kwargs):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            # Like docker, the archive is rooted at the last component of the path
+            tar_info = tarfile.TarInfo(f"{posixpath.basename(path.rstrip('/'))}/{self.name}")
+            tar.addfile(tar_info, io.BytesIO(b""))
+
+        data = archive.getvalue()
+        return iter([data[:512], data[512:]]), {"name": path.strip("/")}
+
     def exec_run(self, cmd, **kwargs):
         self.execs.append(ContainerExec(cmd, kwargs))
-        return 0, "executed".encode("utf-8")
+        return self.exit_code, "executed".encode("utf-8")
 
 
 class Containers:
@@ -41,13 +73,57 @@ class Containers:
             return cls.container_list[name]
         raise EnvironmentError("Container exists")
 
+    @classmethod
+    def list(cls, all=False, filters=None):
+        label = (filters or {}).get("label")
+        return [
+            container
+            for container in cls.container_list.values()
+            if not container.removed and (label is None or label in container.labels)
+        ]
+
     @classmethod
     def clear(cls):
         cls.container_list = {}
 
 
+class Image(str):
+    @property
+    def id(self):
+        return f"sha256:{hashlib.sha256(self.encode('utf-8')).hexdigest()}"
+
+    @property
+    def attrs(self):
+        repository = self.split("@")[0].rsplit(":", 1)[0]
+        digest = Images.digests.get(self)
+        return {
+            "Id": self.id,
+            "Size": len(self) * 1000,
+            "RepoDigests": [f"{repository}@{digest}"] if digest else [],
+        }
+
+    @property
+    def tags(self):
+        return [] if "@" in self else [self]
+
+    def tag(self, repository, tag=None):
+        name = f"{repository}:{tag or 'latest'}"
+        Images.add_image(name)
+        Images.digests[name] = Images.digests.get(self)
+        return True
+
+    def save(self, chunk_size=None, named=False):
+        yield self.encode("utf-8")
+
+
+class RegistryData:
+    def __init__(self, name):
+        self.id = f"sha256:{hashlib.sha256(f'registry {name}'.encode('utf-8')).hexdigest()}"
+
+
 class Images:
     image_list = []
+    digests = {}
 
     @classmethod
     def add_image(cls, name):
@@ -57,27 +133,94 @@ class Images:
     @classmethod
     def list(cls, name=None, **kwargs):
         if not name:
-            return cls.image_list
+            return [Image(image_name) for image_name in cls.image_list]
 
         if name in cls.image_list:
-            return [name]
+            return [Image(name)]
 
         return []
 
+    @classmethod
+    def get(cls, name):
+        if name not in cls.image_list:
+            raise docker.errors.ImageNotFound(name)
+
+        return Image(name)
+
+    @classmethod
+    def get_registry_data(cls, name):
+        return RegistryData(name)
+
     @classmethod
     def clear(cls):
         cls.image_list = []
+        cls.digests = {}
+
+    @classmethod
+    def load(cls, data):
+        name = gzip.decompress(data.read()).decode("utf-8")
+        cls.add_image(name)
+        return [Image(name)]
 
     @classmethod
-    def remove(cls, image, **kwargs):
+    def remove(cls, image, force=False, **kwargs):
+        # Like docker, an image is only untagged when it is forced to be removed while in use
+        if not force and any(
+            container.image == image and not container.removed
+            for container in Containers.container_list.values()
+        ):
+            raise docker.errors.APIError(f"conflict: image {image} is being used")
+
         if image in cls.image_list:
             Images.image_list.remove(image)
 
 
+class Volume:
+    def __init__(self, name, in_use=False):
+        self.name = name
+        self.in_use = in_use
+
+    def remove(self, force=False):
+        if self.in_use:
+            raise docker.errors.APIError(f"volume is in use: {self.name}")
+
+        Volumes.volume_list.remove(self)
+
+
+class Volumes:
+    volume_list = []
+
+    @classmethod
+    def list(cls, filters=None):
+        name = (filters or {}).get("name") or ""
+        return [volume for volume in cls.volume_list if name in volume.name]
+
+    @classmethod
+    def clear(cls):
+        cls.volume_list = []
+
+
 class DockerApi:
-    @staticmethod
-    def pull(repository, **kwargs):
+    # Errors to report for the next pulls, either as an exception, or as an error message or
+    # error chunk in the stream
+    pull_errors = []
+
+    @classmethod
+    def pull(cls, repository, **kwargs):
+        if cls.pull_errors:
+            error = cls.pull_errors.pop(0)
+            if isinstance(error, Exception):
+                raise error
+
+            chunk = error if isinstance(error, dict) else {"error": error}
+            return iter([{"status": "Pulling"}, chunk])
+
         tag = kwargs.get("tag") or "latest"
+        if tag.startswith("sha256:"):
+            Images.add_image(f"{repository}@{tag}")
+            Images.digests[f"{repository}@{tag}"] = tag
+            return Images.list(f"{repository}@{tag}")
+
         Images.add_image(f"{repository}:{tag}")
         return Images.list(f"{repository}:{tag}")
 
@@ -85,9 +228,12 @@ class DockerApi:
 class DockerMock:
     containers = Containers
     images = Images
+    volumes = Volumes
     api = DockerApi
 
     @classmethod
     def clear(cls):
         cls.images.clear()
         cls.containers.clear()
+        cls.volumes.clear()
+        cls.api.pull_errors.clear()
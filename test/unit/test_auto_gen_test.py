@@ -218,6 +218,7 @@ def test_auto_gen_params_get_constant_variable_name(value, expected_constant_var
                 "params": [{"name": "some-name", "input": None, "expected": "some-str"}],
                 "transformations": ["strip"],
                 "repeat": 1,
+                "timeout": None,
             },
             id=f"name_{char}-single_param-single_transformation",
         )
@@ -234,6 +235,7 @@ def test_auto_gen_params_get_constant_variable_name(value, expected_constant_var
                 "params": [{"name": "", "input": None, "expected": "foo"}],
                 "transformations": [],
                 "repeat": 1,
+                "timeout": None,
             },
             id="no_param_name",
         )
@@ -253,6 +255,7 @@ def test_auto_gen_params_get_constant_variable_name(value, expected_constant_var
                 "params": [{"name": "some-name", "input": None, "expected": "some-str"}],
                 "transformations": ["strip"],
                 "repeat": 1,
+                "timeout": None,
             },
             id=f"name_foo_{char}_bar-single_param-single_transformation",
         )
@@ -296,6 +299,7 @@ def test_auto_gen_params_get_constant_variable_name(value, expected_constant_var
                 ],
                 "transformations": ["strip", "splitlines"],
                 "repeat": 1,
+                "timeout": None,
             },
             id="muli_param-multi_transformation",
         ),
@@ -327,6 +331,7 @@ def test_auto_gen_params_get_constant_variable_name(value, expected_constant_var
                 ],
                 "transformations": [],
                 "repeat": 1,
+                "timeout": None,
             },
             id="has_inputs",
         ),
@@ -358,6 +363,7 @@ def test_auto_gen_params_get_constant_variable_name(value, expected_constant_var
                 ],
                 "transformations": [],
                 "repeat": 1,
+                "timeout": None,
             },
             id="has_strings",
         ),
@@ -381,6 +387,7 @@ def test_auto_gen_params_get_constant_variable_name(value, expected_constant_var
                 ],
                 "transformations": [],
                 "repeat": 5,
+                "timeout": None,
             },
             id="has-repeat",
         ),
@@ -867,6 +874,137 @@ def test_auto_gen_test_get_pytest_params(value, expected_pytest_params):
     assert test.get_pytest_params() == expected_pytest_params
 
 
+@pytest.mark.parametrize(
+    "transformations",
+    [
+        pytest.param(["strip"], id="strip-scalar"),
+        pytest.param(["splitlines"], id="splitlines"),
+        pytest.param(["lower"], id="lower"),
+        pytest.param(["strip", "splitlines", "any_order"], id="any_order"),
+        pytest.param(["strip_expected"], id="strip_expected"),
+        pytest.param([{"remove": ["x", "y", '"']}], id="remove"),
+        pytest.param([{"strip": ["a", "'"]}], id="strip-dict"),
+        pytest.param(["strip", "splitlines_expected", "splitlines"], id="splitlines_expected"),
+        pytest.param([], id="none"),
+    ],
+)
+def test_auto_gen_transform_values_matches_transform_vars(transformations):
+    value = {
+        "name": "some_name",
+        "params": [{"name": "some-param", "expected": "some-output"}],
+        "transformations": transformations,
+    }
+    test = AutoGenTest(**value)
+    actual = "a\"Hello x\nWorld y\n\nHello x\n'"
+    expected = " hello\nworld\n "
+
+    actual_var, expected_var = test.transform_vars()
+    variables = {"actual": actual, "expected": expected}
+    expected_values = (eval(actual_var, {}, variables), eval(expected_var, {}, variables))
+    assert test.transform_values(actual, expected) == expected_values
+
+
+@pytest.mark.parametrize(
+    ("value", "expected_pytest_ids"),
+    [
+        pytest.param(
+            {"name": "name1", "params": [{"expected": "whatever"}]},
+            [""],
+            id="no-requires-params",
+        ),
+        pytest.param(
+            {"name": "name1", "params": [{"expected": "whatever"}], "repeat": 2},
+            ["repeat1", "repeat2"],
+            id="no-requires-params-with-repeat",
+        ),
+        pytest.param(
+            {
+                "name": "name2",
+                "requires_parameters": True,
+                "params": [
+                    {"name": "some name 1", "input": "hello", "expected": "Hello"},
+                    {"name": "some name 2", "input": None, "expected": "Goodbye"},
+                ],
+            },
+            ["some name 1", "some name 2"],
+            id="requires-params",
+        ),
+        pytest.param(
+            {
+                "name": "name3",
+                "requires_parameters": True,
+                "params": [
+                    {"name": "some name 1", "input": "hello", "expected": "Hello"},
+                    {"name": "some name 2", "input": "Goodbye", "expected": "Goodbye"},
+                ],
+                "repeat": 2,
+            },
+            [
+                "repeat1-some name 1",
+                "repeat1-some name 2",
+                "repeat2-some name 1",
+                "repeat2-some name 2",
+            ],
+            id="requires-params-with-repeat",
+        ),
+    ],
+)
+def test_auto_gen_test_get_pytest_ids(value, expected_pytest_ids):
+    test = AutoGenTest(**value)
+    pytest_ids = test.get_pytest_ids()
+    assert [pytest_id for pytest_id, _ in pytest_ids] == expected_pytest_ids
+    params = test.params * (len(expected_pytest_ids) // len(test.params))
+    if not test.requires_parameters:
+        params = [test.params[0]] * len(expected_pytest_ids)
+
+    assert [param for _, param in pytest_ids] == params
+
+
+@pytest.mark.parametrize(
+    ("value", "expected_run_params"),
+    [
+        pytest.param(
+            {
+                "name": "name1",
+                "requires_parameters": False,
+                "params": [{"expected": "whatever"}],
+                "repeat": 2,
+            },
+            [],
+            id="no-requires-params",
+        ),
+        pytest.param(
+            {
+                "name": "name2",
+                "requires_parameters": True,
+                "params": [
+                    {"name": "some name 1", "input": "hello", "expected": "Hello"},
+                    {"name": "some name 2", "input": None, "expected": "Goodbye"},
+                ],
+            },
+            ["hello", None],
+            id="requires-params",
+        ),
+        pytest.param(
+            {
+                "name": "name3",
+                "requires_parameters": True,
+                "params": [
+                    {"name": "some name 1", "input": "hello", "expected": "Hello"},
+                    {"name": "some name 2", "input": "Goodbye", "expected": "Goodbye"},
+                ],
+                "repeat": 3,
+            },
+            ["hello", "hello", "hello", "Goodbye", "Goodbye", "Goodbye"],
+            id="requires-params-with-repeat",
+        ),
+    ],
+)
+def test_auto_gen_test_get_run_params(value, expected_run_params):
+    test = AutoGenTest(**value)
+    assert test.get_run_params() == expected_run_params
+
+
 @pytest.mark.parametrize(
     ("value", "project_name_underscores", "expected_value"),
     [
@@ -906,6 +1044,29 @@ def test_something(repeat, in_params, expected, some_project):
 """,
             id="repeat-and-requires-params",
         ),
+        pytest.param(
+            {"name": "valid", "params": [{"expected": "foo"}], "timeout": 30},
+            "my_project",
+            """\
+def test_valid(my_project):
+    actual = my_project.run(timeout=30.0)
+""",
+            id="timeout",
+        ),
+        pytest.param(
+            {
+                "name": "something",
+                "requires_parameters": True,
+                "params": [{"name": "blah", "input": "foo", "expected": "bar"}],
+                "timeout": 2.5,
+            },
+            "some_project",
+            """\
+def test_something(in_params, expected, some_project):
+    actual = some_project.run(params=in_params, timeout=2.5)
+""",
+            id="requires-params-and-timeout",
+        ),
     ],
 )
 def test_auto_gen_test_get_test_function_and_run(value, project_name_underscores, expected_value):
@@ -1,11 +1,15 @@
 import argparse
+import json
 import os
 import sys
-from unittest.mock import call, patch
+import threading
+from unittest.mock import ANY, call, patch
 
 import pytest
 
 from glotter.__main__ import main
+from glotter.batch import get_batches, get_language_costs, get_language_groups
+from glotter.history import History
 from glotter.source import Source
 
 LANGUAGES = ["bar", "bart", "cool", "d", "eiffel"]
@@ -94,7 +98,7 @@ def test_without_batch_num(
     mock_containers,
 ):
     mock_download.side_effect = [
-        dict(mock_containers[start_index:end_index])
+        (dict(mock_containers[start_index:end_index]), {})
         for start_index, end_index in test_options["indices"]
     ]
     mock_test.side_effect = [SystemExit(exit_code) for exit_code in test_options["exit_codes"]]
@@ -105,16 +109,11 @@ def test_without_batch_num(
     assert e.value.code == test_options["expected_exit_code"]
 
     expected_batch_args = [
-        call(
-            mock_batch_args(
-                languages=LANGUAGES[start_index:end_index],
-                parallel=parallel,
-            )
-        )
+        mock_batch_args(languages=LANGUAGES[start_index:end_index], parallel=parallel)
         for start_index, end_index in test_options["indices"]
     ]
-    mock_download.assert_has_calls(expected_batch_args)
-    mock_test.assert_has_calls(expected_batch_args)
+    mock_download.assert_has_calls([call(args, ANY) for args in expected_batch_args])
+    mock_test.assert_has_calls([call(args) for args in expected_batch_args])
     if remove:
         expected_remove_args = [
             call(dict(mock_containers[start_index:end_index]), parallel)
@@ -169,7 +168,7 @@ def test_without_batch_num(
 def test_with_batch_num(test_options, mock_download, mock_test, mock_remove, mock_containers):
     start_index = test_options["start_index"]
     end_index = test_options["end_index"]
-    mock_download.return_value = dict(mock_containers[start_index:end_index])
+    mock_download.return_value = (dict(mock_containers[start_index:end_index]), {})
     mock_test.side_effect = SystemExit(test_options["exit_code"])
 
     with pytest.raises(SystemExit) as e:
@@ -186,7 +185,7 @@ def test_with_batch_num(test_options, mock_download, mock_test, mock_remove, moc
         languages=LANGUAGES[start_index:end_index],
         parallel=test_options["parallel"],
     )
-    mock_download.assert_called_once_with(expected_mock_batch_args)
+    mock_download.assert_called_once_with(expected_mock_batch_args, ANY)
     mock_test.assert_called_once_with(expected_mock_batch_args)
     if test_options["remove"]:
         expected_remove_args = dict(mock_containers[start_index:end_index])
@@ -207,8 +206,345 @@ def test_do_nothing_when_no_languages_available(
     mock_remove.assert_not_called()
 
 
-def batch_command(num_batches, batch_num=None, parallel=False, remove=False):
-    args = [str(num_batches)]
+def test_get_language_costs(tmp_path):
+    history = History(str(tmp_path / "history.json"))
+    history.update(durations={"bar": 10.0, "cool": 2.0}, image_sizes={"d": 100 * 1024 * 1024})
+    sources_by_language = {"bar": [1, 2, 3, 4], "cool": [1], "d": [1, 2], "eiffel": [1]}
+    assert get_language_costs(sources_by_language, history) == {
+        "bar": 10.0,
+        "cool": 2.0,
+        "d": 2 * 2.4 + 2.0,
+        "eiffel": 2.4,
+    }
+
+
+def test_get_language_costs_without_history(tmp_path):
+    history = History(str(tmp_path / "history.json"))
+    assert get_language_costs({"bar": [1, 2], "cool": [1]}, history) == {"bar": 2.0, "cool": 1.0}
+
+
+def test_get_batches_without_history(tmp_path):
+    history = History(str(tmp_path / "history.json"))
+    sources_by_language = make_sources_by_language({language: language for language in LANGUAGES})
+    assert get_batches(sources_by_language, history, 2) == [
+        (["bar", "bart"], 2.0),
+        (["cool", "d", "eiffel"], 3.0),
+    ]
+
+
+def test_get_batches_without_sources(tmp_path):
+    history = History(str(tmp_path / "history.json"))
+    assert get_batches({}, history, 0) == []
+
+
+def test_batch_without_sources(mock_sources_batch, mock_download, mock_test, mock_remove):
+    mock_sources_batch.return_value = {}
+    with pytest.raises(SystemExit) as e:
+        batch_command(num_batches=2)
+
+    assert e.value.code == 0
+    mock_test.assert_not_called()
+
+
+def test_get_batches_with_history(tmp_path):
+    history = History(str(tmp_path / "history.json"))
+    history.update(durations={"bar": 9.0, "bart": 5.0, "cool": 4.0, "d": 3.0, "eiffel": 2.0})
+    sources_by_language = make_sources_by_language({language: language for language in LANGUAGES})
+    assert get_batches(sources_by_language, history, 2) == [
+        (["bar", "d"], 12.0),
+        (["bart", "cool", "eiffel"], 11.0),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("durations", "expected_batches"),
+    [
+        pytest.param(
+            None,
+            [(["bar", "d"], 2.0), (["bart", "cool", "eiffel"], 3.0)],
+            id="without-history",
+        ),
+        pytest.param(
+            {"bar": 1.0, "bart": 3.0, "cool": 1.0, "d": 1.0, "eiffel": 1.0},
+            [(["bart", "eiffel"], 4.0), (["bar", "cool", "d"], 3.0)],
+            id="with-history",
+        ),
+    ],
+)
+def test_get_batches_groups_shared_images(durations, expected_batches, tmp_path):
+    history = History(str(tmp_path / "history.json"))
+    if durations:
+        history.update(durations=durations)
+
+    sources_by_language = make_sources_by_language(
+        {"bar": "ubuntu", "bart": "bart", "cool": "cool", "d": "ubuntu", "eiffel": "eiffel"}
+    )
+    assert get_batches(sources_by_language, history, 2) == expected_batches
+
+
+@pytest.mark.parametrize(
+    ("images", "expected_groups"),
+    [
+        pytest.param(
+            {"bar": "ubuntu", "bart": "bart", "cool": "ubuntu", "d": "d", "eiffel": "e"},
+            [["bar", "cool"], ["bart"], ["d"], ["eiffel"]],
+            id="shared",
+        ),
+        pytest.param(
+            {"bar": "ubuntu", "bart": "bart", "cool": "ubuntu", "d": "d", "eiffel": "ubuntu"},
+            [["bar"], ["bart"], ["cool"], ["d"], ["eiffel"]],
+            id="too-large",
+        ),
+        pytest.param(
+            {"bar": "bar", "bart": "bart", "cool": "cool", "d": "d", "eiffel": "e"},
+            [["bar"], ["bart"], ["cool"], ["d"], ["eiffel"]],
+            id="not-shared",
+        ),
+    ],
+)
+def test_get_language_groups(images, expected_groups):
+    sources_by_language = make_sources_by_language(images)
+    costs = {language: 1.0 for language in LANGUAGES}
+    assert get_language_groups(sources_by_language, costs, 2) == expected_groups
+
+
+def test_get_language_groups_transitive():
+    sources_by_language = make_sources_by_language(
+        {"bar": "ubuntu", "bart": "python", "cool": "cool", "d": "d", "eiffel": "eiffel"}
+    )
+    sources_by_language["cool"] += make_sources_by_language({"cool": "ubuntu"})["cool"]
+    sources_by_language["cool"] += make_sources_by_language({"cool": "python"})["cool"]
+    costs = {language: 1.0 for language in LANGUAGES}
+    assert get_language_groups(sources_by_language, costs, 1) == [
+        ["bar", "bart", "cool"],
+        ["d"],
+        ["eiffel"],
+    ]
+
+
+@pytest.mark.parametrize("pipeline", [False, True])
+def test_remove_images_after_last_batch(
+    pipeline, mock_download, mock_test, mock_remove, mock_sources_batch
+):
+    sources_by_language = make_sources_by_language(
+        {"bar": "ubuntu", "bart": "bart", "cool": "ubuntu", "d": "d", "eiffel": "ubuntu"}
+    )
+    mock_sources_batch.return_value = {
+        "baklava": [source for sources in sources_by_language.values() for source in sources]
+    }
+    mock_download.side_effect = lambda args, history: (
+        {
+            f"{image}:latest": image
+            for image in {
+                sources_by_language[language][0].test_info.container_info.image
+                for language in args.language
+            }
+        },
+        {},
+    )
+    mock_test.side_effect = SystemExit(0)
+    with pytest.raises(SystemExit) as e:
+        batch_command(num_batches=3, remove=True, extra_args=["--pipeline"] if pipeline else [])
+
+    assert e.value.code == 0
+    assert mock_remove.call_args_list == [
+        call({}, False),
+        call({"bart:latest": "bart"}, False),
+        call({"d:latest": "d", "ubuntu:latest": "ubuntu"}, False),
+    ]
+
+
+def test_disk_budget(mock_download, mock_test, mock_remove, factory):
+    pending = []
+
+    def test(args):
+        pending.append(factory._pending_images["python:3.7-alpine"])
+        raise SystemExit(0)
+
+    mock_test.side_effect = test
+    with pytest.raises(SystemExit) as e:
+        batch_command(num_batches=3, extra_args=["--disk-budget", "2G"])
+
+    assert e.value.code == 0
+    assert factory.disk_budget == 2 * 1024**3
+    assert mock_test.call_args.args[0].disk_budget == 2 * 1024**3
+    assert pending == [3, 2, 1]
+    assert not factory._pending_images
+
+
+def test_batch_closes_container_factory(mock_download, mock_test, mock_remove, factory):
+    with patch.object(factory, "close", wraps=factory.close) as mock_close:
+        with pytest.raises(SystemExit) as e:
+            batch_command(num_batches=3)
+
+    assert e.value.code == 0
+    assert mock_close.call_count == 3
+
+
+def test_batch_uses_history(mock_download, mock_test, mock_remove, tmp_path):
+    history_path = str(tmp_path / "history.json")
+    History(history_path).update(
+        durations={"bar": 1.0, "bart": 1.0, "cool": 1.0, "d": 1.0, "eiffel": 10.0}
+    )
+    mock_test.side_effect = SystemExit(0)
+    with pytest.raises(SystemExit):
+        batch_command(num_batches=2, batch_num=1, extra_args=["--history", history_path])
+
+    mock_test.assert_called_once_with(mock_batch_args(languages=["eiffel"], parallel=False))
+    assert mock_download.call_args.args[1].path == history_path
+
+
+def test_batch_uses_default_history(mock_download, mock_test, mock_remove, cache_dir):
+    history_path = os.path.join(cache_dir, "history.json")
+    History(history_path).update(
+        durations={"bar": 1.0, "bart": 1.0, "cool": 1.0, "d": 1.0, "eiffel": 10.0}
+    )
+    mock_test.side_effect = SystemExit(0)
+    with pytest.raises(SystemExit):
+        batch_command(num_batches=2, batch_num=1)
+
+    # The batches match the ones in a manifest written with the default history
+    mock_test.assert_called_once_with(mock_batch_args(languages=["eiffel"], parallel=False))
+    assert mock_test.call_args.args[0].history == history_path
+    assert mock_download.call_args.args[1].path == history_path
+
+
+def test_batch_records_image_sizes(mock_download, mock_test, mock_remove, docker, tmp_path):
+    history_path = tmp_path / "history.json"
+
+    def download(args, history):
+        docker.images.add_image("python:3.7-alpine")
+        return {}, {}
+
+    mock_download.side_effect = download
+    mock_test.side_effect = SystemExit(0)
+    with pytest.raises(SystemExit):
+        batch_command(num_batches=1, extra_args=["--history", str(history_path)])
+
+    history = History(str(history_path))
+    assert set(history.languages) == set(LANGUAGES)
+    assert all(history.get_image_size(language) > 0 for language in LANGUAGES)
+
+
+def test_batch_writes_manifest(mock_download, mock_test, mock_remove, tmp_path):
+    manifest_path = tmp_path / "manifest.json"
+    with pytest.raises(SystemExit) as e:
+        batch_command(num_batches=2, extra_args=["--manifest", str(manifest_path)])
+
+    assert e.value.code == 0
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        assert json.load(f) == {
+            "include": [
+                {"batch": 1, "languages": ["bar", "bart"], "estimated_duration": 5.0},
+                {"batch": 2, "languages": ["cool", "d", "eiffel"], "estimated_duration": 5.0},
+            ]
+        }
+
+    mock_download.assert_not_called()
+    mock_test.assert_not_called()
+
+
+def test_batch_writes_manifest_with_default_history(
+    mock_download, mock_test, mock_remove, tmp_path, cache_dir
+):
+    History(os.path.join(cache_dir, "history.json")).update(
+        durations={"bar": 1.0, "bart": 1.0, "cool": 1.0, "d": 1.0, "eiffel": 10.0}
+    )
+    manifest_path = tmp_path / "manifest.json"
+    with pytest.raises(SystemExit):
+        batch_command(num_batches=2, extra_args=["--manifest", str(manifest_path)])
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        assert [batch["languages"] for batch in json.load(f)["include"]] == [
+            ["eiffel"],
+            ["bar", "bart", "cool", "d"],
+        ]
+
+
+@pytest.mark.parametrize(
+    ("prefetch_limit", "expected_num_prefetched"),
+    [
+        pytest.param(None, 1, id="next-batch"),
+        pytest.param("5k", 2, id="prefetch-limit"),
+        pytest.param("3k", 1, id="prefetch-limit-too-small"),
+    ],
+)
+def test_pipeline(
+    prefetch_limit, expected_num_prefetched, mock_download, mock_test, mock_remove, tmp_path
+):
+    history_path = str(tmp_path / "history.json")
+    History(history_path).update(image_sizes={language: 1000 for language in LANGUAGES})
+    downloaded = []
+    tested = []
+    prefetched = threading.Event()
+
+    def download(args, history):
+        downloaded.append(args.language)
+        if len(downloaded) == expected_num_prefetched + 1:
+            prefetched.set()
+
+        return {"python:3.7-alpine": args.language}, {}
+
+    def test(args):
+        if not tested:
+            assert prefetched.wait(timeout=5)
+            assert len(downloaded) == expected_num_prefetched + 1
+
+        tested.append(args.language)
+        raise SystemExit(0)
+
+    mock_download.side_effect = download
+    mock_test.side_effect = test
+    extra_args = ["--pipeline", "--history", history_path]
+    if prefetch_limit:
+        extra_args += ["--prefetch-limit", prefetch_limit]
+
+    with pytest.raises(SystemExit) as e:
+        batch_command(num_batches=3, remove=True, extra_args=extra_args)
+
+    assert e.value.code == 0
+    assert downloaded == tested
+    assert len(tested) == 3
+
+    # Images needed by prefetched batches are only removed after the last batch
+    assert mock_remove.call_args_list == [
+        call({}, False),
+        call({}, False),
+        call({"python:3.7-alpine": tested[-1]}, False),
+    ]
+
+
+def test_pipeline_keeps_first_failure(mock_download, mock_test, mock_remove):
+    mock_download.return_value = ({}, {})
+    mock_test.side_effect = [SystemExit(0), SystemExit(3), SystemExit(4)]
+    with pytest.raises(SystemExit) as e:
+        batch_command(num_batches=3, extra_args=["--pipeline"])
+
+    assert e.value.code == 3
+    assert mock_test.call_count == 3
+    mock_remove.assert_not_called()
+
+
+@pytest.mark.parametrize("pipeline", [False, True])
+def test_batch_continues_after_download_errors(
+    pipeline, mock_download, mock_test, mock_remove, capsys
+):
+    mock_download.side_effect = [
+        ({}, {"python:3.7-alpine": RuntimeError("pull failed")}),
+        ({}, {}),
+        ({}, {}),
+    ]
+    mock_test.side_effect = SystemExit(0)
+    with pytest.raises(SystemExit) as e:
+        batch_command(num_batches=3, extra_args=["--pipeline"] if pipeline else [])
+
+    assert e.value.code == 1
+    assert mock_test.call_count == 3
+    assert "- python:3.7-alpine: pull failed" in capsys.readouterr().out
+
+
+def batch_command(num_batches, batch_num=None, parallel=False, remove=False, extra_args=None):
+    args = [str(num_batches)] + (extra_args or [])
     if batch_num is not None:
         args += ["--batch", str(batch_num)]
 
@@ -222,13 +558,65 @@ def batch_command(num_batches, batch_num=None, parallel=False, remove=False):
         main()
 
 
+def make_sources_by_language(images):
+    return {
+        language: [
+            Source(
+                filename=f"baklava.{language}",
+                language=language,
+                path=os.path.join("archive", language[0], language, f"baklava.{language}"),
+                test_info=f"""folder:
+  extension: ".{language}"
+  naming: "underscore"
+
+container:
+  image: "{image}"
+  tag: "latest"
+  cmd: "run {{{{ source.name }}}}{{{{ source.extension }}}}"
+""",
+                project_type="baklava",
+            )
+        ]
+        for language, image in images.items()
+    }
+
+
 def mock_batch_args(languages, parallel):
-    return argparse.Namespace(source=None, project=None, language=set(languages), parallel=parallel)
+    return argparse.Namespace(
+        source=None,
+        project=None,
+        language=set(languages),
+        parallel=parallel,
+        changed_since=None,
+        to_cache=False,
+        pull_concurrency=None,
+        registry_concurrency=None,
+        pull_rate=None,
+        pull_retries=None,
+        junit_xml=None,
+        json_report=None,
+        history=ANY,
+        pool_size=0,
+        build_cache=False,
+        batch_build=False,
+        shared_containers=False,
+        single_exec=False,
+        incremental=False,
+        disk_budget=None,
+        exec_timeout=None,
+        engine="pytest",
+        concurrency=None,
+    )
+
+
+@pytest.fixture(autouse=True)
+def batch_environment(factory, cache_dir):
+    yield
 
 
 @pytest.fixture()
 def mock_download():
-    with patch("glotter.batch.download") as mock:
+    with patch("glotter.batch.download_images", return_value=({}, {})) as mock:
         yield mock
 
 
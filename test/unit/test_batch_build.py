@@ -0,0 +1,205 @@
+import re
+import threading
+from uuid import uuid4 as uuid
+
+import pytest
+
+from glotter.batch_build import BUILD_ROOT, build_sources
+from glotter.build_cache import get_build_cache
+from glotter.exec_driver import DRIVER_FUNC_NAME
+from glotter.source import Source
+from glotter.stragglers import pop_records
+
+from .mockdocker import Container, Containers
+
+
+def test_build_sources_builds_language_in_one_container(
+    factory, test_info_string_with_build, build_exit_codes, no_io, capsys
+):
+    sources = make_sources(test_info_string_with_build, 3)
+    build_sources({"go": sources})
+    factory.wait_for_removals()
+
+    containers = list(Containers.container_list.values())
+    assert len(containers) == 1
+    assert containers[0].removed
+    assert [path for path, _ in containers[0].archives] == [
+        f"{BUILD_ROOT}/0",
+        f"{BUILD_ROOT}/1",
+        f"{BUILD_ROOT}/2",
+    ]
+    build_cache = get_build_cache()
+    for source in sources:
+        assert build_cache.contains(build_cache.get_key(source, source.get_build_command()))
+
+    output = capsys.readouterr().out
+    assert "Building 3 go sources together" in output
+    assert "Built 3 of 3 go sources" in output
+
+
+def test_build_sources_outputs_are_restored_for_tests(
+    factory, test_info_string_with_build, build_exit_codes, no_io
+):
+    sources = make_sources(test_info_string_with_build, 2)
+    build_sources({"go": sources})
+
+    sources[0].build()
+    container = factory.get_container(sources[0])
+    assert not [e for e in container.execs if "go build" in str(e.cmd)]
+    assert container.archives[-1][0] == "/"
+
+
+def test_build_sources_does_not_cache_failed_builds(
+    factory, test_info_string_with_build, build_exit_codes, no_io, capsys
+):
+    build_exit_codes += [0, 1, 0]
+    sources = make_sources(test_info_string_with_build, 3)
+    build_sources({"go": sources})
+
+    build_cache = get_build_cache()
+    assert [
+        build_cache.contains(build_cache.get_key(source, source.get_build_command()))
+        for source in sources
+    ] == [True, False, True]
+    assert "Built 2 of 3 go sources" in capsys.readouterr().out
+
+
+def test_build_sources_handles_invalid_driver_output(
+    factory, test_info_string_with_build, no_io, capsys
+):
+    sources = make_sources(test_info_string_with_build, 2)
+    build_sources({"go": sources})
+    factory.wait_for_removals()
+
+    build_cache = get_build_cache()
+    assert not any(
+        build_cache.contains(build_cache.get_key(source, source.get_build_command()))
+        for source in sources
+    )
+    assert all(container.removed for container in Containers.container_list.values())
+    assert "Unable to build go sources together" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    ("replacement", "expected_num_built"),
+    [
+        pytest.param(None, 3, id="all"),
+        pytest.param("  build: go build -o /src/out .\n", 2, id="refers-to-src"),
+        pytest.param("", 2, id="no-build"),
+    ],
+)
+def test_build_sources_skips_sources(
+    replacement,
+    expected_num_built,
+    factory,
+    test_info_string_with_build,
+    build_exit_codes,
+    no_io,
+    capsys,
+):
+    sources = make_sources(test_info_string_with_build, 2)
+    other_test_info_string = test_info_string_with_build
+    if replacement is not None:
+        other_test_info_string = re.sub(r"  build: .*\n", replacement, test_info_string_with_build)
+
+    sources += make_sources(other_test_info_string, 1)
+    build_sources({"go": sources})
+
+    assert f"Building {expected_num_built} go sources together" in capsys.readouterr().out
+
+
+def test_build_sources_skips_cached_and_single_sources(
+    factory, test_info_string_with_build, build_exit_codes, no_io
+):
+    sources = make_sources(test_info_string_with_build, 2)
+    build_sources({"go": sources})
+    Containers.clear()
+
+    build_sources({"go": sources + make_sources(test_info_string_with_build, 1)})
+    assert not Containers.container_list
+
+
+def test_build_sources_times_out(factory, test_info_string_with_build, no_io, monkeypatch, capsys):
+    release = threading.Event()
+    exec_run = Container.exec_run
+
+    def mock_exec_run(self, cmd, **kwargs):
+        if isinstance(cmd, list) and cmd[:2] == ["sh", "-c"]:
+            release.wait(5)
+
+        return exec_run(self, cmd, **kwargs)
+
+    monkeypatch.setattr(Container, "exec_run", mock_exec_run)
+    sources = make_sources(test_info_string_with_build + "  timeout: 0.05\n", 3)
+    try:
+        build_sources({"go": sources}, jobs=2)
+    finally:
+        release.set()
+
+    factory.wait_for_removals()
+    assert all(container.removed for container in Containers.container_list.values())
+    build_cache = get_build_cache()
+    assert not any(
+        build_cache.contains(build_cache.get_key(source, source.get_build_command()))
+        for source in sources
+    )
+    assert "Timed out building go sources together after 0.1 seconds" in capsys.readouterr().out
+    assert pop_records()[-1].timed_out
+
+
+def test_build_sources_groups_by_image(
+    factory, test_info_string_with_build, build_exit_codes, no_io
+):
+    sources = make_sources(test_info_string_with_build, 2)
+    sources += make_sources(test_info_string_with_build.replace("1.12", "1.22"), 2)
+    build_sources({"go": sources})
+
+    assert sorted(container.image for container in Containers.container_list.values()) == [
+        "golang:1.12-alpine",
+        "golang:1.22-alpine",
+    ]
+
+
+def make_sources(test_info_string, count):
+    return [
+        Source(
+            filename=f"source-{uuid().hex}.go",
+            language="go",
+            path=f"sourcepath_{uuid().hex}",
+            test_info=test_info_string,
+            project_type="someproject",
+        )
+        for _ in range(count)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def enable_build_cache():
+    get_build_cache().enabled = True
+
+
+@pytest.fixture
+def build_exit_codes(monkeypatch):
+    """
+    Exit codes of the builds run by the parallel driver. Builds that are not in the list exit
+    with 0
+    """
+
+    exit_codes = []
+    exec_run = Container.exec_run
+
+    def mock_exec_run(self, cmd, **kwargs):
+        if not isinstance(cmd, list) or cmd[:2] != ["sh", "-c"]:
+            return exec_run(self, cmd, **kwargs)
+
+        self.execs.append(cmd)
+        marker = re.search(r"@@glotter-[0-9a-f]+@@", cmd[2]).group()
+        indices = re.findall(rf"^{DRIVER_FUNC_NAME} (\d+) ", cmd[2], re.MULTILINE)
+        output = "".join(
+            f"{marker} {n} {exit_codes[int(n)] if int(n) < len(exit_codes) else 0}\n"
+            for n in indices
+        )
+        return 0, output.encode("utf-8")
+
+    monkeypatch.setattr(Container, "exec_run", mock_exec_run)
+    return exit_codes
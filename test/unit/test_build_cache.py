@@ -0,0 +1,122 @@
+import io
+import os
+import tarfile
+from unittest.mock import Mock
+
+import pytest
+
+from glotter.build_cache import BUILD_CACHE_ENV_VAR, BuildCache, get_build_cache
+
+from .mockdocker import Container
+
+
+@pytest.mark.parametrize(("value", "expected"), [("1", True), ("", False), (None, False)])
+def test_get_build_cache_enabled_from_environment(value, expected, monkeypatch):
+    if value is None:
+        monkeypatch.delenv(BUILD_CACHE_ENV_VAR, raising=False)
+    else:
+        monkeypatch.setenv(BUILD_CACHE_ENV_VAR, value)
+
+    assert get_build_cache().enabled == expected
+
+
+def test_cache_dir_defaults_to_glotter_cache(cache_dir):
+    assert BuildCache().cache_dir == os.path.join(cache_dir, "builds")
+    assert os.path.isdir(os.path.join(cache_dir, "builds"))
+
+
+def test_get_key_is_stable(factory, source_with_build, no_io):
+    cache = BuildCache(enabled=True)
+    assert cache.get_key(source_with_build, "go build") == cache.get_key(
+        source_with_build, "go build"
+    )
+
+
+def test_get_key_changes_with_command(factory, source_with_build, no_io):
+    cache = BuildCache(enabled=True)
+    assert cache.get_key(source_with_build, "go build") != cache.get_key(
+        source_with_build, "go build -v"
+    )
+
+
+def test_get_key_changes_with_source_contents(factory, source_with_build, monkeypatch):
+    cache = BuildCache(enabled=True)
+    monkeypatch.setattr("glotter.containerfactory._read_source", lambda path: (b"one", 0o644))
+    key = cache.get_key(source_with_build, "go build")
+    factory._source_digests.clear()
+    monkeypatch.setattr("glotter.containerfactory._read_source", lambda path: (b"two", 0o644))
+    assert cache.get_key(source_with_build, "go build") != key
+
+
+def test_get_key_returns_none_when_no_image(factory, source_with_build, no_io, monkeypatch):
+    monkeypatch.setattr(factory, "get_image", lambda *args, **kwargs: None)
+    assert BuildCache(enabled=True).get_key(source_with_build, "go build") is None
+
+
+def test_restore_returns_false_when_not_cached(tmp_path):
+    container = Container("image", "name", {})
+    assert not BuildCache(cache_dir=str(tmp_path)).restore("key", container)
+    assert not container.archives
+
+
+def test_save_and_restore(tmp_path):
+    cache = BuildCache(cache_dir=str(tmp_path))
+    cache.save("key", Container("image", "built", {}))
+    assert os.listdir(tmp_path) == ["key.tar"]
+
+    container = Container("image", "name", {})
+    assert cache.restore("key", container)
+    path, data = container.archives[0]
+    assert path == "/"
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        assert tar.getnames() == ["src/built"]
+
+
+def test_save_and_restore_with_source_dir(tmp_path):
+    cache = BuildCache(cache_dir=str(tmp_path))
+    built_container = Mock()
+    built_container.get_archive.return_value = ([b"data"], {})
+    cache.save("key", built_container, "/glotter-src/3/src")
+    built_container.get_archive.assert_called_once_with("/glotter-src/3/src")
+
+    container = Container("image", "name", {})
+    assert cache.restore("key", container, "/glotter-src/3/src")
+    assert container.archives == [("/glotter-src/3", b"data")]
+
+
+def test_save_removes_temporary_file_on_error(tmp_path):
+    container = Mock()
+    container.get_archive.return_value = (_raise_error(), {})
+    with pytest.raises(OSError):
+        BuildCache(cache_dir=str(tmp_path)).save("key", container)
+
+    assert not os.listdir(tmp_path)
+
+
+def test_build_saves_to_cache_on_miss(factory, source_with_build, no_io, cache_dir):
+    get_build_cache().enabled = True
+    source_with_build.build()
+    container = factory.get_container(source_with_build)
+    assert len(container.execs) == 1
+    assert len(os.listdir(os.path.join(cache_dir, "builds"))) == 1
+
+
+def test_build_restores_from_cache_on_hit(factory, source_with_build, no_io, cache_dir):
+    get_build_cache().enabled = True
+    source_with_build.build()
+    factory.cleanup(source_with_build)
+
+    source_with_build.build()
+    container = factory.get_container(source_with_build)
+    assert not container.execs
+    assert len(container.archives) == 2
+
+
+def test_build_does_not_use_cache_when_disabled(factory, source_with_build, no_io, cache_dir):
+    source_with_build.build()
+    assert not os.path.exists(os.path.join(cache_dir, "builds"))
+
+
+def _raise_error():
+    yield b"data"
+    raise OSError("error")
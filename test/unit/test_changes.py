@@ -0,0 +1,137 @@
+import os
+import subprocess
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from glotter.changes import _get_changed_projects, get_changed_sources
+
+GLOTTER_YML = """\
+settings:
+  source_root: archive
+projects:
+  baklava:
+    words: [baklava]
+  fizzbuzz:
+    words: [fizz, buzz]
+  fizzbuzz2:
+    words: [fizz, buzz, two]
+    use_tests:
+      name: fizzbuzz
+"""
+
+
+@pytest.mark.parametrize(
+    ("changes", "expected"),
+    [
+        pytest.param({}, {}, id="nothing"),
+        pytest.param(
+            {"archive/python/baklava.py": "print('baklava!')\n"},
+            {"baklava": ["python/baklava.py"]},
+            id="source",
+        ),
+        pytest.param(
+            {"archive/python/testinfo.yml": "changed\n"},
+            {
+                "baklava": ["python/baklava.py"],
+                "fizzbuzz": ["python/fizz_buzz.py"],
+                "fizzbuzz2": ["python/fizz_buzz_two.py"],
+            },
+            id="testinfo",
+        ),
+        pytest.param(
+            {".glotter.yml": GLOTTER_YML.replace("[fizz, buzz]", "[fizz, buzzz]")},
+            {
+                "fizzbuzz": ["python/fizz_buzz.py", "ruby/fizz_buzz.rb"],
+                "fizzbuzz2": ["python/fizz_buzz_two.py", "ruby/fizz_buzz_two.rb"],
+            },
+            id="project",
+        ),
+        pytest.param(
+            {".glotter.yml": GLOTTER_YML.replace("source_root: archive", "source_root: src")},
+            None,
+            id="settings",
+        ),
+        pytest.param(
+            {"archive/ruby/fizz_buzz_two.rb": "puts 1\n"},
+            {"fizzbuzz2": ["ruby/fizz_buzz_two.rb"]},
+            id="untracked",
+        ),
+    ],
+)
+def test_get_changed_sources(changes, expected, git_repo):
+    sources_by_type = {
+        "baklava": [_make_source(git_repo, "python/baklava.py")],
+        "fizzbuzz": [
+            _make_source(git_repo, "python/fizz_buzz.py"),
+            _make_source(git_repo, "ruby/fizz_buzz.rb"),
+        ],
+        "fizzbuzz2": [
+            _make_source(git_repo, "python/fizz_buzz_two.py"),
+            _make_source(git_repo, "ruby/fizz_buzz_two.rb"),
+        ],
+    }
+    for path, contents in changes.items():
+        _write_file(git_repo / path, contents)
+
+    settings = SimpleNamespace(project_root=str(git_repo), yml_path=str(git_repo / ".glotter.yml"))
+    with patch("glotter.changes.get_settings", return_value=settings):
+        actual = get_changed_sources("HEAD", sources_by_type)
+
+    if expected is None:
+        assert actual == sources_by_type
+    else:
+        assert {
+            project_type: [source.name for source in sources]
+            for project_type, sources in actual.items()
+        } == expected
+
+
+def test_get_changed_sources_with_bad_revision(git_repo, capsys):
+    settings = SimpleNamespace(project_root=str(git_repo), yml_path=str(git_repo / ".glotter.yml"))
+    with patch("glotter.changes.get_settings", return_value=settings):
+        with pytest.raises(SystemExit) as e:
+            get_changed_sources("bogus", {})
+
+    assert e.value.code != 0
+    assert "git diff failed" in capsys.readouterr().out
+
+
+def test_get_changed_projects_for_new_project():
+    old_yml = {"projects": {"baklava": {"words": ["baklava"]}}}
+    new_yml = {"projects": {**old_yml["projects"], "quine": {"words": ["quine"]}}}
+    assert _get_changed_projects(old_yml, new_yml) == {"quine"}
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    _write_file(tmp_path / ".glotter.yml", GLOTTER_YML)
+    for path in [
+        "archive/python/baklava.py",
+        "archive/python/fizz_buzz.py",
+        "archive/python/fizz_buzz_two.py",
+        "archive/python/testinfo.yml",
+        "archive/ruby/fizz_buzz.rb",
+        "archive/ruby/testinfo.yml",
+    ]:
+        _write_file(tmp_path / path, f"{path}\n")
+
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "-c", "user.name=test", "-c", "user.email=test@test", "commit", "-q", "-m", "x")
+    return tmp_path
+
+
+def _make_source(root, name):
+    path = root / "archive" / os.path.dirname(name)
+    return SimpleNamespace(name=name, path=str(path), full_path=str(path / os.path.basename(name)))
+
+
+def _write_file(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(contents, encoding="utf-8")
+
+
+def _git(cwd, *args):
+    subprocess.run(["git", *args], cwd=cwd, check=True)
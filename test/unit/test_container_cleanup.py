@@ -0,0 +1,13 @@
+from types import SimpleNamespace
+
+from glotter.container_cleanup import ContainerCleanupPlugin
+
+
+def test_session_finish_removes_containers(factory, source_no_build, no_io):
+    factory.pool_size = 1
+    container = factory.get_container(source_no_build)
+    factory.cleanup(source_no_build)
+    assert not container.removed
+
+    ContainerCleanupPlugin().pytest_sessionfinish(SimpleNamespace())
+    assert container.removed
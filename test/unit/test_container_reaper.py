@@ -0,0 +1,76 @@
+import threading
+
+import docker
+import pytest
+
+from glotter.container_reaper import ContainerReaper
+
+from .mockdocker import Container
+
+
+def test_remove_removes_container_in_background():
+    reaper = ContainerReaper()
+    container = BlockingContainer()
+    reaper.remove(container)
+    assert container.started.wait(5)
+    assert not container.removed
+
+    container.release.set()
+    reaper.drain()
+    assert container.removed
+
+
+def test_remove_limits_concurrent_removals():
+    reaper = ContainerReaper(concurrency=2)
+    containers = [BlockingContainer() for _ in range(3)]
+    for container in containers:
+        reaper.remove(container)
+
+    assert containers[0].started.wait(5)
+    assert containers[1].started.wait(5)
+    assert not containers[2].started.wait(0.1)
+
+    for container in containers:
+        container.release.set()
+
+    reaper.drain()
+    assert all(container.removed for container in containers)
+
+
+def test_remove_without_concurrency_removes_container_right_away():
+    reaper = ContainerReaper(concurrency=0)
+    container = Container("image", "name", {})
+    reaper.remove(container)
+    assert container.removed
+
+
+@pytest.mark.parametrize(
+    ("error", "expected_output"),
+    [
+        pytest.param(docker.errors.NotFound("gone"), "", id="not-found"),
+        pytest.param(
+            docker.errors.APIError("busy"), "Unable to remove container name: busy\n", id="error"
+        ),
+    ],
+)
+def test_remove_handles_errors(error, expected_output, capsys):
+    class FailingContainer(Container):
+        def remove(self, *args, **kwargs):
+            raise error
+
+    reaper = ContainerReaper()
+    reaper.remove(FailingContainer("image", "name", {}))
+    reaper.drain()
+    assert capsys.readouterr().out == expected_output
+
+
+class BlockingContainer(Container):
+    def __init__(self):
+        super().__init__("image", "name", {})
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def remove(self, *args, **kwargs):
+        self.started.set()
+        self.release.wait(5)
+        super().remove(*args, **kwargs)
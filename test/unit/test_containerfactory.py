@@ -1,4 +1,29 @@
-from .mockdocker import Containers, Images
+import hashlib
+import io
+import os
+import socket
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+from uuid import uuid4 as uuid
+
+import docker
+import pytest
+import requests
+from glotter_core.testinfo import ContainerInfo
+
+from glotter import containerfactory
+from glotter.containerfactory import (
+    KILL_EXECS_SCRIPT,
+    SCRUB_COMMAND,
+    SHARED_SOURCE_ROOT,
+    ContainerFactory,
+)
+from glotter.pull_limiter import PullLimiter
+from glotter.source import Source
+
+from .mockdocker import Containers, DockerApi, Images
 
 
 def test_get_image_returns_image(factory, container_info):
@@ -32,45 +57,654 @@ def test_remove_image_does_when_not_found(factory, container_info):
     assert Images.image_list == ["foo:bar"]
 
 
-def test_get_container_uses_correct_image(factory, source_no_build, monkeypatch):
-    monkeypatch.setattr("tempfile.mkdtemp", lambda *args, **kwargs: "TEMP_DIR")
-    monkeypatch.setattr("os.chmod", lambda *args, **kwargs: "")
-    monkeypatch.setattr("shutil.copy", lambda *args, **kwargs: "")
+def test_get_container_uses_correct_image(factory, source_no_build, no_io):
     result = factory.get_container(source_no_build)
     assert result.image == "python:3.7-alpine"
 
 
-def test_get_container_runs_container_with_correct_settings(factory, source_no_build, monkeypatch):
-    monkeypatch.setattr("tempfile.mkdtemp", lambda *args, **kwargs: "TEMP_DIR")
-    monkeypatch.setattr("os.chmod", lambda *args, **kwargs: "")
-    monkeypatch.setattr("shutil.copy", lambda *args, **kwargs: "")
+def test_get_container_runs_container_with_correct_settings(factory, source_no_build, no_io):
     result = factory.get_container(source_no_build)
     assert result.name.startswith(source_no_build.name)
-    assert result["command"] == "sleep 1h"
+    assert result["command"] == containerfactory.CONTAINER_COMMAND
     assert result["working_dir"] == "/src"
     assert result["detach"]
+    assert "volumes" not in result._attributes
 
 
-def test_get_container_builds_correct_volume_info(factory, source_no_build, monkeypatch):
-    monkeypatch.setattr("tempfile.mkdtemp", lambda *args, **kwargs: "TEMP_DIR")
-    monkeypatch.setattr("shutil.copy", lambda *args, **kwargs: "")
-    monkeypatch.setattr("os.chmod", lambda *args, **kwargs: "")
+def test_get_container_stages_source_archive(factory, source_no_build, no_io):
     result = factory.get_container(source_no_build)
-    assert result["volumes"] == {"TEMP_DIR": {"bind": "/src", "mode": "rw"}}
+    assert len(result.archives) == 1
+    path, data = result.archives[0]
+    assert path == "/"
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        dir_info = tar.getmember("src")
+        assert dir_info.isdir()
+        assert dir_info.mode == 0o777
+
+        file_info = tar.getmember(f"src/{source_no_build.filename}")
+        assert file_info.mode == 0o644
+        assert tar.extractfile(file_info).read() == b"contents"
+
+
+def test_get_container_stages_source_only_once(factory, source_no_build, monkeypatch):
+    read_source = Mock(return_value=(b"contents", 0o644))
+    monkeypatch.setattr("glotter.containerfactory._read_source", read_source)
+    factory.get_container(source_no_build)
+    result = factory.get_container(source_no_build)
+    assert len(result.archives) == 1
+    read_source.assert_called_once_with(source_no_build.full_path)
+
+
+def test_get_container_shares_archive_for_same_filename_and_contents(
+    factory, source_no_build, no_io, test_info_string_no_build
+):
+    other_source = Source(
+        filename=source_no_build.filename,
+        language="python",
+        path=f"other_{source_no_build.path}",
+        test_info=test_info_string_no_build,
+        project_type="someproject",
+    )
+    different_source = _make_source(test_info_string_no_build)
+    container = factory.get_container(source_no_build)
+    other_container = factory.get_container(other_source)
+    different_container = factory.get_container(different_source)
+    assert other_container.archives[0][1] is container.archives[0][1]
+    assert different_container.archives[0][1] != container.archives[0][1]
+
+
+def test_get_source_digest(factory, source_no_build, no_io):
+    assert factory.get_source_digest(source_no_build) == hashlib.sha256(b"contents").hexdigest()
+
+
+def test_get_image_digest(factory, container_info):
+    Images.add_image(f"{container_info.image}:{container_info.tag}")
+    assert factory.get_image_digest(container_info).startswith("sha256:")
 
 
 def test_cleanup_removes_container(source_no_build, factory, no_io):
     container = factory.get_container(source_no_build)
     factory.cleanup(source_no_build)
+    factory.wait_for_removals()
     assert Containers.container_list[container.name].removed
 
 
-def test_cleanup_removes_volume_dir(source_no_build, factory, no_io, monkeypatch):
-    def verify_rmtree(path, *args, ignore_errors=False, **kwargs):
-        assert path == "TEMP_DIR"
-        assert ignore_errors
+def test_cleanup_allows_new_container_for_source(source_no_build, factory, no_io):
+    container = factory.get_container(source_no_build)
+    factory.cleanup(source_no_build)
+    assert factory.get_container(source_no_build) is not container
 
-    monkeypatch.setattr("shutil.rmtree", verify_rmtree)
 
-    factory.get_container(source_no_build)
-    factory.cleanup(source_no_build)
+def test_get_container_factory_uses_pool_size_from_environment(docker, monkeypatch):
+    monkeypatch.setenv(containerfactory.POOL_SIZE_ENV_VAR, "3")
+    with patch("glotter.containerfactory.docker.from_env") as mock_from_env:
+        mock_from_env.return_value = docker
+        assert containerfactory.get_container_factory().pool_size == 3
+
+
+def test_pooled_get_container_returns_same_container_for_same_source(
+    pooled_factory, source_no_build, no_io
+):
+    container = pooled_factory.get_container(source_no_build)
+    assert pooled_factory.get_container(source_no_build) is container
+    assert len(Containers.container_list) == 1
+
+
+def test_pooled_get_container_does_not_share_checked_out_container(
+    pooled_factory, source_no_build, no_io, test_info_string_no_build
+):
+    other_source = _make_source(test_info_string_no_build)
+    container = pooled_factory.get_container(source_no_build)
+    other_container = pooled_factory.get_container(other_source)
+    assert other_container is not container
+    assert len(Containers.container_list) == 2
+
+
+def test_pooled_cleanup_scrubs_and_reuses_container(
+    pooled_factory, source_no_build, no_io, test_info_string_no_build
+):
+    container = pooled_factory.get_container(source_no_build)
+    pooled_factory.cleanup(source_no_build)
+    assert not container.removed
+    assert container.execs[-1].cmd == SCRUB_COMMAND
+
+    other_source = _make_source(test_info_string_no_build)
+    assert pooled_factory.get_container(other_source) is container
+    assert len(Containers.container_list) == 1
+    assert len(container.archives) == 2
+
+
+def test_pooled_get_container_does_not_reuse_container_for_different_image(
+    pooled_factory, source_no_build, source_with_build, no_io
+):
+    container = pooled_factory.get_container(source_no_build)
+    pooled_factory.cleanup(source_no_build)
+    assert pooled_factory.get_container(source_with_build) is not container
+    assert len(Containers.container_list) == 2
+
+
+def test_pooled_get_container_does_not_reuse_stopped_container(
+    pooled_factory, source_no_build, no_io, test_info_string_no_build
+):
+    container = pooled_factory.get_container(source_no_build)
+    pooled_factory.cleanup(source_no_build)
+    container.status = "exited"
+
+    other_source = _make_source(test_info_string_no_build)
+    assert pooled_factory.get_container(other_source) is not container
+    pooled_factory.wait_for_removals()
+    assert container.removed
+
+
+def test_pooled_cleanup_removes_container_when_scrub_raises(pooled_factory, source_no_build, no_io):
+    container = pooled_factory.get_container(source_no_build)
+    with patch.object(container, "exec_run", side_effect=docker.errors.APIError("not running")):
+        pooled_factory.cleanup(source_no_build)
+
+    pooled_factory.wait_for_removals()
+    assert container.removed
+
+
+def test_pooled_cleanup_removes_container_when_scrub_fails(pooled_factory, source_no_build, no_io):
+    container = pooled_factory.get_container(source_no_build)
+    container.exit_code = 1
+    pooled_factory.cleanup(source_no_build)
+    pooled_factory.wait_for_removals()
+    assert container.removed
+
+
+def test_pooled_cleanup_evicts_least_recently_used_container(
+    pooled_factory, no_io, test_info_string_no_build
+):
+    sources = [_make_source(test_info_string_no_build) for _ in range(3)]
+    containers = [pooled_factory.get_container(source) for source in sources]
+    for source in sources:
+        pooled_factory.cleanup(source)
+
+    pooled_factory.wait_for_removals()
+    assert [container.removed for container in containers] == [True, False, False]
+
+
+def test_pooled_close_removes_idle_containers(pooled_factory, source_no_build, no_io):
+    container = pooled_factory.get_container(source_no_build)
+    pooled_factory.cleanup(source_no_build)
+    pooled_factory.close()
+    assert container.removed
+
+
+def test_get_container_factory_uses_shared_from_environment(docker, monkeypatch):
+    monkeypatch.setenv(containerfactory.SHARED_CONTAINERS_ENV_VAR, "1")
+    with patch("glotter.containerfactory.docker.from_env") as mock_from_env:
+        mock_from_env.return_value = docker
+        assert containerfactory.get_container_factory().shared
+
+
+def test_shared_get_container_stages_sources_into_one_container(
+    shared_factory, no_io, test_info_string_no_build
+):
+    sources = [_make_source(test_info_string_no_build) for _ in range(2)]
+    containers = [shared_factory.get_container(source) for source in sources]
+    assert containers[0] is containers[1]
+    assert shared_factory.get_container(sources[0]) is containers[0]
+    assert len(Containers.container_list) == 1
+
+    container = containers[0]
+    assert [exec.cmd for exec in container.execs] == [
+        ["mkdir", "-p", f"{SHARED_SOURCE_ROOT}/0"],
+        ["mkdir", "-p", f"{SHARED_SOURCE_ROOT}/1"],
+    ]
+    assert [path for path, _ in container.archives] == [
+        f"{SHARED_SOURCE_ROOT}/0",
+        f"{SHARED_SOURCE_ROOT}/1",
+    ]
+    assert [shared_factory.get_source_dir(source) for source in sources] == [
+        f"{SHARED_SOURCE_ROOT}/0/src",
+        f"{SHARED_SOURCE_ROOT}/1/src",
+    ]
+
+
+def test_shared_get_container_replaces_stopped_container(
+    shared_factory, no_io, test_info_string_no_build
+):
+    sources = [_make_source(test_info_string_no_build) for _ in range(2)]
+    container = shared_factory.get_container(sources[0])
+    container.status = "exited"
+
+    new_container = shared_factory.get_container(sources[1])
+    assert new_container is not container
+    shared_factory.wait_for_removals()
+    assert container.removed
+
+    # Sources that were staged into the stopped container are staged into the new one
+    assert shared_factory.get_container(sources[0]) is new_container
+    assert len(new_container.archives) == 2
+
+
+def test_shared_get_container_does_not_share_container_for_different_image(
+    shared_factory, source_no_build, source_with_build, no_io
+):
+    container = shared_factory.get_container(source_no_build)
+    assert shared_factory.get_container(source_with_build) is not container
+    assert len(Containers.container_list) == 2
+
+
+def test_shared_get_container_does_not_share_container_for_different_cache_volumes(
+    shared_factory, test_info_string_no_build, no_io
+):
+    source = make_cache_source(test_info_string_no_build, "python")
+    other_source = make_cache_source(test_info_string_no_build, "other")
+    assert shared_factory.get_container(source) is not shared_factory.get_container(other_source)
+
+
+def test_shared_get_container_does_not_share_container_for_source_dir_commands(
+    shared_factory, source_no_build, no_io, test_info_string_no_build
+):
+    other_source = _make_source(
+        test_info_string_no_build.replace('cmd: "python', 'cmd: "python /src/')
+    )
+    container = shared_factory.get_container(source_no_build)
+    other_container = shared_factory.get_container(other_source)
+    assert other_container is not container
+    assert other_container.archives[0][0] == "/"
+    assert shared_factory.get_source_dir(other_source) == "/src"
+
+
+def test_shared_cleanup_removes_source_dir(shared_factory, source_no_build, no_io):
+    container = shared_factory.get_container(source_no_build)
+    shared_factory.cleanup(source_no_build)
+    assert not container.removed
+    assert container.execs[-1].cmd == ["rm", "-rf", f"{SHARED_SOURCE_ROOT}/0"]
+    assert shared_factory.get_source_dir(source_no_build) == "/src"
+
+    assert shared_factory.get_container(source_no_build) is container
+    assert container.archives[-1][0] == f"{SHARED_SOURCE_ROOT}/1"
+
+
+def test_shared_cleanup_removes_container_when_scrub_fails(shared_factory, source_no_build, no_io):
+    container = shared_factory.get_container(source_no_build)
+    with patch.object(container, "exec_run", side_effect=docker.errors.APIError("not running")):
+        shared_factory.cleanup(source_no_build)
+
+    shared_factory.wait_for_removals()
+    assert container.removed
+    assert shared_factory.get_container(source_no_build) is not container
+
+
+def test_shared_close_removes_containers(shared_factory, source_no_build, source_with_build, no_io):
+    containers = [
+        shared_factory.get_container(source_no_build),
+        shared_factory.get_container(source_with_build),
+    ]
+    shared_factory.close()
+    assert all(container.removed for container in containers)
+
+
+@pytest.mark.parametrize(
+    ("exit_code", "expected_result"),
+    [pytest.param(0, True, id="killed"), pytest.param(1, False, id="failed")],
+)
+def test_kill_execs_kills_processes_in_source_dir(
+    shared_factory, source_no_build, no_io, exit_code, expected_result
+):
+    container = shared_factory.get_container(source_no_build)
+    container.exit_code = exit_code
+    assert shared_factory.kill_execs(source_no_build) == expected_result
+    assert container.execs[-1].cmd == [
+        "sh",
+        "-c",
+        KILL_EXECS_SCRIPT,
+        "sh",
+        f"{SHARED_SOURCE_ROOT}/0/src",
+    ]
+    assert not container.removed
+
+
+def test_kill_execs_returns_false_on_api_error(factory, source_no_build, no_io):
+    container = factory.get_container(source_no_build)
+    with patch.object(container, "exec_run", side_effect=docker.errors.APIError("gone")):
+        assert not factory.kill_execs(source_no_build)
+
+
+def test_remove_container_removes_container(factory, source_no_build, no_io):
+    container = factory.get_container(source_no_build)
+    factory.remove_container(source_no_build)
+    factory.wait_for_removals()
+    assert container.removed
+    assert factory.get_container(source_no_build) is not container
+
+
+def test_shared_remove_container_removes_container_for_all_sources(
+    shared_factory, no_io, test_info_string_no_build
+):
+    sources = [_make_source(test_info_string_no_build) for _ in range(2)]
+    container = shared_factory.get_container(sources[0])
+    shared_factory.get_container(sources[1])
+
+    shared_factory.remove_container(sources[0])
+    shared_factory.wait_for_removals()
+    assert container.removed
+    new_container = shared_factory.get_container(sources[1])
+    assert new_container is not container
+    assert shared_factory.get_container(sources[0]) is new_container
+
+
+def _make_source(test_info_string):
+    iid = uuid().hex
+    return Source(
+        filename=f"sourcename_{iid}",
+        language="python",
+        path=f"sourcepath_{iid}",
+        test_info=test_info_string,
+        project_type="someproject",
+    )
+
+
+def test_get_container_factory_uses_disk_budget_from_environment(docker, monkeypatch):
+    monkeypatch.setenv(containerfactory.DISK_BUDGET_ENV_VAR, "1024")
+    with patch("glotter.containerfactory.docker.from_env") as mock_from_env:
+        mock_from_env.return_value = docker
+        assert containerfactory.get_container_factory().disk_budget == 1024
+
+
+def test_get_image_evicts_least_recently_used_image(budget_factory):
+    budget_factory.get_image(make_container_info("img1"), quiet=True)
+    budget_factory.get_image(make_container_info("img2"), quiet=True)
+    budget_factory.get_image(make_container_info("img1"), quiet=True)
+    budget_factory.get_image(make_container_info("img3"), quiet=True)
+    assert Images.image_list == ["img1:latest", "img3:latest"]
+
+
+def test_get_image_does_not_evict_pending_images(budget_factory):
+    budget_factory.add_pending_images([make_container_info("img1")])
+    budget_factory.get_image(make_container_info("img1"), quiet=True)
+    budget_factory.get_image(make_container_info("img2"), quiet=True)
+    budget_factory.get_image(make_container_info("img3"), quiet=True)
+    assert Images.image_list == ["img1:latest", "img3:latest"]
+
+    budget_factory.release_pending_images([make_container_info("img1")])
+    budget_factory.get_image(make_container_info("img4"), quiet=True)
+    assert Images.image_list == ["img3:latest", "img4:latest"]
+
+
+def test_get_image_does_not_evict_images_in_use(budget_factory):
+    budget_factory.get_image(make_container_info("img1"), quiet=True)
+    budget_factory.get_image(make_container_info("img2"), quiet=True)
+    Containers.run("img1:latest", name="uses-img1")
+    with patch.object(Images, "remove", wraps=Images.remove) as mock_remove:
+        budget_factory.get_image(make_container_info("img3"), quiet=True)
+
+    assert Images.image_list == ["img1:latest", "img3:latest"]
+    assert all(not call.kwargs["force"] for call in mock_remove.call_args_list)
+
+
+def test_disk_budget_is_shared_by_factories(docker):
+    # Each factory stands in for a pytest-xdist worker
+    with patch("glotter.containerfactory.docker.from_env", return_value=docker):
+        factories = [ContainerFactory(disk_budget=25000) for _ in range(2)]
+
+    factories[0].add_pending_images([make_container_info("img1")])
+    factories[0].get_image(make_container_info("img1"), quiet=True)
+    factories[1].get_image(make_container_info("img2"), quiet=True)
+    factories[1].get_image(make_container_info("img3"), quiet=True)
+    assert Images.image_list == ["img1:latest", "img3:latest"]
+
+    factories[0].release_pending_images([make_container_info("img1")])
+    factories[1].get_image(make_container_info("img4"), quiet=True)
+    assert Images.image_list == ["img3:latest", "img4:latest"]
+
+
+def test_get_image_does_not_evict_without_disk_budget(factory):
+    for image in ["img1", "img2", "img3"]:
+        factory.get_image(make_container_info(image), quiet=True)
+
+    assert Images.image_list == ["img1:latest", "img2:latest", "img3:latest"]
+
+
+def test_image_inventory_is_loaded_once(factory, container_info):
+    name = f"{container_info.image}:{container_info.tag}"
+    Images.add_image(name)
+    with (
+        patch.object(Images, "list", wraps=Images.list) as mock_list,
+        patch.object(Images, "get", wraps=Images.get) as mock_get,
+    ):
+        for _ in range(3):
+            assert factory.get_image(container_info, quiet=True) == name
+
+        factory.get_image_size(container_info)
+        factory.get_image_digest(container_info, pull=False)
+
+    mock_list.assert_called_once_with()
+    mock_get.assert_not_called()
+
+
+def test_image_inventory_is_updated_on_pull_and_remove(factory, container_info):
+    name = f"{container_info.image}:{container_info.tag}"
+    factory.get_image(container_info, quiet=True)
+    with patch.object(DockerApi, "pull", wraps=DockerApi.pull) as mock_pull:
+        factory.get_image(container_info, quiet=True)
+        mock_pull.assert_not_called()
+
+        factory.remove_image(container_info)
+        assert name not in Images.image_list
+        factory.get_image(container_info, quiet=True)
+        mock_pull.assert_called_once()
+
+
+def test_image_inventory_finds_image_added_by_another_process(factory, container_info):
+    factory.get_image_size(container_info)
+    name = f"{container_info.image}:{container_info.tag}"
+    Images.add_image(name)
+    with patch.object(DockerApi, "pull") as mock_pull:
+        assert factory.get_image(container_info, quiet=True) == name
+
+    mock_pull.assert_not_called()
+
+
+def test_image_inventory_normalizes_docker_hub_names(factory):
+    Images.add_image("python:3.7-alpine")
+    container_info = ContainerInfo(image="docker.io/library/python", tag="3.7-alpine", cmd="run")
+    with patch.object(DockerApi, "pull") as mock_pull:
+        assert factory.get_image(container_info, quiet=True) == "python:3.7-alpine"
+
+    mock_pull.assert_not_called()
+
+
+def test_get_container_pulls_image_removed_by_another_process(factory, source_no_build, no_io):
+    factory.get_image(source_no_build.test_info.container_info, quiet=True)
+    Images.clear()
+    run = Containers.run
+
+    def run_image(image, **kwargs):
+        if image not in Images.image_list:
+            raise containerfactory.docker.errors.ImageNotFound(image)
+
+        return run(image, **kwargs)
+
+    with patch.object(Containers, "run", side_effect=run_image):
+        assert factory.get_container(source_no_build).image == "python:3.7-alpine"
+
+
+def test_get_image_pulls_once_for_concurrent_processes(docker, container_info, capsys):
+    # Each factory stands in for a separate pytest-xdist worker
+    with patch("glotter.containerfactory.docker.from_env", return_value=docker):
+        factories = [ContainerFactory() for _ in range(3)]
+
+    pull = DockerApi.pull
+
+    def slow_pull(repository, **kwargs):
+        time.sleep(0.1)
+        return pull(repository, **kwargs)
+
+    with (
+        patch.object(DockerApi, "pull", side_effect=slow_pull) as mock_pull,
+        ThreadPoolExecutor(max_workers=3) as executor,
+    ):
+        images = list(executor.map(lambda factory: factory.get_image(container_info), factories))
+
+    name = f"{container_info.image}:{container_info.tag}"
+    assert images == [name] * 3
+    assert mock_pull.call_count == 1
+    assert capsys.readouterr().out.count(f"Waiting for another process to get {name}") == 2
+
+
+def test_get_image_retries_transient_pull_errors(factory, container_info, pull_limiter):
+    DockerApi.pull_errors += [
+        "toomanyrequests: You have reached your pull rate limit",
+        containerfactory.docker.errors.APIError("net/http: TLS handshake timeout"),
+    ]
+    with patch.object(DockerApi, "pull", wraps=DockerApi.pull) as mock_pull:
+        result = factory.get_image(container_info, quiet=True)
+
+    assert result == f"{container_info.image}:{container_info.tag}"
+    assert mock_pull.call_count == 3
+    assert len(pull_limiter.sleeps) == 2
+
+
+@pytest.mark.parametrize(
+    ("error", "expected_wait"),
+    [
+        pytest.param(
+            "toomanyrequests: retry-after: 1m30s, allowed: 100/minute", 90.0, id="message"
+        ),
+        pytest.param({"error": "Rate exceeded", "errorDetail": {"code": 429}}, None, id="code"),
+    ],
+)
+def test_get_image_waits_for_rate_limited_pull(
+    error, expected_wait, factory, container_info, pull_limiter
+):
+    DockerApi.pull_errors.append(error)
+    with patch.object(DockerApi, "pull", wraps=DockerApi.pull) as mock_pull:
+        factory.get_image(container_info, quiet=True)
+
+    assert mock_pull.call_count == 2
+    if expected_wait is not None:
+        assert sum(pull_limiter.sleeps) == pytest.approx(expected_wait)
+
+
+def test_get_image_raises_permanent_pull_errors(factory, container_info, pull_limiter):
+    DockerApi.pull_errors.append("manifest for python:3.7-alpine not found: manifest unknown")
+    with (
+        patch.object(DockerApi, "pull", wraps=DockerApi.pull) as mock_pull,
+        pytest.raises(containerfactory.docker.errors.APIError, match="manifest unknown"),
+    ):
+        factory.get_image(container_info, quiet=True)
+
+    assert mock_pull.call_count == 1
+    assert pull_limiter.sleeps == []
+
+
+def test_get_registry_digest_retries_transient_errors(factory, container_info, pull_limiter):
+    get_registry_data = Images.get_registry_data
+    errors = [requests.exceptions.ConnectionError("connection reset")]
+
+    def flaky_get_registry_data(name):
+        if errors:
+            raise errors.pop()
+
+        return get_registry_data(name)
+
+    with patch.object(Images, "get_registry_data", side_effect=flaky_get_registry_data):
+        digest = factory.get_registry_digest(container_info)
+
+    assert digest == get_registry_data(f"{container_info.image}:{container_info.tag}").id
+    assert len(pull_limiter.sleeps) == 1
+
+
+def test_get_container_mounts_cache_volumes(factory, test_info_string_no_build, no_io):
+    sources = [
+        make_cache_source(test_info_string_no_build, "python"),
+        make_cache_source(test_info_string_no_build, "python"),
+        make_cache_source(test_info_string_no_build, "other"),
+    ]
+    volumes = [factory.get_container(source)["volumes"] for source in sources]
+
+    assert volumes[0] == volumes[1]
+    assert volumes[0] != volumes[2]
+    for source_volumes, language in zip(volumes, ["python", "python", "other"]):
+        assert sorted(volume["bind"] for volume in source_volumes.values()) == [
+            "/root/.cache/pip",
+            "/tmp/cache",
+        ]
+        assert all(name.startswith(f"glotter-cache-{language}-") for name in source_volumes)
+
+
+def test_get_container_labels_container(factory, source_no_build, no_io):
+    container = factory.get_container(source_no_build)
+    assert container.labels == {
+        containerfactory.PID_LABEL: str(os.getpid()),
+        containerfactory.HOST_LABEL: socket.gethostname(),
+    }
+
+
+def test_get_cache_volumes_depends_on_image(test_info_string_no_build):
+    source = make_cache_source(test_info_string_no_build, "python")
+    other_source = make_cache_source(
+        test_info_string_no_build.replace("3.7-alpine", "3.12-alpine"), "python"
+    )
+    assert (
+        containerfactory.get_cache_volumes(source)
+        .keys()
+        .isdisjoint(containerfactory.get_cache_volumes(other_source))
+    )
+
+
+def test_pooled_get_container_does_not_reuse_container_for_different_cache_volumes(
+    pooled_factory, test_info_string_no_build, no_io
+):
+    source = make_cache_source(test_info_string_no_build, "python")
+    other_source = make_cache_source(test_info_string_no_build, "other")
+    container = pooled_factory.get_container(source)
+    pooled_factory.cleanup(source)
+
+    assert pooled_factory.get_container(other_source) is not container
+
+
+def make_cache_source(test_info_string, language):
+    return Source(
+        filename=f"sourcename_{uuid().hex}",
+        language=language,
+        path=f"sourcepath_{uuid().hex}",
+        test_info=test_info_string + "  cache: [/root/.cache/pip, /tmp/cache/]\n",
+        project_type="someproject",
+    )
+
+
+def make_container_info(image):
+    return ContainerInfo(image=image, tag="latest", cmd="run")
+
+
+@pytest.fixture
+def pull_limiter():
+    sleeps = []
+    limiter = PullLimiter(clock=lambda: sum(sleeps), sleep=sleeps.append)
+    limiter.sleeps = sleeps
+    with patch("glotter.containerfactory.get_pull_limiter", return_value=limiter):
+        yield limiter
+
+
+@pytest.fixture
+def budget_factory(docker):
+    # Each image is 11000 bytes in the mock, so only two images fit
+    with patch("glotter.containerfactory.docker.from_env") as mock_from_env:
+        mock_from_env.return_value = docker
+        return ContainerFactory(disk_budget=25000)
+
+
+@pytest.fixture
+def pooled_factory(docker):
+    with patch("glotter.containerfactory.docker.from_env") as mock_from_env:
+        mock_from_env.return_value = docker
+        factory = ContainerFactory(pool_size=2)
+
+    yield factory
+    factory.close()
+
+
+@pytest.fixture
+def shared_factory(docker):
+    with patch("glotter.containerfactory.docker.from_env") as mock_from_env:
+        mock_from_env.return_value = docker
+        factory = ContainerFactory(shared=True)
+
+    yield factory
+    factory.close()
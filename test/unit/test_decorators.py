@@ -0,0 +1,18 @@
+import sys
+import types
+
+from glotter.decorators import project_fixture, unload_fixture_modules
+
+
+def test_unload_fixture_modules(monkeypatch):
+    monkeypatch.setattr("glotter.decorators.get_project_sources", lambda project_type: [])
+    module = types.ModuleType("test_glotter_fixture_module")
+    monkeypatch.setitem(sys.modules, module.__name__, module)
+
+    def baklava(request):
+        yield request.param
+
+    baklava.__module__ = module.__name__
+    project_fixture("baklava")(baklava)
+    unload_fixture_modules()
+    assert module.__name__ not in sys.modules
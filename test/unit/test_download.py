@@ -1,53 +1,248 @@
-from unittest.mock import ANY, call, patch
+import threading
+from collections import Counter
+from unittest.mock import call, patch
 
 import pytest
 
 from glotter import download
-
-from .common import set_mock_thread_pool_executor_map
+from glotter.history import History, get_default_history_path
+from glotter.pull_limiter import get_pull_limiter
 
 
 @pytest.mark.parametrize("parallel", [False, True])
-def test_download_images(
-    parallel, mock_filter_sources, mock_thread_pool_executor, mock_container_factory
-):
-    mock_map = set_mock_thread_pool_executor_map(mock_thread_pool_executor)
-
+def test_download_images(parallel, mock_filter_sources, mock_container_factory):
     args = MockArgs(parallel=parallel)
     download.download(args)
 
-    if parallel:
-        mock_thread_pool_executor.assert_called_once_with(max_workers=4)
-        mock_map.assert_called_once()
-    else:
-        mock_thread_pool_executor.assert_not_called()
-
     mock_get_image = mock_container_factory.return_value.get_image
     expected_container_info = get_expected_container_info(mock_filter_sources)
-    expected_calls = [call(ci, parallel=ANY) for ci in expected_container_info.values()]
+    expected_calls = [call(ci, parallel=parallel) for ci in expected_container_info.values()]
     mock_get_image.assert_has_calls(expected_calls, any_order=True)
 
 
+def test_download_images_largest_first(mock_filter_sources, mock_container_factory):
+    names = list(get_expected_container_info(mock_filter_sources))
+    History(get_default_history_path()).update(pull_sizes={names[0]: 1000, names[1]: 2000})
+    mock_container_factory.return_value.get_image_size.return_value = None
+    mock_container_factory.return_value.get_image.return_value.attrs = {}
+
+    download.download(MockArgs(parallel=False))
+
+    mock_get_image = mock_container_factory.return_value.get_image
+    assert [f"{c.args[0].image}:{c.args[0].tag}" for c in mock_get_image.call_args_list] == [
+        names[1],
+        names[0],
+    ]
+
+
+def test_download_images_records_pull_sizes(mock_filter_sources, mock_container_factory, capsys):
+    mock_factory = mock_container_factory.return_value
+    mock_factory.get_image_size.return_value = None
+    mock_factory.get_image.return_value.attrs = {"Size": 3 * 1024 * 1024}
+
+    download.download(MockArgs(parallel=True))
+
+    history = History(get_default_history_path())
+    for name in get_expected_container_info(mock_filter_sources):
+        assert history.get_pull_size(name) == 3 * 1024 * 1024
+
+    assert "Downloaded 2 images (6.0 MiB) in " in capsys.readouterr().out
+
+
+def test_download_images_skips_present_images(mock_filter_sources, mock_container_factory, capsys):
+    download.download(MockArgs(parallel=True))
+
+    assert History(get_default_history_path()).images == {}
+    assert "Downloaded" not in capsys.readouterr().out
+
+
 @pytest.mark.parametrize("parallel", [False, True])
-def test_remove_images(
-    parallel, mock_filter_sources, mock_thread_pool_executor, mock_container_factory
+def test_download_images_reports_all_errors(
+    parallel, mock_filter_sources, mock_container_factory, capsys
 ):
-    mock_map = set_mock_thread_pool_executor_map(mock_thread_pool_executor)
+    names = list(get_expected_container_info(mock_filter_sources))
+    mock_container_factory.return_value.get_image.side_effect = RuntimeError("pull failed")
 
-    container_info = get_expected_container_info(mock_filter_sources)
-    download.remove_images(containers=container_info, parallel=parallel)
+    with pytest.raises(SystemExit) as e:
+        download.download(MockArgs(parallel=parallel))
+
+    assert e.value.code != 0
+    assert mock_container_factory.return_value.get_image.call_count == len(names)
+    output = capsys.readouterr().out
+    for name in names:
+        assert f"- {name}: pull failed" in output
+
+
+def test_download_images_returns_errors(mock_filter_sources, mock_container_factory):
+    expected_container_info = get_expected_container_info(mock_filter_sources)
+    error = RuntimeError("pull failed")
+    mock_container_factory.return_value.get_image.side_effect = error
+
+    containers, errors = download.download_images(MockArgs(parallel=True))
+
+    assert containers == expected_container_info
+    assert errors == {name: error for name in expected_container_info}
+
+
+@pytest.mark.parametrize("to_cache", [False, True])
+@pytest.mark.parametrize("parallel", [False, True])
+def test_download_images_to_cache(parallel, to_cache, mock_filter_sources, mock_container_factory):
+    download.download(MockArgs(parallel=parallel, to_cache=to_cache))
 
-    if parallel:
-        mock_thread_pool_executor.assert_called_once_with(max_workers=4)
-        mock_map.assert_called_once()
+    mock_save = mock_container_factory.return_value.save_image_to_cache
+    if to_cache:
+        expected_container_info = get_expected_container_info(mock_filter_sources)
+        expected_calls = [call(ci) for ci in expected_container_info.values()]
+        mock_save.assert_has_calls(expected_calls, any_order=True)
     else:
-        mock_thread_pool_executor.assert_not_called()
+        mock_save.assert_not_called()
+
+
+@pytest.mark.parametrize("disk_budget", [None, 1024])
+def test_download_images_sets_disk_budget(disk_budget, mock_filter_sources, mock_container_factory):
+    download.download(MockArgs(parallel=False, disk_budget=disk_budget))
+    assert mock_container_factory.return_value.disk_budget == (disk_budget or 0)
+
+
+@pytest.mark.parametrize(
+    ("pull_rate", "pull_retries", "expected_rate", "expected_retries"),
+    [(None, None, 0, 5), (30.0, 2, 30.0, 2)],
+)
+def test_download_images_configures_pull_limiter(
+    pull_rate,
+    pull_retries,
+    expected_rate,
+    expected_retries,
+    mock_filter_sources,
+    mock_container_factory,
+):
+    download.download(MockArgs(parallel=True, pull_rate=pull_rate, pull_retries=pull_retries))
+
+    pull_limiter = get_pull_limiter()
+    assert pull_limiter.rate == expected_rate
+    assert pull_limiter.retries == expected_retries
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_remove_images(parallel, mock_filter_sources, mock_container_factory):
+    container_info = get_expected_container_info(mock_filter_sources)
+    download.remove_images(containers=container_info, parallel=parallel)
 
     mock_remove_image = mock_container_factory.return_value.remove_image
     expected_calls = [call(ci) for ci in container_info.values()]
     mock_remove_image.assert_has_calls(expected_calls, any_order=True)
 
 
+def test_remove_images_reports_errors(mock_filter_sources, mock_container_factory, capsys):
+    container_info = get_expected_container_info(mock_filter_sources)
+    mock_container_factory.return_value.remove_image.side_effect = RuntimeError("in use")
+
+    download.remove_images(containers=container_info, parallel=True)
+
+    output = capsys.readouterr().out
+    for name in container_info:
+        assert f"Unable to remove {name}: in use" in output
+
+
+@pytest.mark.parametrize("concurrency", [1, 2, 4])
+def test_run_scheduled_order_and_concurrency(concurrency):
+    lock = threading.Lock()
+    running = []
+    started = []
+    max_running = [0]
+
+    # The first tasks wait for each other so that the maximum number of tasks run together
+    barrier = threading.Barrier(concurrency)
+
+    def make_task(name):
+        def task():
+            with lock:
+                started.append(name)
+                running.append(name)
+                max_running[0] = max(max_running[0], len(running))
+
+            if names.index(name) < concurrency:
+                barrier.wait(timeout=5)
+
+            with lock:
+                running.remove(name)
+
+            return name.upper()
+
+        return task
+
+    names = [f"image{n}" for n in range(6)]
+    results, errors = download.run_scheduled(
+        [(name, "docker.io", make_task(name)) for name in names], concurrency
+    )
+
+    assert results == {name: name.upper() for name in names}
+    assert errors == {}
+    assert max_running[0] == concurrency
+    if concurrency == 1:
+        assert started == names
+
+
+def test_run_scheduled_key_concurrency():
+    lock = threading.Lock()
+    running = Counter()
+    max_running = Counter()
+    started = []
+
+    # The tasks that are started first wait for each other so that they run together
+    barrier = threading.Barrier(3)
+
+    def make_task(name, key):
+        def task():
+            with lock:
+                started.append(name)
+                running[key] += 1
+                max_running[key] = max(max_running[key], running[key])
+
+            if name in ("a0", "a1", "b0"):
+                barrier.wait(timeout=5)
+
+            with lock:
+                running[key] -= 1
+
+        return task
+
+    tasks = [(f"a{n}", "a") for n in range(4)] + [("b0", "b")]
+    download.run_scheduled(
+        [(name, key, make_task(name, key)) for name, key in tasks], 3, key_concurrency=2
+    )
+
+    assert max_running == Counter({"a": 2, "b": 1})
+    assert started.index("b0") < started.index("a2")
+
+
+def test_run_scheduled_errors():
+    def fail():
+        raise ValueError("bad image")
+
+    results, errors = download.run_scheduled([("good", None, lambda: 1), ("bad", None, fail)], 2)
+
+    assert results == {"good": 1}
+    assert list(errors) == ["bad"]
+    assert str(errors["bad"]) == "bad image"
+
+
+@pytest.mark.parametrize(
+    ("image", "expected_registry"),
+    [
+        ("python", "docker.io"),
+        ("library/python", "docker.io"),
+        ("rzuckerm/pascal", "docker.io"),
+        ("docker.io/library/python", "docker.io"),
+        ("ghcr.io/owner/image", "ghcr.io"),
+        ("localhost/image", "localhost"),
+        ("localhost:5000/image", "localhost:5000"),
+    ],
+)
+def test_get_registry(image, expected_registry):
+    assert download.get_registry(image) == expected_registry
+
+
 def get_expected_container_info(mock_filter_sources):
     def get_key(source):
         return f"{source.test_info.container_info.image}:{source.test_info.container_info.tag}"
@@ -59,6 +254,11 @@ def get_expected_container_info(mock_filter_sources):
     }
 
 
+@pytest.fixture(autouse=True)
+def download_environment(cache_dir):
+    yield
+
+
 @pytest.fixture
 def mock_filter_sources(source_no_build, source_with_build):
     with patch("glotter.download.filter_sources") as mock:
@@ -66,12 +266,6 @@ def mock_filter_sources(source_no_build, source_with_build):
         yield mock
 
 
-@pytest.fixture
-def mock_thread_pool_executor():
-    with patch("glotter.download.ThreadPoolExecutor") as mock:
-        yield mock
-
-
 @pytest.fixture
 def mock_container_factory():
     with patch("glotter.download.get_container_factory") as mock:
@@ -79,5 +273,24 @@ def mock_container_factory():
 
 
 class MockArgs:
-    def __init__(self, parallel):
+    def __init__(
+        self,
+        parallel,
+        changed_since=None,
+        disk_budget=None,
+        to_cache=False,
+        history=None,
+        pull_concurrency=None,
+        registry_concurrency=None,
+        pull_rate=None,
+        pull_retries=None,
+    ):
         self.parallel = parallel
+        self.changed_since = changed_since
+        self.disk_budget = disk_budget
+        self.to_cache = to_cache
+        self.history = history
+        self.pull_concurrency = pull_concurrency
+        self.registry_concurrency = registry_concurrency
+        self.pull_rate = pull_rate
+        self.pull_retries = pull_retries
@@ -0,0 +1,105 @@
+import subprocess
+
+import pytest
+
+from glotter.exec_driver import (
+    get_driver_command,
+    get_parallel_driver_command,
+    parse_driver_output,
+    parse_parallel_driver_output,
+)
+
+
+def test_get_driver_command_uses_unique_marker():
+    _, marker1 = get_driver_command(["echo hi"])
+    _, marker2 = get_driver_command(["echo hi"])
+    assert marker1 != marker2
+
+
+def test_get_driver_command_runs_commands_in_single_exec():
+    commands = [
+        "echo hello",
+        'sh -c "echo error >&2; exit 3"',
+        'printf "no newline $HOME"',
+        "cat",
+    ]
+    driver_command, marker = get_driver_command(commands)
+    assert driver_command[:2] == ["sh", "-c"]
+
+    output = subprocess.run(driver_command, stdout=subprocess.PIPE, check=True).stdout
+    results = parse_driver_output(output, marker, len(commands))
+    assert [result[:2] for result in results] == [
+        (0, b"hello\n"),
+        (3, b"error\n"),
+        (0, b"no newline $HOME"),
+        (0, b""),
+    ]
+    assert all(duration is not None and duration >= 0 for *_, duration in results)
+
+
+@pytest.mark.parametrize(
+    ("output", "num_commands", "expected"),
+    [
+        pytest.param(b"", 0, [], id="empty"),
+        pytest.param(
+            b"MARKER 0 4 1.50 2.00\nfoo\nMARKER 1 0 2.00 2.25\n",
+            2,
+            [(0, b"foo\n", 0.5), (1, b"", 0.25)],
+            id="multiple",
+        ),
+        pytest.param(b"MARKER 0 3 - -\nfoo", 1, [(0, b"foo", None)], id="no-uptime"),
+        pytest.param(b"MARKER 0 3 1.00 2.00\nMARKER\n", 1, None, id="trailing-data"),
+        pytest.param(b"MARKER 0 3 1.00 2.00\nfoo", 2, None, id="too-few"),
+        pytest.param(b"MARKER 0 10 1.00 2.00\nfoo", 1, None, id="truncated"),
+        pytest.param(b"OTHER 0 3 1.00 2.00\nfoo", 1, None, id="bad-marker"),
+        pytest.param(b"MARKER x 3 1.00 2.00\nfoo", 1, None, id="bad-exit-code"),
+        pytest.param(b"MARKER 0 3\nfoo", 1, None, id="no-uptime-fields"),
+        pytest.param(b"MARKER 0 3 1.00 2.00", 1, None, id="no-header-end"),
+        pytest.param(b"executed", 1, None, id="not-driver-output"),
+    ],
+)
+def test_parse_driver_output(output, num_commands, expected):
+    assert parse_driver_output(output, "MARKER", num_commands) == expected
+
+
+@pytest.mark.parametrize("jobs", [1, 2, 8])
+def test_get_parallel_driver_command_runs_commands_in_directories(jobs, tmp_path):
+    directories = []
+    for n in range(4):
+        directory = tmp_path / str(n) / "src"
+        directory.mkdir(parents=True)
+        directories.append(str(directory))
+
+    commands = [
+        "touch built",
+        'sh -c "echo output; exit 2"',
+        "sh -c 'pwd > where'",
+        "cat",
+    ]
+    driver_command, marker = get_parallel_driver_command(commands, directories, jobs)
+    assert driver_command[:2] == ["sh", "-c"]
+
+    output = subprocess.run(driver_command, stdout=subprocess.PIPE, check=True).stdout
+    assert parse_parallel_driver_output(output, marker, len(commands)) == [0, 2, 0, 0]
+    assert (tmp_path / "0" / "src" / "built").exists()
+    assert (tmp_path / "2" / "src" / "where").read_text().strip() == directories[2]
+
+
+def test_get_parallel_driver_command_limits_jobs():
+    driver_command, _ = get_parallel_driver_command(["true"] * 5, ["/"] * 5, 2)
+    assert driver_command[2].count(") &") == 2
+
+
+@pytest.mark.parametrize(
+    ("output", "num_commands", "expected"),
+    [
+        pytest.param(b"", 0, [], id="empty"),
+        pytest.param(b"MARKER 1 2\nMARKER 0 0\n", 2, [0, 2], id="out-of-order"),
+        pytest.param(b"MARKER 0 0\n", 2, None, id="too-few"),
+        pytest.param(b"MARKER 0 0\nMARKER 0 1\n", 2, None, id="duplicate"),
+        pytest.param(b"MARKER 0 0\nfoo\n", 1, None, id="extra-output"),
+        pytest.param(b"MARKER 0 x\n", 1, None, id="invalid-code"),
+    ],
+)
+def test_parse_parallel_driver_output(output, num_commands, expected):
+    assert parse_parallel_driver_output(output, "MARKER", num_commands) == expected
@@ -0,0 +1,103 @@
+import os
+import socket
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from glotter.__main__ import main
+from glotter.containerfactory import HOST_LABEL, PID_LABEL
+
+from .mockdocker import Containers, Volume, Volumes
+
+RUNNING_PID = 1000
+STOPPED_PID = 2000
+
+
+@pytest.mark.parametrize(
+    ("all_", "expected_removed"),
+    [
+        pytest.param(False, ["stopped", "invalid-pid"], id="orphaned"),
+        pytest.param(True, ["running", "stopped", "other-host", "invalid-pid"], id="all"),
+    ],
+)
+def test_gc_removes_orphaned_containers(all_, expected_removed, docker, capsys):
+    host = socket.gethostname()
+    run_container("running", {PID_LABEL: str(RUNNING_PID), HOST_LABEL: host})
+    run_container("stopped", {PID_LABEL: str(STOPPED_PID), HOST_LABEL: host})
+    run_container("other-host", {PID_LABEL: str(STOPPED_PID), HOST_LABEL: f"not-{host}"})
+    run_container("invalid-pid", {PID_LABEL: "", HOST_LABEL: host})
+    run_container("not-glotter", {})
+
+    gc_command(docker, all_=all_)
+
+    removed = [name for name, container in Containers.container_list.items() if container.removed]
+    assert removed == expected_removed
+    assert f"Removed {len(expected_removed)} containers" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    ("all_", "expected_removed"),
+    [
+        pytest.param(False, [f"glotter-tmp-{STOPPED_PID}-abc.tmp"], id="orphaned"),
+        pytest.param(
+            True,
+            [f"glotter-tmp-{RUNNING_PID}-abc.tmp", f"glotter-tmp-{STOPPED_PID}-abc.tmp"],
+            id="all",
+        ),
+    ],
+)
+def test_gc_removes_orphaned_temp_files(all_, expected_removed, docker, cache_dir):
+    filenames = [
+        f"glotter-tmp-{RUNNING_PID}-abc.tmp",
+        f"glotter-tmp-{STOPPED_PID}-abc.tmp",
+        "0123abcd.tar",
+    ]
+    directory = cache_dir / "builds"
+    directory.mkdir(parents=True)
+    for filename in filenames:
+        (directory / filename).write_bytes(b"")
+
+    gc_command(docker, all_=all_)
+
+    assert sorted(set(filenames) - set(os.listdir(directory))) == expected_removed
+
+
+@pytest.mark.parametrize("volumes", [False, True])
+def test_gc_removes_cache_volumes(volumes, docker, capsys):
+    Volumes.volume_list = [
+        Volume("glotter-cache-go-0123"),
+        Volume("glotter-cache-python-4567", in_use=True),
+        Volume("other-glotter-cache-go"),
+    ]
+
+    gc_command(docker, volumes=volumes)
+
+    expected_names = ["glotter-cache-python-4567", "other-glotter-cache-go"]
+    if not volumes:
+        expected_names.insert(0, "glotter-cache-go-0123")
+
+    assert [volume.name for volume in Volumes.volume_list] == expected_names
+    output = capsys.readouterr().out
+    if volumes:
+        assert "Unable to remove volume glotter-cache-python-4567" in output
+        assert "Removed 1 cache volumes" in output
+    else:
+        assert "cache volumes" not in output
+
+
+def run_container(name, labels):
+    Containers.run("image", name=name, labels=labels)
+
+
+def gc_command(docker, all_=False, volumes=False):
+    args = ["--all"] if all_ else []
+    if volumes:
+        args.append("--volumes")
+
+    with (
+        patch.object(sys, "argv", ["glotter", "gc"] + args),
+        patch("glotter.gc.docker.from_env", return_value=docker),
+        patch("glotter.gc.is_process_running", side_effect=lambda pid: pid == RUNNING_PID),
+    ):
+        main()
@@ -0,0 +1,125 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from glotter.history import (
+    History,
+    HistoryPlugin,
+    get_default_history_path,
+    get_durations_by_language,
+    get_language_from_node_id,
+)
+
+
+@pytest.mark.parametrize(
+    ("node_id", "expected"),
+    [
+        pytest.param("test/generated/test_baklava.py::test_baklava[Python/baklava.py]", "python"),
+        pytest.param(
+            "test/generated/test_rot13.py::test_rot13_valid[c/rot13.c-repeat1-lower case]",
+            "c",
+            id="with-param",
+        ),
+        pytest.param("test/unit/test_utils.py::test_quote", None, id="no-source"),
+    ],
+)
+def test_get_language_from_node_id(node_id, expected):
+    assert get_language_from_node_id(node_id) == expected
+
+
+def test_get_durations_by_language():
+    assert get_durations_by_language(
+        [
+            ("test_a.py::test_a[python/a.py]", 1.5),
+            ("test_b.py::test_b[python/b.py]", 2.0),
+            ("test_a.py::test_a[c/a.c]", 0.5),
+            ("test_utils.py::test_quote", 3.0),
+        ]
+    ) == {"python": 3.5, "c": 0.5}
+
+
+def test_default_history_path(cache_dir):
+    assert get_default_history_path() == os.path.join(cache_dir, "history.json")
+
+
+def test_history_without_file(tmp_path):
+    history = History(str(tmp_path / "history.json"))
+    assert history.get_duration("python") is None
+    assert history.get_image_size("python") is None
+
+
+def test_history_with_invalid_file(tmp_path):
+    path = tmp_path / "history.json"
+    path.write_text("not json", encoding="utf-8")
+    assert History(str(path)).languages == {}
+
+
+def test_history_in_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    history = History(None)
+    history.update(durations={"python": 2.0}, pull_sizes={"python:3.7-alpine": 100})
+    history.update(image_sizes={"python": 300})
+    assert history.languages == {"python": {"duration": 2.0, "image_size": 300}}
+    assert history.get_pull_size("python:3.7-alpine") == 100
+    assert not os.listdir(tmp_path)
+
+
+def test_history_update(tmp_path):
+    path = str(tmp_path / "history" / "history.json")
+    History(path).update(durations={"python": 1.0, "c": 2.0})
+
+    # Simulate another process updating the history
+    History(path).update(image_sizes={"python": 1000})
+
+    history = History(path)
+    history.update(durations={"c": 3.0})
+    assert history.get_duration("python") == 1.0
+    assert history.get_image_size("python") == 1000
+    assert history.get_duration("c") == 3.0
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f) == {
+            "languages": {"c": {"duration": 3.0}, "python": {"duration": 1.0, "image_size": 1000}}
+        }
+
+    assert os.listdir(os.path.dirname(path)) == ["history.json"]
+
+
+def test_history_update_pull_sizes(tmp_path):
+    path = str(tmp_path / "history.json")
+    History(path).update(durations={"python": 1.0})
+    History(path).update(pull_sizes={"python:3.12": 2000})
+
+    history = History(path)
+    assert history.get_pull_size("python:3.12") == 2000
+    assert history.get_pull_size("gcc:latest") is None
+    assert history.get_duration("python") == 1.0
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f) == {
+            "images": {"python:3.12": 2000},
+            "languages": {"python": {"duration": 1.0}},
+        }
+
+
+def test_history_plugin(tmp_path):
+    history = History(str(tmp_path / "history.json"))
+    plugin = HistoryPlugin(history)
+    for node_id, duration in [
+        ("test_a.py::test_a[python/a.py]", 1.0),
+        ("test_a.py::test_a[python/a.py]", 0.5),
+        ("test_a.py::test_a[ruby/a.rb]", 2.0),
+    ]:
+        plugin.pytest_runtest_logreport(SimpleNamespace(nodeid=node_id, duration=duration))
+
+    plugin.pytest_sessionfinish(None)
+    assert History(history.path).languages == {
+        "python": {"duration": 1.5},
+        "ruby": {"duration": 2.0},
+    }
+
+
+def test_history_plugin_without_durations(tmp_path):
+    history = History(str(tmp_path / "history.json"))
+    HistoryPlugin(history).pytest_sessionfinish(None)
+    assert not os.path.exists(history.path)
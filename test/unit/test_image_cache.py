@@ -0,0 +1,108 @@
+import gzip
+import json
+import os
+from unittest.mock import patch
+
+import docker
+
+from glotter.image_cache import ImageCache
+
+from .mockdocker import DockerApi, Image, Images, RegistryData
+
+
+def test_cache_dir_defaults_to_glotter_cache(cache_dir):
+    assert ImageCache().cache_dir == os.path.join(cache_dir, "images")
+
+
+def test_get_path_returns_none_when_not_cached(tmp_path, container_info):
+    assert ImageCache(cache_dir=str(tmp_path)).get_path(container_info) is None
+
+
+def test_save_and_get_path(tmp_path, container_info):
+    cache = ImageCache(cache_dir=str(tmp_path))
+    image = Image(f"{container_info.image}:{container_info.tag}")
+    cache.save(image, container_info)
+
+    path = cache.get_path(container_info)
+    assert path == os.path.join(str(tmp_path), f"{image.id.split(':')[-1]}.tar.gz")
+    with gzip.open(path, "rb") as f:
+        assert f.read() == image.encode("utf-8")
+
+
+def test_save_shares_tarball_for_same_image_id(tmp_path, container_info, monkeypatch):
+    cache = ImageCache(cache_dir=str(tmp_path))
+    image = Image(f"{container_info.image}:{container_info.tag}")
+    cache.save(image, container_info)
+
+    monkeypatch.setattr(Image, "save", lambda *args, **kwargs: iter([b"changed"]))
+    cache.save(image, container_info)
+    with gzip.open(cache.get_path(container_info), "rb") as f:
+        assert f.read() == image.encode("utf-8")
+
+
+def test_get_path_returns_none_when_tarball_is_missing(tmp_path, container_info):
+    cache = ImageCache(cache_dir=str(tmp_path))
+    cache.save(Image(f"{container_info.image}:{container_info.tag}"), container_info)
+    os.remove(cache.get_path(container_info))
+    assert cache.get_path(container_info) is None
+
+
+def test_get_image_loads_image_from_cache(factory, container_info, cache_dir):
+    name = f"{container_info.image}:{container_info.tag}"
+    Images.add_image(name)
+    factory.save_image_to_cache(container_info)
+    Images.clear()
+
+    with patch.object(DockerApi, "pull") as mock_pull:
+        assert factory.get_image(container_info, quiet=True) == name
+
+    mock_pull.assert_not_called()
+
+
+def test_get_image_pulls_image_when_cached_image_cannot_be_loaded(
+    factory, container_info, cache_dir
+):
+    name = f"{container_info.image}:{container_info.tag}"
+    Images.add_image(name)
+    factory.save_image_to_cache(container_info)
+    Images.clear()
+
+    error = docker.errors.APIError("invalid tar header")
+    with patch.object(Images, "load", side_effect=error):
+        assert factory.get_image(container_info, quiet=True) == name
+
+
+def test_save_image_to_cache_does_nothing_when_image_not_found(factory, container_info, cache_dir):
+    factory.save_image_to_cache(container_info)
+    assert ImageCache().get_path(container_info) is None
+
+
+def test_get_path_is_keyed_by_digest(tmp_path, container_info):
+    cache = ImageCache(cache_dir=str(tmp_path))
+    image = Image(f"{container_info.image}:{container_info.tag}")
+    cache.save(image, container_info, "sha256:1234")
+
+    assert cache.get_path(container_info) is None
+    assert cache.get_path(container_info, "sha256:5678") is None
+    assert cache.get_image_id(container_info, "sha256:1234") == image.id
+    assert cache.get_path(container_info, "sha256:1234") is not None
+
+
+def test_get_image_loads_locked_image_from_cache(
+    factory, container_info, cache_dir, tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    name = f"{container_info.image}:{container_info.tag}"
+    digest = RegistryData(name).id
+    (tmp_path / "glotter.lock").write_text(json.dumps({"images": {name: digest}}))
+    factory.get_image(container_info, quiet=True)
+    factory.save_image_to_cache(container_info)
+    Images.clear()
+
+    # A loaded image has no digest
+    with patch.object(DockerApi, "pull") as mock_pull:
+        image = factory.get_image(container_info, quiet=True)
+
+    assert image == name
+    assert image.attrs["RepoDigests"] == []
+    mock_pull.assert_not_called()
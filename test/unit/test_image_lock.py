@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+from glotter.image_lock import ImageLock
+
+
+def test_get_digest_returns_none_when_no_lock_file(tmp_path, container_info):
+    assert ImageLock(str(tmp_path / "glotter.lock")).get_digest(container_info) is None
+
+
+@pytest.mark.parametrize("contents", ["not json", "[]", '{"images": []}'])
+def test_get_digest_exits_on_invalid_lock_file(contents, tmp_path, container_info, capsys):
+    path = tmp_path / "glotter.lock"
+    path.write_text(contents, encoding="utf-8")
+    with pytest.raises(SystemExit) as e:
+        ImageLock(str(path)).get_digest(container_info)
+
+    assert e.value.code != 0
+    assert f"Invalid lock file {path}" in capsys.readouterr().out
+
+
+def test_write_and_get_digest(tmp_path, container_info):
+    path = tmp_path / "glotter.lock"
+    name = f"{container_info.image}:{container_info.tag}"
+    ImageLock(str(path)).write({name: "sha256:1234"})
+
+    assert json.loads(path.read_text(encoding="utf-8")) == {"images": {name: "sha256:1234"}}
+    assert ImageLock(str(path)).get_digest(container_info) == "sha256:1234"
@@ -0,0 +1,76 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from glotter.image_usage import ImageUsage
+
+
+def test_path_defaults_to_host_file_in_glotter_cache(cache_dir):
+    assert ImageUsage().path == os.path.join(
+        cache_dir, "disk-budget", f"{socket.gethostname()}.json"
+    )
+
+
+def test_use_image_evicts_least_recently_used_images(tmp_path):
+    usage = ImageUsage(str(tmp_path / "usage.json"))
+    removed = []
+
+    def remove_image(name):
+        removed.append(name)
+        return True
+
+    for name in ["img1", "img2", "img1", "img3"]:
+        usage.use_image(name, 10, 25, remove_image)
+
+    assert removed == ["img2"]
+    assert read_usage(usage)["images"] == {"img1": 10, "img3": 10}
+
+
+def test_use_image_keeps_images_that_cannot_be_removed(tmp_path):
+    usage = ImageUsage(str(tmp_path / "usage.json"))
+    for name in ["img1", "img2", "img3"]:
+        usage.use_image(name, 10, 25, lambda name: False)
+
+    assert list(read_usage(usage)["images"]) == ["img1", "img2", "img3"]
+
+
+def test_use_image_keeps_images_pending_in_any_owner(tmp_path):
+    usage = ImageUsage(str(tmp_path / "usage.json"))
+    usage.set_pending(f"{os.getpid()}:a", {"img1": 1})
+    usage.set_pending(f"{os.getpid()}:b", {"img2": 2})
+    for name in ["img1", "img2", "img3"]:
+        usage.use_image(name, 10, 15, lambda name: True)
+
+    assert list(read_usage(usage)["images"]) == ["img1", "img2", "img3"]
+
+    usage.set_pending(f"{os.getpid()}:b", {})
+    usage.use_image("img4", 10, 25, lambda name: True)
+    assert list(read_usage(usage)["images"]) == ["img1", "img4"]
+
+
+@pytest.mark.skipif(os.name == "nt", reason="processes are assumed to be running on Windows")
+def test_pending_images_of_stopped_processes_are_ignored(tmp_path):
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    usage = ImageUsage(str(tmp_path / "usage.json"))
+    usage.set_pending(f"{process.pid}:a", {"img1": 1})
+    for name in ["img1", "img2"]:
+        usage.use_image(name, 10, 15, lambda name: True)
+
+    assert read_usage(usage) == {"images": {"img2": 10}, "pending": {}}
+
+
+def test_forget_image(tmp_path):
+    usage = ImageUsage(str(tmp_path / "usage.json"))
+    usage.use_image("img1", 10, 25, lambda name: True)
+    usage.forget_image("img1")
+    assert read_usage(usage)["images"] == {}
+
+
+def read_usage(usage):
+    with open(usage.path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,117 @@
+import json
+import sys
+from unittest.mock import patch
+
+import docker as docker_sdk
+import pytest
+import requests
+
+from glotter.__main__ import main
+
+from .mockdocker import Images, RegistryData
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_lock_writes_digests(parallel, factory, mock_lock_sources, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    lock_command(parallel=parallel)
+
+    with open(tmp_path / "glotter.lock", "r", encoding="utf-8") as f:
+        assert json.load(f) == {
+            "images": {
+                "golang:1.12-alpine": RegistryData("golang:1.12-alpine").id,
+                "python:3.7-alpine": RegistryData("python:3.7-alpine").id,
+            }
+        }
+
+    # Images are not pulled
+    assert not Images.image_list
+
+
+def test_lock_exits_when_digest_cannot_be_resolved(
+    factory, mock_lock_sources, tmp_path, monkeypatch, capsys
+):
+    def get_registry_data(name):
+        if name.startswith("golang"):
+            raise docker_sdk.errors.NotFound("manifest unknown")
+
+        return RegistryData(name)
+
+    monkeypatch.chdir(tmp_path)
+    with (
+        patch.object(Images, "get_registry_data", side_effect=get_registry_data),
+        pytest.raises(SystemExit) as e,
+    ):
+        lock_command()
+
+    assert e.value.code != 0
+    assert "- golang:1.12-alpine: manifest unknown" in capsys.readouterr().out
+    assert not (tmp_path / "glotter.lock").exists()
+
+
+def test_lock_reports_every_image_that_cannot_be_resolved(
+    factory, mock_lock_sources, tmp_path, monkeypatch, capsys
+):
+    def get_registry_data(name):
+        if name.startswith("golang"):
+            raise requests.exceptions.ConnectionError("connection refused")
+
+        raise docker_sdk.errors.NotFound("manifest unknown")
+
+    monkeypatch.chdir(tmp_path)
+    with (
+        patch.object(Images, "get_registry_data", side_effect=get_registry_data),
+        pytest.raises(SystemExit) as e,
+    ):
+        lock_command(parallel=True, extra_args=["--pull-retries", "0"])
+
+    assert e.value.code != 0
+    output = capsys.readouterr().out
+    assert "- golang:1.12-alpine: connection refused" in output
+    assert "- python:3.7-alpine: manifest unknown" in output
+    assert not (tmp_path / "glotter.lock").exists()
+
+
+def test_get_image_pulls_locked_digest(factory, container_info, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    name = f"{container_info.image}:{container_info.tag}"
+    digest = RegistryData(name).id
+    (tmp_path / "glotter.lock").write_text(json.dumps({"images": {name: digest}}))
+
+    image = factory.get_image(container_info, quiet=True)
+    assert image == name
+    assert image.attrs["RepoDigests"] == [f"{container_info.image}@{digest}"]
+
+
+def test_get_image_pulls_locked_digest_when_tag_has_moved(
+    factory, container_info, tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    name = f"{container_info.image}:{container_info.tag}"
+    Images.add_image(name)
+    digest = RegistryData(name).id
+    (tmp_path / "glotter.lock").write_text(json.dumps({"images": {name: digest}}))
+
+    assert factory.get_image_digest(container_info, pull=False) is None
+    image = factory.get_image(container_info, quiet=True)
+    assert image.attrs["RepoDigests"] == [f"{container_info.image}@{digest}"]
+    assert factory.get_image_digest(container_info, pull=False) == image.id
+
+
+def lock_command(parallel=False, extra_args=None):
+    args = (["--parallel"] if parallel else []) + (extra_args or [])
+    with patch.object(sys, "argv", ["glotter", "lock"] + args):
+        main()
+
+
+@pytest.fixture
+def mock_lock_sources(source_no_build, source_with_build):
+    with (
+        patch("glotter.lock.get_settings"),
+        patch("glotter.lock.get_sources") as mock,
+    ):
+        mock.return_value = {
+            "baklava": [source_no_build],
+            "fibonacci": [source_with_build, source_no_build],
+        }
+        yield mock
@@ -0,0 +1,367 @@
+import json
+import xml.etree.ElementTree as ET
+from unittest.mock import Mock, patch
+
+import pytest
+
+from glotter.history import History
+from glotter.native_runner import (
+    NO_GENERATED_TESTS_MESSAGE,
+    NativeTestResult,
+    check_test,
+    run_native_tests,
+    run_source_tests,
+)
+from glotter.project import Project
+from glotter.stragglers import ExecRecord, record_exec
+
+ROT13_PROJECT = {
+    "words": ["rot13"],
+    "requires_parameters": True,
+    "strings": {"usage": "Usage: please provide a string to encrypt"},
+    "tests": {
+        "rot13_valid": {
+            "params": [
+                {"name": "lower case", "input": '"abc"', "expected": "nop"},
+                {"name": "upper case", "input": '"ABC"', "expected": "NOP"},
+            ],
+            "transformations": ["strip"],
+        },
+        "rot13_invalid": {
+            "params": [{"name": "no input", "input": None, "expected": {"string": "usage"}}],
+            "transformations": ["strip"],
+        },
+    },
+    "repeat": {"rot13_invalid": 2},
+}
+FILE_IO_PROJECT = {
+    "words": ["file", "io"],
+    "tests": {"file_io": {"params": [{"expected": {"exec": "cat output.txt"}}]}},
+}
+QUINE_PROJECT = {
+    "words": ["quine"],
+    "tests": {"quine": {"params": [{"expected": {"self": ""}}]}},
+}
+FIZZ_BUZZ_PROJECT = {
+    "words": ["fizz", "buzz"],
+    "tests": {
+        "fizz_buzz": {
+            "params": [{"expected": ["1", "2", "Fizz"]}],
+            "transformations": ["strip", "splitlines"],
+        }
+    },
+}
+
+
+class FakeSource:
+    def __init__(self, outputs, full_path="", build_error=None):
+        self.outputs = outputs
+        self.full_path = full_path
+        self.build_error = build_error
+        self.test_id = "python/fake.py"
+        self.prefetched = None
+        self.prefetched_timeouts = None
+        self.timeouts = []
+        self.cleaned_up = False
+
+    def build(self):
+        if self.build_error:
+            raise self.build_error
+
+    def prefetch(self, params_list, timeouts=None):
+        self.prefetched = params_list
+        self.prefetched_timeouts = timeouts
+
+    def run(self, params=None, timeout=None):
+        self.timeouts.append(timeout)
+        return self.outputs[params]
+
+    def exec(self, command):
+        return self.outputs[command]
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+@pytest.mark.parametrize(
+    ("project", "test_name", "outputs"),
+    [
+        pytest.param(ROT13_PROJECT, "rot13_valid", {'"abc"': "nop\n"}, id="string"),
+        pytest.param(
+            ROT13_PROJECT,
+            "rot13_invalid",
+            {None: "Usage: please provide a string to encrypt\n"},
+            id="test-string",
+        ),
+        pytest.param(
+            FILE_IO_PROJECT,
+            "file_io",
+            {None: "some output", "cat output.txt": "some output"},
+            id="exec",
+        ),
+        pytest.param(FIZZ_BUZZ_PROJECT, "fizz_buzz", {None: "1\n2\nFizz\n"}, id="list"),
+    ],
+)
+def test_check_test_passes(project, test_name, outputs):
+    test_obj = Project(**project).tests[test_name]
+    check_test(test_obj, test_obj.params[0], FakeSource(outputs))
+
+
+@pytest.mark.parametrize(("timeout", "expected_timeout"), [(None, None), (5, 5.0)])
+def test_check_test_passes_timeout(timeout, expected_timeout):
+    test_obj = Project(**{**ROT13_PROJECT, "timeout": timeout}).tests["rot13_valid"]
+    source = FakeSource({'"abc"': "nop\n"})
+    check_test(test_obj, test_obj.params[0], source)
+    assert source.timeouts == [expected_timeout]
+
+
+@pytest.mark.parametrize(
+    ("project", "test_name", "outputs", "expected_message"),
+    [
+        pytest.param(
+            ROT13_PROJECT,
+            "rot13_valid",
+            {'"abc"': "abc\n"},
+            "assert 'abc' == 'nop'",
+            id="string",
+        ),
+        pytest.param(
+            FIZZ_BUZZ_PROJECT, "fizz_buzz", {None: "1\n2\n"}, "Length not equal", id="list-length"
+        ),
+        pytest.param(
+            FIZZ_BUZZ_PROJECT,
+            "fizz_buzz",
+            {None: "1\n2\nBuzz\n"},
+            "Item 3 is not equal",
+            id="list-item",
+        ),
+    ],
+)
+def test_check_test_fails(project, test_name, outputs, expected_message):
+    test_obj = Project(**project).tests[test_name]
+    with pytest.raises(AssertionError) as e:
+        check_test(test_obj, test_obj.params[0], FakeSource(outputs))
+
+    assert str(e.value) == expected_message
+
+
+@pytest.mark.parametrize(
+    ("contents", "output"),
+    [
+        pytest.param("print('hi')\n", "print('hi')", id="missing-newline"),
+        pytest.param("print('hi')", "print('hi')\n", id="extra-newline"),
+        pytest.param("print('hi')\n", "print('hi')\n", id="same"),
+    ],
+)
+def test_check_test_self(contents, output, tmp_path):
+    path = tmp_path / "quine.py"
+    path.write_text(contents, encoding="utf-8")
+    test_obj = Project(**QUINE_PROJECT).tests["quine"]
+    check_test(test_obj, test_obj.params[0], FakeSource({None: output}, full_path=str(path)))
+
+
+def test_run_source_tests(mock_settings):
+    source = FakeSource({'"abc"': "nop", '"ABC"': "ABC", None: "Wrong"})
+    results = run_source_tests("rot13", source)
+    module_path = "test/generated/test_rot13.py"
+    assert [(result.nodeid, result.outcome) for result in results] == [
+        (f"{module_path}::test_rot13_valid[python/fake.py-lower case]", "passed"),
+        (f"{module_path}::test_rot13_valid[python/fake.py-upper case]", "failed"),
+        (f"{module_path}::test_rot13_invalid[python/fake.py-repeat1-no input]", "failed"),
+        (f"{module_path}::test_rot13_invalid[python/fake.py-repeat2-no input]", "failed"),
+    ]
+    assert source.prefetched == ['"abc"', '"ABC"', None, None]
+    assert source.prefetched_timeouts == [None] * 4
+    assert source.cleaned_up
+
+
+def test_run_source_tests_prefetches_with_timeouts(mock_settings):
+    mock_settings.return_value.projects["rot13"] = Project(**{**ROT13_PROJECT, "timeout": 5})
+    source = FakeSource({'"abc"': "nop", '"ABC"': "NOP", None: "Wrong"})
+    run_source_tests("rot13", source)
+    assert source.prefetched_timeouts == [5.0] * 4
+
+
+def test_run_source_tests_without_generated_tests(mock_settings):
+    mock_settings.return_value.projects["baklava"] = Project(words=["baklava"])
+    source = FakeSource({})
+    results = run_source_tests("baklava", source)
+    assert results == [
+        NativeTestResult(
+            "baklava::project_test[python/fake.py]", "error", 0.0, NO_GENERATED_TESTS_MESSAGE
+        )
+    ]
+    assert not source.cleaned_up
+
+
+def test_run_source_tests_with_error(mock_settings):
+    source = FakeSource({'"abc"': "nop"})
+    results = run_source_tests("rot13", source)
+    assert [result.outcome for result in results] == ["passed", "error", "error", "error"]
+    assert results[1].message.startswith("KeyError")
+
+
+def test_run_source_tests_with_build_error(mock_settings):
+    source = FakeSource({}, build_error=RuntimeError("unable to build"))
+    results = run_source_tests("rot13", source)
+    assert len(results) == 4
+    assert all(result.outcome == "error" for result in results)
+    assert results[0].message == "RuntimeError: unable to build"
+    assert source.cleaned_up
+
+
+def test_run_source_tests_with_result_cache(mock_settings):
+    result_cache = Mock(enabled=True)
+    result_cache.get_key.side_effect = lambda source, test_obj, pytest_id: pytest_id
+    result_cache.is_passed.side_effect = lambda key: key in ("lower case", "repeat1-no input")
+    source = FakeSource({'"ABC"': "NOP", None: "Usage: please provide a string to encrypt"})
+    with patch("glotter.native_runner.get_result_cache", return_value=result_cache):
+        results = run_source_tests("rot13", source)
+
+    assert [result.outcome for result in results] == ["cached", "passed", "cached", "passed"]
+    assert source.prefetched == ['"ABC"', None]
+    assert [call.args for call in result_cache.record_pass.call_args_list] == [
+        ("upper case",),
+        ("repeat2-no input",),
+    ]
+
+
+def test_run_source_tests_all_cached(mock_settings):
+    result_cache = Mock(enabled=True)
+    result_cache.is_passed.return_value = True
+    source = FakeSource({}, build_error=RuntimeError("unable to build"))
+    with patch("glotter.native_runner.get_result_cache", return_value=result_cache):
+        results = run_source_tests("rot13", source)
+
+    assert [result.outcome for result in results] == ["cached"] * 4
+    assert not source.cleaned_up
+
+
+@pytest.mark.parametrize(
+    ("outcomes", "expected_exit_code"),
+    [
+        pytest.param([], 5, id="no-tests"),
+        pytest.param(["passed", "passed"], 0, id="passed"),
+        pytest.param(["passed", "failed"], 1, id="failed"),
+        pytest.param(["error", "passed"], 1, id="error"),
+        pytest.param(["cached", "passed"], 0, id="cached"),
+    ],
+)
+def test_run_native_tests(outcomes, expected_exit_code, factory, source_no_build, tmp_path, capsys):
+    def mock_run_source_tests(project_type, source):
+        return [
+            NativeTestResult(f"test/generated/test_{project_type}.py::test_source1", outcome, 0.5)
+            for outcome in outcomes
+        ]
+
+    junit_xml = tmp_path / "results.xml"
+    json_report = tmp_path / "results.json"
+    with patch("glotter.native_runner.run_source_tests", side_effect=mock_run_source_tests):
+        exit_code = run_native_tests(
+            {"rot13": [source_no_build]},
+            concurrency=2,
+            junit_xml=str(junit_xml),
+            json_report=str(json_report),
+        )
+
+    assert exit_code == expected_exit_code
+    assert len(capsys.readouterr().out.splitlines()) == len(outcomes) + 1
+
+    testsuite = ET.parse(junit_xml).getroot().find("testsuite")
+    assert testsuite.get("tests") == str(len(outcomes))
+    assert testsuite.get("failures") == str(outcomes.count("failed"))
+    assert testsuite.get("errors") == str(outcomes.count("error"))
+    for testcase in testsuite.findall("testcase"):
+        assert testcase.get("classname") == "test.generated.test_rot13"
+        assert testcase.get("name") == "test_source1"
+
+    report = json.loads(json_report.read_text(encoding="utf-8"))
+    assert report["exitcode"] == expected_exit_code
+    assert report["summary"]["total"] == len(outcomes)
+    assert [test["outcome"] for test in report["tests"]] == outcomes
+
+
+def test_run_native_tests_without_generated_tests(factory, source_no_build, capsys):
+    mock_settings = Mock()
+    mock_settings.projects = {"baklava": Project(words=["baklava"])}
+    with patch("glotter.native_runner.get_settings", return_value=mock_settings):
+        exit_code = run_native_tests({"baklava": [source_no_build]})
+
+    assert exit_code == 1
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[1] == f"Warning: 1 sources were not tested. {NO_GENERATED_TESTS_MESSAGE}"
+    assert lines[2].startswith("1 error in ")
+
+
+def test_run_native_tests_records_history(factory, source_no_build, tmp_path, capsys):
+    results = [
+        NativeTestResult(
+            "test/generated/test_rot13.py::test_rot13[python/rot13.py]", "passed", 1.0
+        ),
+        NativeTestResult("test/generated/test_rot13.py::test_rot13[c/rot13.c]", "failed", 2.0),
+    ]
+    history_path = tmp_path / "history.json"
+    with patch("glotter.native_runner.run_source_tests", return_value=results):
+        run_native_tests({"rot13": [source_no_build]}, history_path=str(history_path))
+
+    history = History(str(history_path))
+    assert history.get_duration("python") == 1.0
+    assert history.get_duration("c") == 2.0
+
+
+def test_run_native_tests_reports_stragglers(factory, source_no_build, capsys):
+    def mock_run_source_tests(project_type, source):
+        record_exec(ExecRecord("python/slow.py", "python slow.py", 12.5, timed_out=True))
+        return [
+            NativeTestResult(f"test/generated/test_{project_type}.py::test_source", "failed", 0.5)
+        ]
+
+    with patch("glotter.native_runner.run_source_tests", side_effect=mock_run_source_tests):
+        run_native_tests({"rot13": [source_no_build]})
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[2:] == [
+        "Slowest 1 execs:",
+        "     12.50s  python/slow.py  python slow.py",
+        "Killed 1 execs that timed out:",
+        "     12.50s  python/slow.py  python slow.py",
+    ]
+
+
+def test_run_native_tests_groups_sources_by_image(
+    factory, source_no_build, source_with_build, capsys
+):
+    tested = []
+    pending = []
+
+    def mock_run_source_tests(project_type, source):
+        tested.append(source)
+        pending.append(factory._pending_images["python:3.7-alpine"])
+        return [
+            NativeTestResult(f"test/generated/test_{project_type}.py::test_source", "passed", 0.5)
+        ]
+
+    sources_by_type = {
+        "baklava": [source_no_build],
+        "fibonacci": [source_with_build],
+        "rot13": [source_no_build],
+    }
+    with patch("glotter.native_runner.run_source_tests", side_effect=mock_run_source_tests):
+        run_native_tests(sources_by_type)
+
+    # Results are in the original order
+    assert [line.split("::")[0] for line in capsys.readouterr().out.splitlines()[:3]] == [
+        "test/generated/test_baklava.py",
+        "test/generated/test_fibonacci.py",
+        "test/generated/test_rot13.py",
+    ]
+    assert tested == [source_with_build, source_no_build, source_no_build]
+    assert pending == [2, 2, 1]
+    assert not factory._pending_images
+
+
+@pytest.fixture
+def mock_settings():
+    with patch("glotter.native_runner.get_settings") as mock:
+        mock.return_value.projects = {"rot13": Project(**ROT13_PROJECT)}
+        yield mock
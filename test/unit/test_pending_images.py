@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+
+from glotter.pending_images import PendingImagesPlugin, get_item_container_info
+
+
+def test_get_item_container_info(source_no_build):
+    assert (
+        get_item_container_info(make_item("test_a", source_no_build))
+        is source_no_build.test_info.container_info
+    )
+    assert get_item_container_info(make_item("test_b")) is None
+    assert get_item_container_info(SimpleNamespace(nodeid="test_c")) is None
+
+
+def test_collected_images_are_pending_until_their_tests_finish(
+    factory, source_no_build, source_with_build
+):
+    items = [
+        make_item("test_a", source_no_build),
+        make_item("test_b", source_with_build),
+        make_item("test_c", source_no_build),
+        make_item("test_d"),
+    ]
+    plugin = PendingImagesPlugin()
+    plugin.pytest_collection_finish(make_session(items))
+    assert get_pending_images(factory) == {
+        "python:3.7-alpine": 2,
+        "golang:1.12-alpine": 1,
+    }
+
+    for item, nextitem, expected_pending_images in [
+        (items[0], items[1], {"python:3.7-alpine": 1, "golang:1.12-alpine": 1}),
+        (items[1], items[2], {"python:3.7-alpine": 1}),
+        (items[2], items[3], {}),
+        (items[3], None, {}),
+    ]:
+        run_protocol(plugin, item, nextitem)
+        assert get_pending_images(factory) == expected_pending_images
+
+
+def test_xdist_worker_only_keeps_current_and_next_images_pending(
+    factory, source_no_build, source_with_build
+):
+    items = [make_item("test_a", source_no_build), make_item("test_b", source_with_build)]
+    plugin = PendingImagesPlugin()
+    plugin.pytest_collection_finish(make_session(items, workerinput={}))
+    assert not get_pending_images(factory)
+
+    wrapper = plugin.pytest_runtest_protocol(items[0], items[1])
+    next(wrapper)
+    assert get_pending_images(factory) == {
+        "python:3.7-alpine": 1,
+        "golang:1.12-alpine": 1,
+    }
+    with pytest.raises(StopIteration):
+        next(wrapper)
+
+    assert get_pending_images(factory) == {"golang:1.12-alpine": 1}
+
+
+def make_item(nodeid, source=None):
+    params = {"some_project": source} if source is not None else {"value": 1}
+    return SimpleNamespace(nodeid=nodeid, callspec=SimpleNamespace(params=params))
+
+
+def make_session(items, **config):
+    return SimpleNamespace(items=items, config=SimpleNamespace(**config))
+
+
+def run_protocol(plugin, item, nextitem):
+    wrapper = plugin.pytest_runtest_protocol(item, nextitem)
+    next(wrapper)
+    with pytest.raises(StopIteration):
+        next(wrapper)
+
+
+def get_pending_images(factory):
+    return dict(factory._pending_images)
@@ -191,6 +191,7 @@ def test_get_project_name_by_scheme_bad():
                 "use_tests": None,
                 "tests": {},
                 "repeat": {},
+                "timeout": None,
             },
             id=f"just-words-{char1}{char2}-{char2}{char1}",
         )
@@ -208,6 +209,7 @@ def test_get_project_name_by_scheme_bad():
                 "use_tests": None,
                 "tests": {},
                 "repeat": {},
+                "timeout": None,
             },
             id="requires-parameters",
         )
@@ -244,6 +246,7 @@ def test_get_project_name_by_scheme_bad():
                 "use_tests": None,
                 "tests": {},
                 "repeat": {},
+                "timeout": None,
             },
             id=f"has-acronyms-{char1}{char2}-{char2}{char1}",
         )
@@ -261,6 +264,7 @@ def test_get_project_name_by_scheme_bad():
                 "use_tests": None,
                 "tests": {},
                 "repeat": {},
+                "timeout": None,
             },
             id=f"has-acronym-scheme-{acronym_scheme.name}",
         )
@@ -314,6 +318,7 @@ def test_get_project_name_by_scheme_bad():
                         ],
                         "transformations": ["strip", "lower"],
                         "repeat": 1,
+                        "timeout": None,
                     },
                     "prime_number_invalid": {
                         "name": "prime_number_invalid",
@@ -334,10 +339,12 @@ def test_get_project_name_by_scheme_bad():
                         ],
                         "transformations": ["strip"],
                         "repeat": 1,
+                        "timeout": None,
                     },
                 },
                 "use_tests": None,
                 "repeat": {},
+                "timeout": None,
             },
             id="tests",
         ),
@@ -389,6 +396,7 @@ def test_get_project_name_by_scheme_bad():
                         ],
                         "transformations": ["strip", "lower"],
                         "repeat": 1,
+                        "timeout": None,
                     },
                     "prime_number_invalid": {
                         "name": "prime_number_invalid",
@@ -409,10 +417,12 @@ def test_get_project_name_by_scheme_bad():
                         ],
                         "transformations": ["strip"],
                         "repeat": 1,
+                        "timeout": None,
                     },
                 },
                 "use_tests": None,
                 "repeat": {},
+                "timeout": None,
             },
             id="tests-with-strings",
         ),
@@ -484,6 +494,7 @@ def test_get_project_name_by_scheme_bad():
                         ],
                         "transformations": [],
                         "repeat": 3,
+                        "timeout": None,
                     },
                     "something_invalid": {
                         "name": "something_invalid",
@@ -504,6 +515,7 @@ def test_get_project_name_by_scheme_bad():
                         ],
                         "transformations": [],
                         "repeat": 2,
+                        "timeout": None,
                     },
                 },
                 "use_tests": None,
@@ -511,6 +523,7 @@ def test_get_project_name_by_scheme_bad():
                     "something_valid": 3,
                     "something_invalid": 2,
                 },
+                "timeout": None,
             },
             id="tests-with-repeats",
         ),
@@ -859,6 +872,7 @@ def test_set_tests(use_test_items):
                 "requires_parameters": True,
                 "strings": {},
                 "repeat": repeat.get(valid_test_name, 1),
+                "timeout": None,
             },
             invalid_test_name: {
                 **INVALID_TESTS,
@@ -866,10 +880,12 @@ def test_set_tests(use_test_items):
                 "requires_parameters": True,
                 "strings": {},
                 "repeat": repeat.get(invalid_test_name, 1),
+                "timeout": None,
             },
         },
         "use_tests": None,
         "repeat": repeat,
+        "timeout": None,
     }
     assert use_tests_project.model_dump() == expected_project
 
@@ -922,3 +938,45 @@ def test_set_tests_invalid_repeat():
         loc = ("repeat", key)
         assert loc in errors_dict
         assert "Refers to a non-existent test name" in errors_dict[loc]
+
+
+@pytest.mark.parametrize(
+    ("project_timeout", "test_timeout", "expected_timeout"),
+    [
+        pytest.param(None, None, None, id="none"),
+        pytest.param(30, None, 30.0, id="project"),
+        pytest.param(None, 5, 5.0, id="test"),
+        pytest.param(30, 5, 5.0, id="test-overrides-project"),
+    ],
+)
+def test_project_timeout(project_timeout, test_timeout, expected_timeout):
+    test = {"params": [{"expected": "blah"}]}
+    if test_timeout is not None:
+        test["timeout"] = test_timeout
+
+    project = Project(words=["foo"], tests={"valid": test}, timeout=project_timeout)
+    assert project.tests["valid"].timeout == expected_timeout
+
+
+@pytest.mark.parametrize(
+    ("source_timeout", "timeout", "expected_timeout"),
+    [
+        pytest.param(None, None, None, id="none"),
+        pytest.param(None, 30, 30.0, id="project"),
+        pytest.param(5, 30, 5.0, id="source-test-overrides-project"),
+    ],
+)
+def test_set_tests_timeout(source_timeout, timeout, expected_timeout):
+    source_project = Project(
+        words=["foo"],
+        tests={"valid": {"params": [{"expected": "blah"}], "timeout": source_timeout}},
+    )
+    project = Project(words=["bar"], use_tests={"name": "valid"}, timeout=timeout)
+    project.set_tests(source_project)
+    assert project.tests["valid"].timeout == expected_timeout
+
+
+@pytest.mark.parametrize("timeout", [0, -1, "soon"])
+def test_project_timeout_invalid(timeout):
+    with pytest.raises(ValidationError):
+        Project(words=["foo"], timeout=timeout)
@@ -0,0 +1,297 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import docker
+import pytest
+import requests
+
+from glotter.pull_limiter import (
+    MAX_RETRY_AFTER,
+    PULL_RATE_ENV_VAR,
+    PULL_RETRIES_ENV_VAR,
+    PullLimiter,
+    TokenBucket,
+    get_pull_limiter,
+    get_pull_stream_error,
+    get_retry_after,
+    is_rate_limit_error,
+    is_transient_error,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_api_error(message="error", status_code=None, headers=None):
+    response = None
+    if status_code is not None:
+        response = requests.Response()
+        response.status_code = status_code
+        response.reason = message
+        response.url = "http+docker://localhost/images/create"
+        response.headers.update(headers or {})
+
+    return docker.errors.APIError(message, response=response)
+
+
+def make_func(*outcomes):
+    outcomes = list(outcomes)
+    calls = []
+
+    def func():
+        calls.append(None)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+
+        return outcome
+
+    func.calls = calls
+    return func
+
+
+def test_get_pull_limiter_defaults():
+    limiter = get_pull_limiter()
+    assert limiter.rate == 0
+    assert limiter.retries == 5
+
+
+def test_get_pull_limiter_from_environment(monkeypatch):
+    monkeypatch.setenv(PULL_RATE_ENV_VAR, "30")
+    monkeypatch.setenv(PULL_RETRIES_ENV_VAR, "2")
+    limiter = get_pull_limiter()
+    assert limiter.rate == 30
+    assert limiter.retries == 2
+
+
+def test_token_bucket_unlimited(clock):
+    bucket = TokenBucket(0, clock=clock, sleep=clock.sleep)
+    for _ in range(10):
+        bucket.acquire()
+
+    assert clock.sleeps == []
+
+
+def test_token_bucket_rate(clock):
+    bucket = TokenBucket(2, capacity=2, clock=clock, sleep=clock.sleep)
+    start_times = []
+    for _ in range(6):
+        bucket.acquire()
+        start_times.append(clock.now)
+
+    assert start_times == pytest.approx([0.0, 0.0, 0.5, 1.0, 1.5, 2.0])
+
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(1, capacity=2, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 10
+    bucket.acquire()
+    bucket.acquire()
+    bucket.acquire()
+
+    assert clock.now == pytest.approx(11.0)
+
+
+@pytest.mark.parametrize("rate", [0, 1])
+def test_token_bucket_pause(rate, clock):
+    bucket = TokenBucket(rate, clock=clock, sleep=clock.sleep)
+    bucket.pause(30)
+    bucket.pause(10)
+    bucket.acquire()
+
+    assert clock.now == pytest.approx(30.0)
+
+
+def test_limiter_returns_result(clock):
+    limiter = PullLimiter(clock=clock, sleep=clock.sleep)
+    assert limiter.call(make_func("done"), "pull of python:3.12") == "done"
+    assert clock.sleeps == []
+
+
+def test_limiter_rate(clock):
+    limiter = PullLimiter(rate=30, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        limiter.call(make_func(None), "pull of python:3.12")
+
+    assert limiter.rate == 30
+    assert clock.now == pytest.approx(4.0)
+
+
+def test_limiter_retries_transient_errors(clock, capsys):
+    func = make_func(make_api_error("unexpected EOF"), make_api_error(status_code=503), "done")
+    limiter = PullLimiter(clock=clock, sleep=clock.sleep)
+
+    assert limiter.call(func, "pull of python:3.12") == "done"
+    assert len(func.calls) == 3
+    assert len(clock.sleeps) == 2
+    assert 0.5 <= clock.sleeps[0] <= 1.0
+    assert 1.0 <= clock.sleeps[1] <= 2.0
+    output = capsys.readouterr().out
+    assert "Retrying pull of python:3.12 in " in output
+    assert "(attempt 2 of 5)" in output
+
+
+def test_limiter_backoff_is_capped(clock):
+    func = make_func(*[requests.exceptions.ConnectionError()] * 8, "done")
+    limiter = PullLimiter(retries=8, max_delay=5.0, clock=clock, sleep=clock.sleep)
+
+    assert limiter.call(func, "pull of python:3.12") == "done"
+    assert all(sleep <= 5.0 for sleep in clock.sleeps)
+
+
+def test_limiter_gives_up_after_retries(clock):
+    error = make_api_error("connection reset by peer")
+    func = make_func(error, error, error)
+    limiter = PullLimiter(retries=2, clock=clock, sleep=clock.sleep)
+
+    with pytest.raises(docker.errors.APIError):
+        limiter.call(func, "pull of python:3.12")
+
+    assert len(func.calls) == 3
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        pytest.param(make_api_error("manifest unknown"), id="api-error"),
+        pytest.param(docker.errors.ImageNotFound("not found"), id="not-found"),
+        pytest.param(ValueError("bad value"), id="other-error"),
+    ],
+)
+def test_limiter_does_not_retry_permanent_errors(error, clock):
+    func = make_func(error)
+    limiter = PullLimiter(clock=clock, sleep=clock.sleep)
+
+    with pytest.raises(type(error)):
+        limiter.call(func, "pull of python:3.12")
+
+    assert len(func.calls) == 1
+    assert clock.sleeps == []
+
+
+def test_limiter_pauses_all_requests_when_rate_limited(clock):
+    error = make_api_error(status_code=429, headers={"Retry-After": "120"})
+    limiter = PullLimiter(clock=clock, sleep=clock.sleep)
+
+    assert limiter.call(make_func(error, "done"), "pull of python:3.12") == "done"
+    assert clock.now == pytest.approx(120.0)
+
+    # Other requests are not affected once the pause is over
+    limiter.call(make_func("done"), "pull of gcc:latest")
+    assert clock.now == pytest.approx(120.0)
+
+
+def test_limiter_rate_limited_without_headers(clock):
+    limiter = PullLimiter(clock=clock, sleep=clock.sleep)
+    func = make_func(make_api_error("toomanyrequests: You have reached your pull rate limit"), 1)
+
+    assert limiter.call(func, "pull of python:3.12") == 1
+    assert 0.5 <= clock.now <= 1.0
+
+
+def test_limiter_does_not_wait_for_long_rate_limit(clock):
+    error = make_api_error(status_code=429, headers={"Retry-After": str(MAX_RETRY_AFTER + 1)})
+    limiter = PullLimiter(clock=clock, sleep=clock.sleep)
+
+    with pytest.raises(docker.errors.APIError):
+        limiter.call(make_func(error, "done"), "pull of python:3.12")
+
+    assert clock.now == 0.0
+
+
+@pytest.mark.parametrize(
+    ("error", "expected_transient", "expected_rate_limit"),
+    [
+        (make_api_error(status_code=429), True, True),
+        (make_api_error("toomanyrequests: rate exceeded", status_code=500), True, True),
+        (make_api_error(status_code=502), True, False),
+        (
+            make_api_error("Get https://registry-1.docker.io/v2/: net/http: i/o timeout"),
+            True,
+            False,
+        ),
+        (make_api_error("manifest for python:nope not found"), False, False),
+        (make_api_error(status_code=401), False, False),
+        (docker.errors.NotFound("not found"), False, False),
+        (requests.exceptions.ConnectionError(), True, False),
+        (requests.exceptions.ReadTimeout(), True, False),
+        (RuntimeError("timeout"), False, False),
+    ],
+)
+def test_error_classification(error, expected_transient, expected_rate_limit):
+    assert is_transient_error(error) == expected_transient
+    assert is_rate_limit_error(error) == expected_rate_limit
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected"),
+    [
+        ({}, None),
+        ({"Retry-After": "30"}, 30.0),
+        ({"Retry-After": "-5"}, 0.0),
+        ({"Retry-After": "soon"}, None),
+        ({"RateLimit-Remaining": "0;w=21600"}, 21600.0),
+        ({"RateLimit-Remaining": "12;w=21600"}, None),
+        ({"RateLimit-Remaining": "0"}, None),
+        ({"Retry-After": "15", "RateLimit-Remaining": "0;w=21600"}, 15.0),
+    ],
+)
+def test_get_retry_after(headers, expected):
+    assert get_retry_after(make_api_error(status_code=429, headers=headers)) == expected
+
+
+def test_get_retry_after_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=60)
+    error = make_api_error(status_code=429, headers={"Retry-After": format_datetime(retry_at)})
+    assert 0 < get_retry_after(error) <= 60
+
+
+def test_get_retry_after_without_response():
+    assert get_retry_after(make_api_error("toomanyrequests")) is None
+
+
+@pytest.mark.parametrize(
+    ("message", "expected"),
+    [
+        pytest.param("toomanyrequests: retry-after: 1m30s, allowed: 100/minute", 90.0, id="go"),
+        pytest.param("toomanyrequests: retry-after: 250ms", 0.25, id="go-ms"),
+        pytest.param("429 Too Many Requests (Retry-After: 60)", 60.0, id="seconds"),
+        pytest.param("toomanyrequests: retry-after: soon", None, id="invalid"),
+        pytest.param("toomanyrequests: retry-after: 1.2.3s", None, id="bad-number"),
+    ],
+)
+def test_get_retry_after_from_message(message, expected):
+    assert get_retry_after(make_api_error(message)) == expected
+
+
+def test_get_pull_stream_error():
+    error = get_pull_stream_error({"error": "manifest unknown"})
+    assert str(error) == "manifest unknown"
+    assert error.status_code is None
+
+
+def test_get_pull_stream_error_with_code():
+    error = get_pull_stream_error(
+        {"error": "Rate exceeded", "errorDetail": {"code": 429, "message": "Rate exceeded"}}
+    )
+    assert error.status_code == 429
+    assert "Too Many Requests" in str(error)
+    assert "Rate exceeded" in str(error)
+    assert is_rate_limit_error(error)
@@ -0,0 +1,145 @@
+import os
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from glotter.project import Project
+from glotter.result_cache import (
+    INCREMENTAL_ENV_VAR,
+    ResultCache,
+    ResultCachePlugin,
+    get_result_cache,
+)
+
+BAKLAVA_PROJECT = {
+    "words": ["baklava"],
+    "tests": {"baklava": {"params": [{"expected": "baklava"}]}},
+}
+
+
+@pytest.mark.parametrize(("value", "expected"), [("1", True), ("", False), (None, False)])
+def test_get_result_cache_enabled_from_environment(value, expected, monkeypatch):
+    if value is None:
+        monkeypatch.delenv(INCREMENTAL_ENV_VAR, raising=False)
+    else:
+        monkeypatch.setenv(INCREMENTAL_ENV_VAR, value)
+
+    assert get_result_cache().enabled == expected
+
+
+def test_cache_dir_defaults_to_glotter_cache(cache_dir):
+    assert ResultCache().cache_dir == os.path.join(cache_dir, "results")
+
+
+def test_get_key_is_stable(factory, source_no_build, no_io, pulled_image):
+    cache = ResultCache(enabled=True)
+    test_obj = _get_test_obj()
+    assert cache.get_key(source_no_build, test_obj) == cache.get_key(source_no_build, test_obj)
+
+
+def test_get_key_changes_with_test_definition(factory, source_no_build, no_io, pulled_image):
+    cache = ResultCache(enabled=True)
+    key = cache.get_key(source_no_build, _get_test_obj())
+    assert cache.get_key(source_no_build, _get_test_obj(expected="other")) != key
+
+
+def test_get_key_changes_with_pytest_id(factory, source_no_build, no_io, pulled_image):
+    cache = ResultCache(enabled=True)
+    test_obj = _get_test_obj()
+    assert cache.get_key(source_no_build, test_obj, "repeat1") != cache.get_key(
+        source_no_build, test_obj, "repeat2"
+    )
+
+
+def test_get_key_does_not_pull_image(factory, source_no_build, no_io, docker):
+    assert ResultCache(enabled=True).get_key(source_no_build, _get_test_obj()) is None
+    assert not docker.images.list()
+
+
+def test_record_pass(tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path))
+    assert not cache.is_passed("key")
+    cache.record_pass("key")
+    assert cache.is_passed("key")
+
+
+def test_get_node_keys(factory, source_no_build, no_io, pulled_image, monkeypatch):
+    monkeypatch.setattr(
+        "glotter.settings.Settings.projects", {"baklava": Project(**BAKLAVA_PROJECT)}
+    )
+    monkeypatch.setattr("glotter.result_cache.get_project_sources", lambda _: [source_no_build])
+    cache = ResultCache(enabled=True)
+    assert cache.get_node_keys() == {
+        f"test/generated/test_baklava.py::test_baklava[{source_no_build.test_id}]": (
+            cache.get_key(source_no_build, _get_test_obj())
+        )
+    }
+
+
+def test_plugin_deselects_cached_tests(tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path))
+    cache.record_pass("key1")
+    plugin = _make_plugin(cache, {"test_a": "key1", "test_b": "key2"})
+    items = [SimpleNamespace(nodeid="test_a"), SimpleNamespace(nodeid="test_b")]
+    config = Mock()
+    plugin.pytest_collection_modifyitems(config, items)
+    assert [item.nodeid for item in items] == ["test_b"]
+    config.hook.pytest_deselected.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    ("when", "passed", "expected"),
+    [
+        pytest.param("call", True, True, id="passed"),
+        pytest.param("call", False, False, id="failed"),
+        pytest.param("setup", True, False, id="setup"),
+    ],
+)
+def test_plugin_records_passed_tests(when, passed, expected, tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path))
+    plugin = _make_plugin(cache, {"test_a": "key1"})
+    plugin.pytest_runtest_logreport(SimpleNamespace(nodeid="test_a", when=when, passed=passed))
+    assert cache.is_passed("key1") == expected
+
+
+@pytest.mark.parametrize(
+    ("cached", "exitstatus", "expected"),
+    [
+        pytest.param(True, pytest.ExitCode.NO_TESTS_COLLECTED, pytest.ExitCode.OK, id="cached"),
+        pytest.param(
+            False,
+            pytest.ExitCode.NO_TESTS_COLLECTED,
+            pytest.ExitCode.NO_TESTS_COLLECTED,
+            id="not-cached",
+        ),
+        pytest.param(True, pytest.ExitCode.TESTS_FAILED, pytest.ExitCode.TESTS_FAILED, id="failed"),
+    ],
+)
+def test_plugin_session_finish(cached, exitstatus, expected, tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path))
+    if cached:
+        cache.record_pass("key1")
+
+    plugin = _make_plugin(cache, {"test_a": "key1"})
+    session = SimpleNamespace(exitstatus=exitstatus)
+    plugin.pytest_sessionfinish(session)
+    assert session.exitstatus == expected
+
+
+def _get_test_obj(expected="baklava"):
+    return Project(
+        words=["baklava"], tests={"baklava": {"params": [{"expected": expected}]}}
+    ).tests["baklava"]
+
+
+def _make_plugin(cache, node_keys):
+    cache.get_node_keys = lambda: node_keys
+    plugin = ResultCachePlugin(cache)
+    plugin.pytest_sessionstart(None)
+    return plugin
+
+
+@pytest.fixture
+def pulled_image(factory, source_no_build):
+    factory.get_image(source_no_build.test_info.container_info, quiet=True)
@@ -37,6 +37,18 @@ def test_add_test_mapping_when_project_type_already_has_mapping(
     assert test_func2.__name__ in get_settings().get_test_mapping_name("baklava")
 
 
+def test_add_test_mapping_when_module_imported_again(temp_dir_copy_glotter_yml):
+    def make_test_func():
+        def test_func():
+            pass
+
+        return test_func
+
+    get_settings().add_test_mapping("baklava", make_test_func())
+    get_settings().add_test_mapping("baklava", make_test_func())
+    assert get_settings().get_test_mapping_name("baklava") == ["test_func"]
+
+
 def test_get_test_mapping_name_when_project_type_not_found(temp_dir_copy_glotter_yml):
     assert get_settings().get_test_mapping_name("nonexistentproject") == []
 
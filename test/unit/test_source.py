@@ -1,9 +1,28 @@
 import os
+import threading
 
+import docker
 import pytest
 from glotter_core.testinfo import TestInfo
 
-from glotter.source import Source, filter_sources
+from glotter.containerfactory import KILL_EXECS_SCRIPT
+from glotter.source import (
+    EXEC_TIMEOUT_ENV_VAR,
+    SINGLE_EXEC_ENV_VAR,
+    SOURCE_FILTER_ENV_VAR,
+    Source,
+    filter_sources,
+    get_cache_dirs,
+    get_default_build_timeout,
+    get_default_exec_timeout,
+    get_project_sources,
+    get_source_filter,
+    get_timeout,
+    set_source_filter,
+)
+from glotter.stragglers import pop_records
+
+from .mockdocker import Container, ContainerExec
 
 
 def test_full_path(test_info_string_no_build):
@@ -62,6 +81,243 @@ def test_test_info_matches_test_info_string(test_info_string_no_build):
     assert actual == expected
 
 
+def test_cache_dirs_defaults_to_empty(source_no_build):
+    assert source_no_build.cache_dirs == ()
+
+
+def test_cache_dirs_from_test_info_string(test_info_string_no_build):
+    src = Source(
+        filename="name",
+        language="python",
+        path=os.path.join("this", "is", "a", "path"),
+        test_info=test_info_string_no_build + "  cache:\n    - /root/.cache/pip\n",
+        project_type="someproject",
+    )
+    assert src.cache_dirs == ("/root/.cache/pip",)
+
+
+def test_container_settings_from_rendered_test_info_string(test_info_string_no_build):
+    src = Source(
+        filename="name.py",
+        language="python",
+        path=os.path.join("this", "is", "a", "path"),
+        test_info=test_info_string_no_build
+        + "  cache: /root/.cache/{{ source.name }}\n"
+        + "{% if source.extension == '.py' %}  timeout: 30{% endif %}\n",
+        project_type="someproject",
+    )
+    assert src.cache_dirs == ("/root/.cache/name",)
+    assert src.timeout == 30.0
+
+
+@pytest.mark.parametrize(
+    ("cache", "expected"),
+    [
+        pytest.param("", (), id="empty"),
+        pytest.param("/root/.npm", ("/root/.npm",), id="string"),
+        pytest.param(
+            "[/root/.cargo/registry, /root/.cache/go-build/]",
+            ("/root/.cargo/registry", "/root/.cache/go-build"),
+            id="list",
+        ),
+        pytest.param("[/root/.ccache, /root/.ccache/]", ("/root/.ccache",), id="duplicates"),
+    ],
+)
+def test_get_cache_dirs(cache, expected):
+    test_info_string = f"folder:\n  naming: underscore\ncontainer:\n  cache: {cache}\n"
+    assert get_cache_dirs(test_info_string) == expected
+
+
+@pytest.mark.parametrize(
+    "cache",
+    [
+        pytest.param("root/.npm", id="relative"),
+        pytest.param("[/root/.npm, 1]", id="not-string"),
+        pytest.param("{dir: /root/.npm}", id="mapping"),
+    ],
+)
+def test_get_cache_dirs_invalid(cache):
+    test_info_string = f"container:\n  cache: {cache}\n"
+    with pytest.raises(ValueError, match="Cache directories must be absolute paths"):
+        get_cache_dirs(test_info_string)
+
+
+@pytest.mark.parametrize(
+    ("timeout", "expected"),
+    [
+        pytest.param(None, None, id="none"),
+        pytest.param("30", 30.0, id="int"),
+        pytest.param("2.5", 2.5, id="float"),
+    ],
+)
+def test_get_timeout(timeout, expected):
+    test_info_string = "container:\n  image: python\n"
+    if timeout is not None:
+        test_info_string += f"  timeout: {timeout}\n"
+
+    assert get_timeout(test_info_string) == expected
+
+
+@pytest.mark.parametrize(
+    "timeout",
+    [
+        pytest.param("0", id="zero"),
+        pytest.param("-1", id="negative"),
+        pytest.param("soon", id="string"),
+        pytest.param("true", id="bool"),
+    ],
+)
+def test_get_timeout_invalid(timeout):
+    with pytest.raises(ValueError, match="Timeout must be a positive number"):
+        get_timeout(f"container:\n  timeout: {timeout}\n")
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        pytest.param(None, 300, id="default"),
+        pytest.param("", 300, id="empty"),
+        pytest.param("12.5", 12.5, id="value"),
+        pytest.param("0", None, id="disabled"),
+    ],
+)
+def test_get_default_exec_timeout(value, expected, monkeypatch):
+    if value is None:
+        monkeypatch.delenv(EXEC_TIMEOUT_ENV_VAR, raising=False)
+    else:
+        monkeypatch.setenv(EXEC_TIMEOUT_ENV_VAR, value)
+
+    assert get_default_exec_timeout() == expected
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        pytest.param(None, 1800, id="default"),
+        pytest.param("12.5", 1800, id="shorter-exec-timeout"),
+        pytest.param("3600", 3600, id="longer-exec-timeout"),
+        pytest.param("0", None, id="disabled"),
+    ],
+)
+def test_get_default_build_timeout(value, expected, monkeypatch):
+    if value is None:
+        monkeypatch.delenv(EXEC_TIMEOUT_ENV_VAR, raising=False)
+    else:
+        monkeypatch.setenv(EXEC_TIMEOUT_ENV_VAR, value)
+
+    assert get_default_build_timeout() == expected
+
+
+def test_build_and_run_use_different_default_timeouts(
+    factory, source_with_build, no_io, monkeypatch
+):
+    timeouts = []
+
+    class RecordingFuture:
+        def result(self, timeout):
+            timeouts.append(timeout)
+            return 0, b""
+
+    monkeypatch.delenv(EXEC_TIMEOUT_ENV_VAR, raising=False)
+    monkeypatch.setattr("glotter.source.call_in_thread", lambda *args, **kwargs: RecordingFuture())
+    source_with_build.build()
+    source_with_build.run()
+    assert timeouts == [1800, 300]
+
+
+def test_run_records_exec(factory, source_no_build, no_io):
+    source_no_build.run(params="1")
+    records = pop_records()
+    assert len(records) == 1
+    assert records[0].source == source_no_build.test_id
+    assert records[0].command.strip() == f"{source_no_build.test_info.container_info.cmd} 1"
+    assert not records[0].timed_out
+
+
+def test_run_kills_exec_that_times_out(factory, source_no_build, no_io, hanging_exec):
+    with pytest.raises(TimeoutError, match=r"timed out after 0\.05 seconds"):
+        source_no_build.run(timeout=0.05)
+
+    container = factory.get_container(source_no_build)
+    assert not container.removed
+    assert container.execs[-1].cmd == ["sh", "-c", KILL_EXECS_SCRIPT, "sh", "/src"]
+    assert container.execs[-1]["workdir"] == "/"
+    assert [record.timed_out for record in pop_records()] == [True]
+
+    # The container can still be used after the exec is killed
+    assert source_no_build.run() == "executed"
+
+
+def test_run_removes_container_when_exec_cannot_be_killed(
+    factory, source_no_build, no_io, hanging_exec
+):
+    hanging_exec["kill_exit_code"] = 127
+    container = factory.get_container(source_no_build)
+    with pytest.raises(TimeoutError):
+        source_no_build.run(timeout=0.05)
+
+    factory.wait_for_removals()
+    assert container.removed
+    assert factory.get_container(source_no_build) is not container
+
+
+def test_run_rebuilds_sources_when_shared_container_is_removed(
+    factory, test_info_string_with_build, no_io, hanging_exec
+):
+    factory.shared = True
+    hanging_exec["kill_exit_code"] = 127
+    hanging_exec["hang"] = False
+    sources = [
+        Source(
+            filename=f"name{n}.go",
+            language="go",
+            path=os.path.join("this", "is", "a", "path"),
+            test_info=test_info_string_with_build,
+            project_type="someproject",
+        )
+        for n in range(2)
+    ]
+    for source in sources:
+        source.build()
+
+    hanging_exec["hang"] = True
+    with pytest.raises(TimeoutError):
+        sources[0].run(timeout=0.05)
+
+    hanging_exec["hang"] = False
+    for source in sources:
+        assert source.run() == "executed"
+
+    container = factory.get_container(sources[0])
+    assert [exec.cmd for exec in container.execs if "go build" in exec.cmd] == [
+        f"{source.get_build_command()}" for source in sources
+    ]
+    factory.close()
+
+
+def test_run_uses_timeout_from_test_info(
+    factory, test_info_string_no_build, no_io, hanging_exec, monkeypatch
+):
+    monkeypatch.setenv(EXEC_TIMEOUT_ENV_VAR, "0")
+    src = Source(
+        filename="name",
+        language="python",
+        path=os.path.join("this", "is", "a", "path"),
+        test_info=test_info_string_no_build + "  timeout: 0.05\n",
+        project_type="someproject",
+    )
+    with pytest.raises(TimeoutError, match=r"timed out after 0\.05 seconds"):
+        src.run()
+
+
+def test_run_without_timeout_does_not_use_thread(factory, source_no_build, no_io, monkeypatch):
+    monkeypatch.setenv(EXEC_TIMEOUT_ENV_VAR, "0")
+    monkeypatch.setattr(
+        "glotter.source.call_in_thread", lambda *args, **kwargs: pytest.fail("thread was used")
+    )
+    assert source_no_build.run() == "executed"
+
+
 def test_build_does_nothing_when_build_is_empty(test_info_string_no_build, monkeypatch):
     monkeypatch.setattr(
         "glotter.containerfactory.ContainerFactory.get_container",
@@ -117,6 +373,15 @@ def test_run_execs_run_command_with_params(factory, source_no_build, no_io):
     assert actual["workdir"] == "/src"
 
 
+def test_run_execs_in_shared_source_dir(factory, source_no_build, no_io):
+    factory.shared = True
+    source_no_build.run()
+    container = factory.get_container(source_no_build)
+    actual = container.execs[-1]
+    assert actual["workdir"] == factory.get_source_dir(source_no_build)
+    assert actual["workdir"].startswith("/glotter-src/")
+
+
 def test_run_on_non_zero_exit_code_from_exec_raises_no_error(source_no_build, monkeypatch, no_io):
     monkeypatch.setattr(
         "glotter.source.Source._container_exec",
@@ -144,9 +409,126 @@ def test_exec_on_non_zero_exit_code_raises_no_error(source_no_build, monkeypatch
     source_no_build.exec(exec_cmd)
 
 
+def test_prefetch_does_nothing_when_single_exec_disabled(factory, source_no_build, no_io):
+    source_no_build.prefetch(["1", "2"])
+    container = factory.get_container(source_no_build)
+    assert not container.execs
+
+
+def test_prefetch_runs_all_params_in_single_exec(
+    factory, source_no_build, no_io, single_exec, monkeypatch
+):
+    run_cmd = source_no_build.test_info.container_info.cmd
+    mock_driver_exec(monkeypatch, {f"{run_cmd} 1": b"one", f"{run_cmd} ": b"none"})
+    source_no_build.prefetch(["1", None, "1"])
+    container = factory.get_container(source_no_build)
+    assert len(container.execs) == 1
+
+    assert source_no_build.run(params="1") == "one"
+    assert source_no_build.run() == "none"
+    assert source_no_build.run(params="1") == "one"
+    assert len(container.execs) == 1
+
+    assert source_no_build.run(params="1") == "executed"
+    assert len(container.execs) == 2
+
+
+@pytest.mark.parametrize(
+    ("exec_timeout", "timeouts", "expected_driver_timeout"),
+    [
+        pytest.param("2", None, 4.0, id="default"),
+        pytest.param("2", [1, None], 3.0, id="per-input"),
+        pytest.param("0", [1, None], None, id="no-default"),
+    ],
+)
+def test_prefetch_runs_single_exec_with_total_timeout(
+    exec_timeout,
+    timeouts,
+    expected_driver_timeout,
+    factory,
+    source_no_build,
+    no_io,
+    single_exec,
+    monkeypatch,
+):
+    monkeypatch.setenv(EXEC_TIMEOUT_ENV_VAR, exec_timeout)
+    run_cmd = source_no_build.test_info.container_info.cmd
+    driver_timeouts = mock_driver_exec(
+        monkeypatch, {f"{run_cmd} 1": b"one", f"{run_cmd} 2": b"two"}
+    )
+    source_no_build.prefetch(["1", "2"], timeouts)
+    assert driver_timeouts == [expected_driver_timeout]
+
+
+def test_run_raises_timeout_for_slow_prefetched_input(
+    factory, source_no_build, no_io, single_exec, monkeypatch
+):
+    run_cmd = source_no_build.test_info.container_info.cmd
+    mock_driver_exec(
+        monkeypatch,
+        {f"{run_cmd} 1": b"one", f"{run_cmd} 2": b"two"},
+        durations={f"{run_cmd} 1": 3, f"{run_cmd} 2": 1},
+    )
+    source_no_build.prefetch(["1", "2", "2"], [2, 2, 0.5])
+    with pytest.raises(TimeoutError, match=f'"{run_cmd} 1" timed out after 2 seconds'):
+        source_no_build.run(params="1", timeout=2)
+
+    assert source_no_build.run(params="2", timeout=2) == "two"
+    with pytest.raises(TimeoutError):
+        source_no_build.run(params="2", timeout=0.5)
+
+
+def test_prefetch_falls_back_when_output_invalid(factory, source_no_build, no_io, single_exec):
+    source_no_build.prefetch(["1"])
+    assert source_no_build.run(params="1") == "executed"
+    container = factory.get_container(source_no_build)
+    assert len(container.execs) == 2
+
+
+def test_prefetch_falls_back_when_single_exec_times_out(
+    factory, source_no_build, no_io, single_exec, hanging_exec, monkeypatch
+):
+    monkeypatch.setenv(EXEC_TIMEOUT_ENV_VAR, "0.05")
+    source_no_build.prefetch(["1"])
+    assert [record.command for record in pop_records()] == ["single exec of 1 inputs"]
+
+    assert source_no_build.run(params="1") == "executed"
+
+
+def test_prefetch_falls_back_when_single_exec_fails(
+    factory, source_no_build, no_io, single_exec, monkeypatch
+):
+    run_cmd = source_no_build.test_info.container_info.cmd
+    mock_driver_exec(monkeypatch, {f"{run_cmd} 1": b"one"})
+    source_no_build.prefetch(["1"])
+
+    exec_run = Container.exec_run
+
+    def mock_exec_run(self, cmd, **kwargs):
+        if cmd[:1] == ["driver"]:
+            raise docker.errors.APIError("container is not running")
+
+        return exec_run(self, cmd, **kwargs)
+
+    monkeypatch.setattr(Container, "exec_run", mock_exec_run)
+    source_no_build.prefetch(["1"])
+    assert source_no_build.run(params="1") == "executed"
+
+
+def test_cleanup_discards_prefetched_results(
+    factory, source_no_build, no_io, single_exec, monkeypatch
+):
+    run_cmd = source_no_build.test_info.container_info.cmd
+    mock_driver_exec(monkeypatch, {f"{run_cmd} 1": b"one"})
+    source_no_build.prefetch(["1"])
+    source_no_build.cleanup()
+    assert source_no_build.run(params="1") == "executed"
+
+
 def test_cleanup(factory, source_no_build, no_io):
     container = factory.get_container(source_no_build)
     source_no_build.cleanup()
+    factory.wait_for_removals()
     assert container.removed
 
 
@@ -281,8 +663,121 @@ def test_filter_project_and_language_not_found(mock_sources, capsys):
     )
 
 
+@pytest.mark.parametrize(
+    ("options", "project_type", "indices"),
+    [
+        pytest.param({}, "quine", [0, 1, 2], id="no-filter"),
+        pytest.param({"language": "BAR"}, "quine", [0], id="language"),
+        pytest.param({"language": {"bar", "cool"}}, "quine", [0, 2], id="languages"),
+        pytest.param({"project": "quine"}, "quine", [0, 1, 2], id="project"),
+        pytest.param({"project": "baklava"}, "quine", [], id="other-project"),
+        pytest.param({"source": "Quine.cl"}, "quine", [2], id="source"),
+        pytest.param({"language": "bar"}, "bogus", [], id="unknown-project"),
+    ],
+)
+def test_get_project_sources(options, project_type, indices, mock_sources, monkeypatch):
+    monkeypatch.setattr("glotter.source.get_sources", lambda *_: mock_sources)
+    set_source_filter(MockArgs(**options))
+    assert get_project_sources(project_type) == [
+        mock_sources[project_type][index] for index in indices
+    ]
+
+
+def test_get_project_sources_with_selected_sources(mock_sources, cache_dir, monkeypatch):
+    monkeypatch.setattr("glotter.source.get_sources", lambda *_: mock_sources)
+    set_source_filter(MockArgs(), {"quine": [mock_sources["quine"][1]]})
+    assert get_project_sources("quine") == [mock_sources["quine"][1]]
+    assert get_project_sources("baklava") == []
+
+
+def test_set_source_filter_stores_paths_in_file(test_info_string_no_build, cache_dir):
+    sources = [
+        Source(
+            filename=f"{'x' * 200}{n}.py",
+            language="python",
+            path=os.path.join("this", "is", "a", "path"),
+            test_info=test_info_string_no_build,
+            project_type="someproject",
+        )
+        for n in range(1000)
+    ]
+    set_source_filter(MockArgs(), {"someproject": sources})
+
+    # The environment variable stays small no matter how many sources are selected
+    assert len(os.environ[SOURCE_FILTER_ENV_VAR]) < 1000
+    assert get_source_filter().paths == {source.full_path for source in sources}
+
+
+def test_set_source_filter_clears_filter(monkeypatch):
+    monkeypatch.setenv(SOURCE_FILTER_ENV_VAR, '{"language": "bar"}')
+    set_source_filter(MockArgs())
+    assert get_source_filter() is None
+
+
+def mock_driver_exec(monkeypatch, outputs, durations=None):
+    durations = durations or {}
+    driver_timeouts = []
+
+    def get_driver_command(commands):
+        return ["driver"] + commands, "MARKER"
+
+    orig_container_exec = Source._container_exec
+
+    def container_exec(self, command, timeout=None, *args, **kwargs):
+        result = orig_container_exec(self, command, timeout, *args, **kwargs)
+        if command[:1] != ["driver"]:
+            return result
+
+        driver_timeouts.append(timeout)
+        return 0, b"".join(
+            b"MARKER 0 %d 10.00 %.2f\n%s"
+            % (len(outputs[cmd]), 10 + durations.get(cmd, 0), outputs[cmd])
+            for cmd in command[1:]
+        )
+
+    monkeypatch.setattr("glotter.source.get_driver_command", get_driver_command)
+    monkeypatch.setattr("glotter.source.Source._container_exec", container_exec)
+    return driver_timeouts
+
+
+@pytest.fixture
+def single_exec(monkeypatch):
+    monkeypatch.setenv(SINGLE_EXEC_ENV_VAR, "1")
+
+
 class MockArgs:
     def __init__(self, project="", language="", source=""):
         self.project = project
         self.language = language
         self.source = source
+
+
+@pytest.fixture
+def hanging_exec(monkeypatch):
+    """
+    Make execs hang until their processes are killed. The exit code of the kill command can be
+    changed with the "kill_exit_code" item, and hanging can be turned off with the "hang" item.
+    Execs no longer hang once they have been killed
+    """
+
+    state = {"kill_exit_code": 0, "hang": True}
+    killed = threading.Event()
+    exec_run = Container.exec_run
+
+    def mock_exec_run(self, cmd, **kwargs):
+        if cmd[:3] == ["sh", "-c", KILL_EXECS_SCRIPT]:
+            self.execs.append(ContainerExec(cmd, kwargs))
+            if state["kill_exit_code"] == 0:
+                killed.set()
+
+            return state["kill_exit_code"], b""
+
+        if state["hang"] and not killed.is_set():
+            self.execs.append(ContainerExec(cmd, kwargs))
+            killed.wait(1)
+            return 137, b""
+
+        return exec_run(self, cmd, **kwargs)
+
+    monkeypatch.setattr(Container, "exec_run", mock_exec_run)
+    return state
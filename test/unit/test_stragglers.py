@@ -0,0 +1,119 @@
+from types import SimpleNamespace
+
+import pytest
+from _pytest.reports import TestReport
+
+from glotter.stragglers import (
+    REPORT_ATTRIBUTE,
+    ExecRecord,
+    StragglerPlugin,
+    get_straggler_report,
+    pop_records,
+    record_exec,
+)
+
+RECORDS = [
+    ExecRecord("python/fast.py", "python fast.py", 0.25),
+    ExecRecord("go/slow.go", "go run slow.go", 30.0, timed_out=True),
+    ExecRecord("c/medium.c", "./medium", 2.5),
+]
+
+
+def test_pop_records_clears_records():
+    record_exec(RECORDS[0])
+    record_exec(RECORDS[1])
+    assert pop_records() == RECORDS[:2]
+    assert pop_records() == []
+
+
+@pytest.mark.parametrize(
+    ("records", "count", "expected_lines"),
+    [
+        pytest.param([], 10, [], id="no-records"),
+        pytest.param(
+            RECORDS,
+            10,
+            [
+                "Slowest 3 execs:",
+                "     30.00s  go/slow.go  go run slow.go",
+                "      2.50s  c/medium.c  ./medium",
+                "      0.25s  python/fast.py  python fast.py",
+                "Killed 1 execs that timed out:",
+                "     30.00s  go/slow.go  go run slow.go",
+            ],
+            id="all",
+        ),
+        pytest.param(
+            RECORDS[::2],
+            1,
+            ["Slowest 1 execs:", "      2.50s  c/medium.c  ./medium"],
+            id="count",
+        ),
+    ],
+)
+def test_get_straggler_report(records, count, expected_lines):
+    assert get_straggler_report(records, count) == expected_lines
+
+
+def test_straggler_plugin_reports_execs_of_reports():
+    worker_plugin = StragglerPlugin()
+    report = make_report()
+    record_exec(RECORDS[1])
+    run_makereport(worker_plugin, report)
+    assert not pop_records()
+
+    # Reports are serialized to send them from a pytest-xdist worker to the controller
+    controller_plugin = StragglerPlugin()
+    controller_plugin.pytest_runtest_logreport(TestReport._from_json(report._to_json()))
+    controller_plugin.pytest_runtest_logreport(make_report())
+
+    terminalreporter = MockTerminalReporter()
+    controller_plugin.pytest_terminal_summary(terminalreporter)
+    assert terminalreporter.lines == [
+        "== glotter stragglers ==",
+        "Slowest 1 execs:",
+        "     30.00s  go/slow.go  go run slow.go",
+        "Killed 1 execs that timed out:",
+        "     30.00s  go/slow.go  go run slow.go",
+    ]
+
+
+def test_straggler_plugin_does_not_report_without_execs():
+    plugin = StragglerPlugin()
+    report = make_report()
+    run_makereport(plugin, report)
+    plugin.pytest_runtest_logreport(report)
+    assert not hasattr(report, REPORT_ATTRIBUTE)
+
+    terminalreporter = MockTerminalReporter()
+    plugin.pytest_terminal_summary(terminalreporter)
+    assert terminalreporter.lines == []
+
+
+class MockTerminalReporter:
+    def __init__(self):
+        self.lines = []
+
+    def section(self, title):
+        self.lines.append(f"== {title} ==")
+
+    def write_line(self, line):
+        self.lines.append(line)
+
+
+def make_report():
+    return TestReport(
+        nodeid="test/generated/test_slow.py::test_slow[go/slow.go]",
+        location=("test/generated/test_slow.py", 0, "test_slow[go/slow.go]"),
+        keywords={},
+        outcome="passed",
+        longrepr=None,
+        when="call",
+    )
+
+
+def run_makereport(plugin, report):
+    wrapper = plugin.pytest_runtest_makereport(item=None, call=None)
+    next(wrapper)
+    with pytest.raises(StopIteration):
+        wrapper.send(SimpleNamespace(get_result=lambda: report))
@@ -1,6 +1,12 @@
+import argparse
+from unittest.mock import patch
+
 import pytest
 
-from glotter.test import _get_tests
+from glotter.build_cache import get_build_cache
+from glotter.project import Project
+from glotter.test import _get_selected_tests, _get_tests
+from glotter.test import test as glotter_test
 
 list_of_tests = [
     "test/projects/test_even_odd.py::test_even_odd_invalid[even-odd.c-no input]",
@@ -59,3 +65,291 @@ def test_get_tests_with_multiple_test_functions(test_functions, monkeypatch):
         for f in test_functions:
             if f in t:
                 assert t in actual
+
+
+def test_get_selected_tests(mock_sources, monkeypatch):
+    projects = {
+        "baklava": Project(
+            words=["baklava"],
+            tests={"baklava": {"params": [{"expected": "baklava"}]}},
+            repeat={"baklava": 2},
+        ),
+        "quine": Project(
+            words=["quine"],
+            requires_parameters=True,
+            tests={
+                "quine": {
+                    "params": [
+                        {"name": "first", "input": "1", "expected": "1"},
+                        {"name": "second", "input": "2", "expected": "2"},
+                    ]
+                }
+            },
+        ),
+        "fileinputoutput": Project(words=["file", "input", "output"]),
+    }
+    monkeypatch.setattr("glotter.settings.Settings.projects", projects)
+    collected = [
+        "test/projects/test_file_io.py::test_file_io[bart/file-input-output.b]",
+        "test/projects/test_file_io.py::test_file_io[cool/file-input-output.cl]",
+    ]
+    monkeypatch.setattr(
+        "glotter.settings.Settings.get_test_mapping_name", lambda *args: ["test_file_io"]
+    )
+    with patch("glotter.test._collect_tests", return_value=collected) as mock_collect_tests:
+        actual = _get_selected_tests(
+            {
+                "quine": mock_sources["quine"][:1],
+                "baklava": mock_sources["baklava"],
+                "fileinputoutput": mock_sources["fileinputoutput"],
+            }
+        )
+
+    mock_collect_tests.assert_called_once_with()
+    assert actual == [
+        "test/generated/test_quine.py",
+        "test/generated/test_baklava.py",
+        "test/projects/test_file_io.py::test_file_io[bart/file-input-output.b]",
+    ]
+
+
+def test_get_selected_tests_without_collection(mock_sources, monkeypatch):
+    projects = {
+        "baklava": Project(words=["baklava"], tests={"baklava": {"params": [{"expected": "x"}]}})
+    }
+    monkeypatch.setattr("glotter.settings.Settings.projects", projects)
+    with patch("glotter.test._collect_tests") as mock_collect_tests:
+        actual = _get_selected_tests({"baklava": mock_sources["baklava"]})
+
+    mock_collect_tests.assert_not_called()
+    assert actual == ["test/generated/test_baklava.py"]
+
+
+@pytest.mark.parametrize(
+    ("options", "expected_error"),
+    [
+        pytest.param({"pool_size": -1}, "Pool size must be at least 0", id="pool-size"),
+        pytest.param({"concurrency": 0}, "Concurrency must be at least 1", id="concurrency"),
+        pytest.param({"exec_timeout": -1}, "Exec timeout must be at least 0", id="exec-timeout"),
+        pytest.param(
+            {"json_report": "report.json"},
+            "--json-report requires --engine native",
+            id="json-report",
+        ),
+    ],
+)
+def test_test_with_invalid_options(options, expected_error, capsys):
+    with pytest.raises(SystemExit) as e:
+        glotter_test(make_test_args(**options))
+
+    assert e.value.code != 0
+    assert expected_error in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    ("options", "expected_concurrency"),
+    [
+        pytest.param({}, 1, id="serial"),
+        pytest.param({"parallel": True}, 8, id="parallel"),
+        pytest.param({"parallel": True, "concurrency": 3}, 3, id="concurrency"),
+    ],
+)
+def test_test_with_native_engine(options, expected_concurrency, factory, monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 8)
+    with (
+        patch("glotter.test.get_sources") as mock_get_sources,
+        patch("glotter.test.get_settings"),
+        patch("glotter.test.run_native_tests") as mock_run_native_tests,
+        patch("glotter.test.generate_tests") as mock_generate_tests,
+    ):
+        mock_run_native_tests.return_value = 3
+        with pytest.raises(SystemExit) as e:
+            glotter_test(make_test_args(engine="native", junit_xml="results.xml", **options))
+
+    assert e.value.code == 3
+    mock_generate_tests.assert_not_called()
+    mock_run_native_tests.assert_called_once_with(
+        mock_get_sources.return_value,
+        concurrency=expected_concurrency,
+        junit_xml="results.xml",
+        json_report=None,
+        history_path=None,
+    )
+
+
+def test_test_with_no_changed_sources(factory, capsys):
+    with (
+        patch("glotter.test.get_sources"),
+        patch("glotter.test.get_settings"),
+        patch("glotter.test.filter_sources"),
+        patch("glotter.test.get_changed_sources", return_value={}),
+        patch("glotter.test.generate_tests") as mock_generate_tests,
+    ):
+        with pytest.raises(SystemExit) as e:
+            glotter_test(make_test_args(changed_since="main"))
+
+    assert e.value.code == 0
+    assert "No sources are affected by changes since main" in capsys.readouterr().out
+    mock_generate_tests.assert_not_called()
+
+
+def test_test_with_changed_sources(factory, mock_sources):
+    sources_by_type = {"quine": mock_sources["quine"][:1]}
+    with (
+        patch("glotter.test.get_sources"),
+        patch("glotter.test.get_settings"),
+        patch("glotter.test.filter_sources"),
+        patch("glotter.test.get_changed_sources", return_value=sources_by_type),
+        patch("glotter.test.generate_tests"),
+        patch("glotter.test._get_selected_tests", return_value=["test_quine.py"]) as mock_get,
+        patch("glotter.test.pytest.main", return_value=0) as mock_main,
+    ):
+        with pytest.raises(SystemExit):
+            glotter_test(make_test_args(changed_since="main"))
+
+    mock_get.assert_called_once_with(sources_by_type)
+    mock_main.assert_called_once_with(
+        args=["-v", "-p", "glotter.stragglers", "-p", "glotter.container_cleanup", "test_quine.py"]
+    )
+
+
+@pytest.mark.parametrize("all_affected", [False, True])
+def test_test_selects_only_affected_sources(all_affected, factory, mock_sources):
+    all_sources_by_type = {"quine": mock_sources["quine"]}
+    sources_by_type = all_sources_by_type if all_affected else {"quine": mock_sources["quine"][:1]}
+    with (
+        patch("glotter.test.get_sources"),
+        patch("glotter.test.get_settings"),
+        patch("glotter.test.filter_sources", return_value=all_sources_by_type),
+        patch("glotter.test.get_changed_sources", return_value=sources_by_type),
+        patch("glotter.test.set_source_filter") as mock_set_source_filter,
+        patch("glotter.test.run_native_tests", return_value=0),
+    ):
+        args = make_test_args(changed_since="main", engine="native")
+        with pytest.raises(SystemExit):
+            glotter_test(args)
+
+    mock_set_source_filter.assert_called_once_with(args, None if all_affected else sources_by_type)
+
+
+@pytest.mark.parametrize(
+    ("parallel", "expected_args"),
+    [
+        pytest.param(
+            False,
+            ["-v", "-p", "glotter.stragglers", "-p", "glotter.container_cleanup", "test_quine.py"],
+            id="serial",
+        ),
+        pytest.param(
+            True,
+            [
+                "-v",
+                "-n",
+                "auto",
+                "-p",
+                "glotter.xdist_scheduling",
+                "-p",
+                "glotter.stragglers",
+                "-p",
+                "glotter.container_cleanup",
+                "test_quine.py",
+            ],
+            id="parallel",
+        ),
+    ],
+)
+def test_test_with_parallel(parallel, expected_args, factory, mock_sources):
+    sources_by_type = {"quine": mock_sources["quine"][:1]}
+    with (
+        patch("glotter.test.get_sources"),
+        patch("glotter.test.get_settings"),
+        patch("glotter.test.filter_sources"),
+        patch("glotter.test.get_changed_sources", return_value=sources_by_type),
+        patch("glotter.test.generate_tests"),
+        patch("glotter.test._get_selected_tests", return_value=["test_quine.py"]),
+        patch("glotter.test.pytest.main", return_value=0) as mock_main,
+    ):
+        with pytest.raises(SystemExit):
+            glotter_test(make_test_args(changed_since="main", parallel=parallel))
+
+    mock_main.assert_called_once_with(args=expected_args)
+
+
+def test_test_with_disk_budget(factory, mock_sources):
+    sources_by_type = {"quine": mock_sources["quine"][:1]}
+    with (
+        patch("glotter.test.get_sources"),
+        patch("glotter.test.get_settings"),
+        patch("glotter.test.filter_sources"),
+        patch("glotter.test.get_changed_sources", return_value=sources_by_type),
+        patch("glotter.test.generate_tests"),
+        patch("glotter.test._get_selected_tests", return_value=["test_quine.py"]),
+        patch("glotter.test.pytest.main", return_value=0) as mock_main,
+    ):
+        with pytest.raises(SystemExit):
+            glotter_test(make_test_args(changed_since="main", disk_budget=1024))
+
+    mock_main.assert_called_once_with(
+        args=[
+            "-v",
+            "-p",
+            "glotter.stragglers",
+            "-p",
+            "glotter.container_cleanup",
+            "-p",
+            "glotter.pending_images",
+            "test_quine.py",
+        ]
+    )
+
+
+@pytest.mark.parametrize("batch_build", [False, True])
+def test_test_with_batch_build(batch_build, factory, mock_sources):
+    sources_by_type = {"quine": mock_sources["quine"], "baklava": mock_sources["baklava"]}
+    with (
+        patch("glotter.test.get_sources"),
+        patch("glotter.test.get_settings"),
+        patch("glotter.test.filter_sources"),
+        patch("glotter.test.get_changed_sources", return_value=sources_by_type),
+        patch("glotter.test.build_sources") as mock_build_sources,
+        patch("glotter.test.run_native_tests", return_value=0),
+    ):
+        with pytest.raises(SystemExit):
+            glotter_test(
+                make_test_args(changed_since="main", engine="native", batch_build=batch_build)
+            )
+
+    assert get_build_cache().enabled == batch_build
+    if batch_build:
+        expected_sources_by_language = {}
+        for sources in sources_by_type.values():
+            for source in sources:
+                expected_sources_by_language.setdefault(source.language, []).append(source)
+
+        mock_build_sources.assert_called_once_with(expected_sources_by_language)
+    else:
+        mock_build_sources.assert_not_called()
+
+
+def make_test_args(**kwargs):
+    args = {
+        "source": None,
+        "project": None,
+        "language": None,
+        "parallel": False,
+        "changed_since": None,
+        "pool_size": 0,
+        "shared_containers": False,
+        "build_cache": False,
+        "batch_build": False,
+        "single_exec": False,
+        "incremental": False,
+        "disk_budget": None,
+        "exec_timeout": None,
+        "engine": "pytest",
+        "concurrency": None,
+        "junit_xml": None,
+        "json_report": None,
+        "history": None,
+    }
+    return argparse.Namespace(**{**args, **kwargs})
@@ -4,6 +4,7 @@ from unittest.mock import patch
 import pytest
 
 from glotter.project import Project
+from glotter.source import Source
 from glotter.test_generator import AUTO_GEN_TEST_PATH, TestGenerator, generate_tests
 
 NO_TESTS_PROJECT = {"words": ["no", "tests"]}
@@ -128,6 +129,13 @@ def test_test_generator_with_tests(value):
     assert test_code == expected_test_code
 
 
+def test_test_generator_with_timeouts():
+    project = Project(**{**PRIME_NUMBER_PROJECT, "timeout": 2})
+    test_code = TestGenerator("primenumber", project).generate_tests()
+    assert "RUN_TIMEOUTS = [2.0, 2.0, 2.0, 2.0, 2.0, 2.0, 2.0]\n" in test_code
+    assert "request.param.prefetch(RUN_PARAMS, RUN_TIMEOUTS)\n" in test_code
+
+
 def test_generate_tests(mock_settings, temp_dir_chdir):
     generate_tests()
 
@@ -147,6 +155,39 @@ def test_generate_tests(mock_settings, temp_dir_chdir):
         assert contents == expected_contents, f"{filename} contents do not match"
 
 
+@pytest.mark.parametrize(
+    ("value", "test_name", "pytest_id", "expected_node_id"),
+    [
+        pytest.param(
+            HELLO_WORLD_PROJECT,
+            "hello_world",
+            "",
+            "test/generated/test_hello_world.py::test_hello_world[python/hello_world.py]",
+            id="no-pytest-id",
+        ),
+        pytest.param(
+            ROT13_PROJECT,
+            "rot13_invalid",
+            "repeat2-no input",
+            "test/generated/test_rot13.py::test_rot13_invalid[python/hello_world.py-repeat2-no input]",
+            id="pytest-id",
+        ),
+    ],
+)
+def test_get_node_id(value, test_name, pytest_id, expected_node_id, test_info_string_no_build):
+    project = Project(**value)
+    test_gen = TestGenerator("".join(project.words), project)
+    source = Source(
+        filename="hello_world.py",
+        language="python",
+        path="python",
+        test_info=test_info_string_no_build,
+        project_type="helloworld",
+    )
+    node_id = test_gen.get_node_id(project.tests[test_name], source, pytest_id)
+    assert node_id == expected_node_id
+
+
 @pytest.fixture()
 def mock_settings():
     with patch("glotter.test_generator.get_settings") as mock:
@@ -1,3 +1,9 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
 import pytest
 
 from glotter import utils
@@ -70,3 +76,114 @@ def test_quote(value, expected_value):
 )
 def test_indent(value, num_spaces, expected_value):
     assert utils.indent(value, num_spaces) == expected_value
+
+
+@pytest.mark.parametrize(
+    ("value", "expected_value"),
+    [
+        pytest.param("1024", 1024, id="bytes"),
+        pytest.param("10B", 10, id="bytes-suffix"),
+        pytest.param("2k", 2048, id="kilobytes"),
+        pytest.param("1.5M", 1536 * 1024, id="fractional-megabytes"),
+        pytest.param("30G", 30 * 1024**3, id="gigabytes"),
+        pytest.param("512MiB", 512 * 1024**2, id="mebibytes"),
+        pytest.param("1 TB", 1024**4, id="space"),
+    ],
+)
+def test_parse_size(value, expected_value):
+    assert utils.parse_size(value) == expected_value
+
+
+@pytest.mark.parametrize("value", ["", "G", "-1G", "10X", "1.2.3"])
+def test_parse_size_invalid(value):
+    with pytest.raises(ValueError):
+        utils.parse_size(value)
+
+
+def test_get_temp_file_pid():
+    prefix = utils.get_temp_file_prefix()
+    assert utils.get_temp_file_pid(f"{prefix}abc.tmp") == os.getpid()
+    assert utils.get_temp_file_pid("abc.tmp") is None
+
+
+@pytest.mark.skipif(os.name == "nt", reason="processes are assumed to be running on Windows")
+def test_is_process_running():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    assert utils.is_process_running(os.getpid())
+    assert not utils.is_process_running(process.pid)
+
+
+@pytest.mark.parametrize(("mode", "contents"), [("w", "héllo"), ("wb", b"\x00\x01")])
+def test_atomic_write(mode, contents, tmp_path):
+    path = tmp_path / "dir" / "file"
+    with utils.atomic_write(str(path), mode) as f:
+        f.write(contents)
+        assert not path.exists()
+        [tmp_filename] = os.listdir(tmp_path / "dir")
+        assert tmp_filename.startswith(utils.get_temp_file_prefix())
+
+    assert (path.read_bytes() if "b" in mode else path.read_text(encoding="utf-8")) == contents
+    assert os.listdir(tmp_path / "dir") == ["file"]
+
+
+def test_atomic_write_keeps_file_on_error(tmp_path):
+    path = tmp_path / "file"
+    path.write_text("old", encoding="utf-8")
+    with pytest.raises(RuntimeError), utils.atomic_write(str(path)) as f:
+        f.write("new")
+        raise RuntimeError("failed")
+
+    assert path.read_text(encoding="utf-8") == "old"
+    assert os.listdir(tmp_path) == ["file"]
+
+
+def test_file_lock_creates_lock_file(tmp_path):
+    path = tmp_path / "locks" / "image.lock"
+    with utils.file_lock(str(path)):
+        assert path.exists()
+
+
+def test_file_lock_is_exclusive_between_threads(tmp_path):
+    path = str(tmp_path / "image.lock")
+    events = []
+    waits = []
+
+    def worker(name):
+        with utils.file_lock(path, on_wait=lambda: waits.append(name)):
+            events.append(f"start {name}")
+            time.sleep(0.05)
+            events.append(f"end {name}")
+
+    threads = [threading.Thread(target=worker, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert events in (
+        ["start a", "end a", "start b", "end b"],
+        ["start b", "end b", "start a", "end a"],
+    )
+    assert len(waits) == 1
+
+
+def test_file_lock_waits_for_other_process(tmp_path):
+    path = str(tmp_path / "image.lock")
+    code = (
+        "import sys, time\n"
+        "from glotter.utils import file_lock\n"
+        "with file_lock(sys.argv[1]):\n"
+        "    print('locked', flush=True)\n"
+        "    time.sleep(0.3)\n"
+    )
+    with subprocess.Popen(
+        [sys.executable, "-c", code, path], stdout=subprocess.PIPE, text=True
+    ) as process:
+        assert process.stdout.readline().strip() == "locked"
+        waits = []
+        with utils.file_lock(path, on_wait=lambda: waits.append(process.poll())):
+            assert process.wait(timeout=5) == 0
+
+    assert waits == [None]
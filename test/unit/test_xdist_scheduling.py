@@ -0,0 +1,195 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from glotter.xdist_scheduling import ImageAffinityScheduling, get_source_images
+
+IMAGES = {
+    "python/hello-world.py": "python:3.7-alpine",
+    "python/fizz-buzz.py": "python:3.7-alpine",
+    "go/hello-world.go": "golang:1.12-alpine",
+    "go/fizz-buzz.go": "golang:1.12-alpine",
+    "c/hello-world.c": "gcc:12",
+}
+
+
+class MockNode:
+    def __init__(self, name):
+        self.name = name
+        self.gateway = SimpleNamespace(id=name)
+        self.sent = []
+        self.shutting_down = False
+
+    def send_runtest_some(self, indices):
+        self.sent += indices
+
+    def shutdown(self):
+        self.shutting_down = True
+
+    def __repr__(self):
+        return f"MockNode({self.name})"
+
+
+@pytest.mark.parametrize(
+    ("nodeid", "expected_scope", "expected_image"),
+    [
+        pytest.param(
+            "test/generated/test_fizz_buzz.py::test_fizz_buzz[python/fizz-buzz.py-sample input: 1]",
+            "test/generated/test_fizz_buzz.py::[python/fizz-buzz.py]",
+            "python:3.7-alpine",
+            id="with-params",
+        ),
+        pytest.param(
+            "test/generated/test_hello_world.py::test_hello_world[go/hello-world.go]",
+            "test/generated/test_hello_world.py::[go/hello-world.go]",
+            "golang:1.12-alpine",
+            id="without-params",
+        ),
+        pytest.param(
+            "test/projects/test_file_io.py::test_file_io[c/hello-world.c-no-input]",
+            "test/projects/test_file_io.py::[c/hello-world.c]",
+            "gcc:12",
+            id="params-with-hyphens",
+        ),
+        pytest.param(
+            "test/generated/test_quine.py::test_quine[bash/quine.sh]",
+            "test/generated/test_quine.py",
+            None,
+            id="unknown-source",
+        ),
+        pytest.param("test/test_other.py::test_other", "test/test_other.py", None, id="no-source"),
+    ],
+)
+def test_split_scope(nodeid, expected_scope, expected_image):
+    scheduler = make_scheduler()
+    assert scheduler._split_scope(nodeid) == expected_scope
+    assert scheduler._scope_images[expected_scope] == expected_image
+
+
+def test_schedule_gives_heaviest_images_to_different_nodes():
+    scheduler, nodes, collection = start_scheduler(
+        {
+            "go/hello-world.go": 3,
+            "go/fizz-buzz.go": 3,
+            "python/hello-world.py": 4,
+            "c/hello-world.c": 1,
+        },
+        num_nodes=2,
+    )
+
+    assert get_sent_images(scheduler, nodes[0], collection) == {"golang:1.12-alpine"}
+    assert get_sent_images(scheduler, nodes[1], collection) == {"python:3.7-alpine"}
+
+
+def test_schedule_keeps_nodes_on_their_images():
+    scheduler, nodes, collection = start_scheduler(
+        {
+            "go/hello-world.go": 3,
+            "go/fizz-buzz.go": 3,
+            "python/hello-world.py": 3,
+            "python/fizz-buzz.py": 3,
+        },
+        num_nodes=2,
+    )
+
+    run_all(scheduler, nodes)
+
+    assert get_sent_images(scheduler, nodes[0], collection) == {"golang:1.12-alpine"}
+    assert get_sent_images(scheduler, nodes[1], collection) == {"python:3.7-alpine"}
+    assert sorted(nodes[0].sent + nodes[1].sent) == list(range(len(collection)))
+    assert scheduler.tests_finished
+
+
+def test_schedule_moves_finished_node_to_unused_image():
+    scheduler, nodes, collection = start_scheduler(
+        {
+            "go/hello-world.go": 4,
+            "go/fizz-buzz.go": 4,
+            "python/hello-world.py": 3,
+            "c/hello-world.c": 3,
+        },
+        num_nodes=2,
+    )
+
+    run_all(scheduler, nodes)
+
+    assert get_sent_images(scheduler, nodes[0], collection) == {"golang:1.12-alpine"}
+    assert get_sent_images(scheduler, nodes[1], collection) == {"python:3.7-alpine", "gcc:12"}
+
+
+def test_schedule_shares_image_when_no_other_images_are_left():
+    scheduler, nodes, collection = start_scheduler(
+        {"go/hello-world.go": 3, "go/fizz-buzz.go": 3, "python/hello-world.py": 1},
+        num_nodes=2,
+    )
+
+    run_all(scheduler, nodes)
+
+    assert get_sent_images(scheduler, nodes[0], collection) == {"golang:1.12-alpine"}
+    assert get_sent_images(scheduler, nodes[1], collection) == {
+        "python:3.7-alpine",
+        "golang:1.12-alpine",
+    }
+
+
+def test_remove_node_reschedules_pending_tests():
+    scheduler, nodes, collection = start_scheduler(
+        {"go/hello-world.go": 3, "python/hello-world.py": 3, "python/fizz-buzz.py": 3},
+        num_nodes=2,
+    )
+
+    crashed_node_sent = list(nodes[1].sent)
+    assert scheduler.remove_node(nodes[1]) == collection[crashed_node_sent[0]]
+
+    run_all(scheduler, nodes[:1])
+    assert sorted(set(nodes[0].sent)) == list(range(len(collection)))
+    assert scheduler.tests_finished
+
+
+def test_get_source_images(mock_sources):
+    assert get_source_images(mock_sources) == {
+        "bar/baklava.b": "python:3.7-alpine",
+        "bart/baklava.b": "python:3.7-alpine",
+        "bart/file-input-output.b": "python:3.7-alpine",
+        "bar/quine.b": "python:3.7-alpine",
+        "bart/quine.b": "python:3.7-alpine",
+        "cool/Quine.cl": "python:3.7-alpine",
+    }
+
+
+def make_scheduler(num_nodes=1):
+    config = MagicMock()
+    config.getvalue.return_value = [f"{num_nodes}*popen"]
+    return ImageAffinityScheduling(config, images=IMAGES)
+
+
+def start_scheduler(num_tests_by_source, num_nodes):
+    collection = [
+        f"test/generated/test_project.py::test_project[{test_id}-input {n}]"
+        for test_id, num_tests in num_tests_by_source.items()
+        for n in range(num_tests)
+    ]
+    scheduler = make_scheduler(num_nodes)
+    nodes = [MockNode(str(n)) for n in range(num_nodes)]
+    for node in nodes:
+        scheduler.add_node(node)
+        scheduler.add_node_collection(node, collection)
+
+    scheduler.schedule()
+    return scheduler, nodes, collection
+
+
+def run_all(scheduler, nodes):
+    """Complete the tests sent to the nodes in turn until there are none left"""
+
+    completed = {node: 0 for node in nodes}
+    while any(completed[node] < len(node.sent) for node in nodes):
+        for node in nodes:
+            if completed[node] < len(node.sent):
+                scheduler.mark_test_complete(node, node.sent[completed[node]])
+                completed[node] += 1
+
+
+def get_sent_images(scheduler, node, collection):
+    return {scheduler._scope_images[scheduler._split_scope(collection[n])] for n in node.sent}